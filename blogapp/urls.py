@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.urls import path
 from .views import (
     ArticleListView,
     ArticleDetailView,
+    AsyncLatestArticlesFeed,
     LatestArticlesFeed
 )
 
@@ -11,5 +13,9 @@ urlpatterns = [
     path('', ArticleListView.as_view(), name='article-list'),
     path("articles/", ArticleListView.as_view(), name="articles"),
     path("articles/<int:pk>/", ArticleDetailView.as_view(), name="article"),
-    path("articles/latest/feed/", LatestArticlesFeed(), name="articles-feed"),
+    path(
+        "articles/latest/feed/",
+        AsyncLatestArticlesFeed() if settings.ASYNC_VIEWS else LatestArticlesFeed(),
+        name="articles-feed",
+    ),
 ]
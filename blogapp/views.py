@@ -1,6 +1,9 @@
 from django.contrib.syndication.views import Feed
 from django.views.generic import ListView, DetailView
 from django.urls import reverse, reverse_lazy
+
+from mysite.async_views import AsyncFeedMixin
+
 from .models import Article
 
 class ArticleListView(ListView):
@@ -41,3 +44,7 @@ class LatestArticlesFeed(Feed):
 
     def item_description(self, item: Article):
         return item.content[:200]
+
+
+class AsyncLatestArticlesFeed(AsyncFeedMixin, LatestArticlesFeed):
+    pass
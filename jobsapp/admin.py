@@ -0,0 +1,34 @@
+from django.contrib import admin
+from django.urls import reverse
+from django.utils.html import format_html
+
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = 'name', 'status', 'percent', 'created_by', 'created_at', 'finished_at'
+    list_filter = 'status', 'name'
+    # у файлов задач нет публичного URL: входной файл — именем,
+    # результат — ссылкой на job_result
+    readonly_fields = [
+        {'input_file': 'input_name', 'result_file': 'result_link'}.get(field.name, field.name)
+        for field in Job._meta.fields
+    ]
+    exclude = 'input_file', 'result_file'
+
+    def input_name(self, obj: Job) -> str:
+        return obj.input_file.name.rsplit('/', 1)[-1] if obj.input_file else '-'
+
+    input_name.short_description = 'Input file'
+
+    def result_link(self, obj: Job) -> str:
+        if not obj.result_file:
+            return '-'
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('jobsapp:job_result', kwargs={'pk': obj.pk}),
+            obj.result_file.name.rsplit('/', 1)[-1],
+        )
+
+    result_link.short_description = 'Result file'
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsappConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobsapp'
+
+    def ready(self):
+        # задачи регистрируются в модулях tasks.py приложений
+        autodiscover_modules('tasks')
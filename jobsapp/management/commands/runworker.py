@@ -0,0 +1,144 @@
+import os
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import timedelta
+
+import django
+from django.core.management import BaseCommand
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from jobsapp.models import Job
+from jobsapp.registry import claim_next_job, delete_input_file, run_job
+from mysite.db_router import pin_scope
+
+
+def init_worker_process():
+    # при spawn дочерний процесс стартует «с нуля»
+    django.setup()
+
+
+def execute_job(job_id) -> str:
+    # как между запросами: не держим соединение дольше CONN_MAX_AGE
+    close_old_connections()
+    try:
+        # процесс пула долгоживущий: записи прошлой задачи не в счёт
+        with pin_scope():
+            return run_job(job_id)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    """
+    Выполняет фоновые задачи из очереди jobsapp на пуле процессов
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count() or 1,
+            help='size of the process pool; 0 runs jobs in this process',
+        )
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='exit when the queue is empty',
+        )
+        parser.add_argument(
+            '--stale-after', type=int, default=60 * 60,
+            help='requeue running jobs not updated for this many seconds',
+        )
+        parser.add_argument(
+            '--requeue-interval', type=float, default=60,
+            help='how often to look for stale jobs, in seconds',
+        )
+
+    def handle(self, *args, **options):
+        self.worker = f'{socket.gethostname()}:{os.getpid()}'
+        self.poll_interval = options['poll_interval']
+        self.burst = options['burst']
+        self.stale_after = options['stale_after']
+        self.requeue_interval = options['requeue_interval']
+
+        self.requeue_stale()
+        self.stdout.write(f'Worker {self.worker} started')
+        try:
+            if options['processes'] <= 0:
+                self.run_inline()
+            else:
+                self.run_pool(options['processes'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping worker')
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def requeue_stale(self, running=()) -> None:
+        """
+        Возвращает в очередь задачи, которые давно не обновлялись: их
+        процесс упал (в том числе на другом воркере). Свои задачи
+        из ``running`` не трогаем.
+        """
+        self.requeued_at = time.monotonic()
+        deadline = timezone.now() - timedelta(seconds=self.stale_after)
+        count = (
+            Job.objects
+            .filter(status=Job.RUNNING, updated_at__lt=deadline)
+            .exclude(pk__in=list(running))
+            .update(status=Job.PENDING, worker='')
+        )
+        if count:
+            self.stdout.write(f'Requeued {count} stale jobs')
+
+    def maybe_requeue_stale(self, running=()) -> None:
+        if time.monotonic() - self.requeued_at >= self.requeue_interval:
+            self.requeue_stale(running)
+
+    def report(self, job_id, status: str) -> None:
+        self.stdout.write(f'Job {job_id}: {status}')
+
+    def run_inline(self) -> None:
+        while True:
+            self.maybe_requeue_stale()
+            job_id = claim_next_job(self.worker)
+            if job_id is None:
+                if self.burst:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            self.report(job_id, execute_job(job_id))
+
+    def run_pool(self, processes: int) -> None:
+        running = {}
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_worker_process) as pool:
+            while True:
+                self.maybe_requeue_stale(running.values())
+                while len(running) < processes:
+                    job_id = claim_next_job(self.worker)
+                    if job_id is None:
+                        break
+                    # соединение SQLite нельзя переносить через fork()
+                    connections.close_all()
+                    running[pool.submit(execute_job, job_id)] = job_id
+
+                if not running:
+                    if self.burst:
+                        return
+                    time.sleep(self.poll_interval)
+                    continue
+
+                done, _ = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        self.report(job_id, future.result())
+                    except Exception as error:
+                        # процесс пула упал, не успев записать результат
+                        Job.objects.filter(pk=job_id).update(
+                            status=Job.FAILED,
+                            error=repr(error),
+                            finished_at=timezone.now(),
+                        )
+                        job = Job.objects.filter(pk=job_id).first()
+                        if job is not None:
+                            delete_input_file(job)
+                        self.report(job_id, Job.FAILED)
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.9 on 2026-10-18 17:51
+
+from django.db import migrations, models
+import jobsapp.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobsapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='input_file',
+            field=models.FileField(blank=True, null=True, storage=jobsapp.models.JobFileStorage(), upload_to=jobsapp.models.job_input_path),
+        ),
+        migrations.AlterField(
+            model_name='job',
+            name='result_file',
+            field=models.FileField(blank=True, null=True, storage=jobsapp.models.JobFileStorage(), upload_to=jobsapp.models.job_result_path),
+        ),
+    ]
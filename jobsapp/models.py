@@ -0,0 +1,141 @@
+import os
+import secrets
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import models
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+# Прогресс пишется в базу не чаще раза в PROGRESS_INTERVAL секунд
+PROGRESS_INTERVAL = 1.0
+
+
+class JobFileStorage(FileSystemStorage):
+    """
+    Файлы задач лежат в JOB_FILES_ROOT, вне MEDIA_ROOT: веб-сервер их не
+    отдаёт, результат скачивается только через ``jobsapp:job_result``.
+    """
+
+    @property
+    def base_location(self):
+        return self._value_or_setting(self._location, settings.JOB_FILES_ROOT)
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Job files have no public URL.')
+
+
+def _job_file_path(kind: str, job: 'Job', filename: str) -> str:
+    # случайный каталог: имя файла не подобрать, даже зная id задачи
+    return f'{kind}/{job.pk}/{secrets.token_urlsafe(16)}/{filename}'
+
+
+def job_input_path(job: 'Job', filename: str) -> str:
+    return _job_file_path('input', job, filename)
+
+
+def job_result_path(job: 'Job', filename: str) -> str:
+    return _job_file_path('results', job, filename)
+
+
+class JobQuerySet(models.QuerySet):
+    def enqueue(self, name: str, payload: dict = None, input_file=None, user: User = None) -> 'Job':
+        """
+        Ставит задачу ``name`` (см. :mod:`jobsapp.registry`) в очередь.
+        """
+        job = self.model(
+            name=name,
+            payload=payload or {},
+            created_by=user if user is not None and user.is_authenticated else None,
+        )
+        if input_file is not None:
+            job.input_file.save(input_file.name, input_file, save=False)
+        job.save()
+        return job
+
+
+class Job(models.Model):
+    """
+    Фоновая задача: импорт, экспорт или отчёт, который выполняет ``manage.py runworker``.
+
+    Идентификатор — UUID, чтобы ссылки на статус и результат нельзя было подобрать.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, _('Pending')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    name = models.CharField(max_length=100)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    payload = models.JSONField(default=dict, blank=True)
+    input_file = models.FileField(upload_to=job_input_path, storage=JobFileStorage(), null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    result_file = models.FileField(upload_to=job_result_path, storage=JobFileStorage(), null=True, blank=True)
+    error = models.TextField(blank=True)
+    progress_current = models.PositiveBigIntegerField(default=0)
+    progress_total = models.PositiveBigIntegerField(null=True, blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _("Job")
+        verbose_name_plural = _("Jobs")
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created_at_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'Job({self.name}, {self.status})'
+
+    def get_absolute_url(self):
+        return reverse('jobsapp:job_status', kwargs={'pk': self.pk})
+
+    @property
+    def percent(self):
+        if not self.progress_total:
+            return None
+        return min(100, round(100 * self.progress_current / self.progress_total))
+
+    def set_progress(self, current: int, total: int = None, force: bool = False) -> None:
+        """
+        Сохраняет прогресс, не чаще раза в PROGRESS_INTERVAL секунд.
+        """
+        self.progress_current = current
+        if total is not None:
+            self.progress_total = total
+        now = timezone.now()
+        last = getattr(self, '_progress_saved_at', None)
+        if not force and last is not None and (now - last).total_seconds() < PROGRESS_INTERVAL:
+            return
+        self._progress_saved_at = now
+        Job.objects.filter(pk=self.pk).update(
+            progress_current=self.progress_current,
+            progress_total=self.progress_total,
+            updated_at=now,
+        )
+
+    def save_result_file(self, name: str, file) -> None:
+        self.result_file.save(name, File(file), save=False)
+        Job.objects.filter(pk=self.pk).update(result_file=self.result_file.name)
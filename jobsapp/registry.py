@@ -0,0 +1,120 @@
+"""
+Реестр фоновых задач и их выполнение.
+
+Задача — функция, принимающая :model:`jobsapp.Job` и возвращающая
+JSON-совместимый результат. Регистрируется декоратором в модуле
+``tasks.py`` любого приложения::
+
+    @task("shopapp.import_products")
+    def import_products(job):
+        ...
+        job.set_progress(done, total)
+        return {"created": 10}
+"""
+import logging
+import os
+import traceback
+from typing import Callable, Dict
+
+from django.utils import timezone
+
+from mysite.db_router import use_primary
+
+from .models import Job
+
+log = logging.getLogger(__name__)
+
+tasks: Dict[str, Callable[[Job], object]] = {}
+
+
+def task(name: str):
+    def decorator(func):
+        tasks[name] = func
+        return func
+    return decorator
+
+
+def claim_next_job(worker: str):
+    """
+    Забирает самую старую задачу из очереди.
+
+    Захват — условный UPDATE ``status=pending -> running``: если задачу
+    успел взять другой воркер, обновится ноль строк и берём следующую.
+    """
+    with use_primary():
+        return _claim_next_job(worker)
+
+
+def _claim_next_job(worker: str):
+    while True:
+        job_id = (
+            Job.objects
+            .filter(status=Job.PENDING)
+            .order_by('created_at')
+            .values_list('pk', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        claimed = Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+            status=Job.RUNNING,
+            worker=worker,
+            started_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            return job_id
+
+
+def run_job(job_id) -> str:
+    """
+    Выполняет уже захваченную задачу и сохраняет результат или ошибку.
+    Возвращает итоговый статус.
+
+    Задача читает и пишет только в основную базу: её только что
+    захватили там, и реплика может ещё не знать о ней.
+    """
+    with use_primary():
+        return _run_job(job_id)
+
+
+def _run_job(job_id) -> str:
+    job = Job.objects.get(pk=job_id)
+    func = tasks.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'Unknown task {job.name!r}')
+        log.info('Job %s (%s) started in pid %s', job.pk, job.name, os.getpid())
+        result = func(job)
+    except Exception:
+        log.exception('Job %s (%s) failed', job.pk, job.name)
+        status = Job.FAILED
+        Job.objects.filter(pk=job.pk).update(
+            status=status,
+            error=traceback.format_exc(),
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+    else:
+        log.info('Job %s (%s) done', job.pk, job.name)
+        status = Job.DONE
+        Job.objects.filter(pk=job.pk).update(
+            status=status,
+            result=result,
+            progress_current=job.progress_current,
+            progress_total=job.progress_total,
+            finished_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+    delete_input_file(job)
+    return status
+
+
+def delete_input_file(job: Job) -> None:
+    """
+    Удаляет входной файл завершённой задачи: повторно её не запускают.
+    """
+    if not job.input_file:
+        return
+    job.input_file.delete(save=False)
+    Job.objects.filter(pk=job.pk).update(input_file='')
@@ -0,0 +1,153 @@
+import os
+import shutil
+import tempfile
+import time
+from contextvars import Context
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone, translation
+
+from myauth.models import Profile
+
+from .management.commands import runworker
+from .models import Job
+from .registry import claim_next_job, run_job, task
+
+
+@task("jobsapp.test_echo")
+def echo_task(job):
+    job.set_progress(1, 1)
+    job.save_result_file("echo.txt", ContentFile(job.payload["text"].encode()))
+    return {"text": job.payload["text"]}
+
+
+@task("jobsapp.test_fail")
+def fail_task(job):
+    raise ValueError("broken input")
+
+
+class JobQueueTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(cls.media_root, "media"),
+            JOB_FILES_ROOT=os.path.join(cls.media_root, "jobs"),
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        translation.activate("en")
+        # bulk_create: без сигналов myauth, которые создают профиль дважды;
+        # профили нужны, потому что force_login сохраняет пользователя
+        self.owner, self.stranger = User.objects.bulk_create([
+            User(username="job_owner"),
+            User(username="job_stranger"),
+        ])
+        Profile.objects.bulk_create([Profile(user=self.owner), Profile(user=self.stranger)])
+
+    def test_job_is_claimed_once(self):
+        job = Job.objects.enqueue("jobsapp.test_echo", {"text": "hi"})
+        self.assertEqual(claim_next_job("w1"), job.pk)
+        self.assertIsNone(claim_next_job("w2"))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker), (Job.RUNNING, "w1"))
+
+    def test_run_job_stores_result(self):
+        job = Job.objects.enqueue("jobsapp.test_echo", {"text": "hi"}, user=self.owner)
+        self.assertEqual(run_job(claim_next_job("w1")), Job.DONE)
+        job.refresh_from_db()
+        self.assertEqual(job.result, {"text": "hi"})
+        self.assertEqual(job.percent, 100)
+        self.assertIsNotNone(job.finished_at)
+
+        self.client.force_login(self.owner)
+        status = self.client.get(job.get_absolute_url()).json()
+        self.assertEqual(status["status"], Job.DONE)
+        response = self.client.get(status["result_url"])
+        self.assertEqual(b"".join(response.streaming_content), b"hi")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="echo.txt"')
+
+        # результат не в MEDIA_ROOT и лежит в случайном каталоге
+        path = job.result_file.path
+        self.assertTrue(path.startswith(os.path.join(self.media_root, "jobs") + os.sep))
+        self.assertNotEqual(job.result_file.name, f"results/{job.pk}/echo.txt")
+        with self.assertRaises(ValueError):
+            job.result_file.url
+
+    def test_admin_links_result_through_view(self):
+        job = Job.objects.enqueue("jobsapp.test_echo", {"text": "hi"}, input_file=ContentFile(b"x", name="in.csv"))
+        run_job(claim_next_job("w1"))
+        User.objects.filter(pk=self.owner.pk).update(is_staff=True, is_superuser=True)
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("admin:jobsapp_job_change", args=[job.pk]))
+        self.assertContains(response, reverse("jobsapp:job_result", kwargs={"pk": job.pk}))
+
+    @override_settings(DATABASE_REPLICAS=["replica1"])
+    def test_run_job_ignores_replicas(self):
+        # TestCase пускает только в default: чтение с реплики упало бы;
+        # пустой контекст — как у свежего процесса воркера
+        job = Job.objects.enqueue("jobsapp.test_echo", {"text": "hi"})
+        job_id = Context().run(claim_next_job, "w1")
+        self.assertEqual(Context().run(run_job, job_id), Job.DONE)
+        job.refresh_from_db(using="default")
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_input_file_deleted_when_finished(self):
+        job = Job.objects.enqueue("jobsapp.test_fail", input_file=ContentFile(b"a,b\n", name="in.csv"))
+        path = job.input_file.path
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(run_job(claim_next_job("w1")), Job.FAILED)
+        job.refresh_from_db()
+        self.assertFalse(job.input_file)
+        self.assertFalse(os.path.exists(path))
+
+    def test_stale_jobs_requeued_while_polling(self):
+        crashed = Job.objects.enqueue("jobsapp.test_echo", {"text": "crashed"})
+        own = Job.objects.enqueue("jobsapp.test_echo", {"text": "own"})
+        claim_next_job("w1")
+        claim_next_job("w1")
+        Job.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+
+        command = runworker.Command(stdout=StringIO())
+        command.stale_after, command.requeue_interval = 60 * 60, 60
+        command.requeued_at = time.monotonic()
+        command.maybe_requeue_stale([own.pk])
+        # интервал ещё не прошёл
+        self.assertEqual(Job.objects.get(pk=crashed.pk).status, Job.RUNNING)
+
+        command.requeue_interval = 0
+        command.maybe_requeue_stale([own.pk])
+        self.assertEqual(Job.objects.get(pk=crashed.pk).status, Job.PENDING)
+        # свою задачу воркер ещё выполняет
+        self.assertEqual(Job.objects.get(pk=own.pk).status, Job.RUNNING)
+
+    def test_failed_job_keeps_traceback(self):
+        job = Job.objects.enqueue("jobsapp.test_fail")
+        self.assertEqual(run_job(claim_next_job("w1")), Job.FAILED)
+        job.refresh_from_db()
+        self.assertIn("ValueError: broken input", job.error)
+        status = self.client.get(job.get_absolute_url()).json()
+        self.assertEqual(status["error"], "ValueError: broken input")
+        self.assertIsNone(status["result_url"])
+
+    def test_other_users_cannot_see_job(self):
+        job = Job.objects.enqueue("jobsapp.test_echo", {"text": "hi"}, user=self.owner)
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(job.get_absolute_url()).status_code, 404)
+        self.assertEqual(
+            self.client.get(reverse("jobsapp:job_result", kwargs={"pk": job.pk})).status_code,
+            404,
+        )
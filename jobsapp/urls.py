@@ -0,0 +1,10 @@
+from django.urls import path
+
+from .views import JobStatusView, JobResultView
+
+app_name = 'jobsapp'
+
+urlpatterns = [
+    path('<uuid:pk>/', JobStatusView.as_view(), name='job_status'),
+    path('<uuid:pk>/result/', JobResultView.as_view(), name='job_result'),
+]
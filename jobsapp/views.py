@@ -0,0 +1,56 @@
+from django.http import FileResponse, Http404, HttpRequest, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.views import View
+
+from .models import Job
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        'id': str(job.pk),
+        'name': job.name,
+        'status': job.status,
+        'progress': {
+            'current': job.progress_current,
+            'total': job.progress_total,
+            'percent': job.percent,
+        },
+        'result': job.result,
+        'error': job.error.strip().splitlines()[-1] if job.error else None,
+        'result_url': reverse('jobsapp:job_result', kwargs={'pk': job.pk}) if job.result_file else None,
+        'created_at': job.created_at,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+    }
+
+
+class JobAccessMixin:
+    """
+    Задачу видит её автор или staff. Задачи анонимных пользователей
+    доступны по ссылке: UUID в URL не подобрать.
+    """
+
+    def get_job(self, request: HttpRequest, pk) -> Job:
+        job = get_object_or_404(Job, pk=pk)
+        if job.created_by_id is not None and not request.user.is_staff:
+            if job.created_by_id != request.user.pk:
+                raise Http404
+        return job
+
+
+class JobStatusView(JobAccessMixin, View):
+    def get(self, request: HttpRequest, pk) -> JsonResponse:
+        return JsonResponse(job_to_dict(self.get_job(request, pk)))
+
+
+class JobResultView(JobAccessMixin, View):
+    def get(self, request: HttpRequest, pk) -> FileResponse:
+        job = self.get_job(request, pk)
+        if job.status != Job.DONE or not job.result_file:
+            raise Http404
+        return FileResponse(
+            job.result_file.open('rb'),
+            as_attachment=True,
+            filename=job.result_file.name.rsplit('/', 1)[-1],
+        )
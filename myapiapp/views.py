@@ -5,6 +5,8 @@ from rest_framework.request import Request
 from rest_framework.generics import GenericAPIView, ListCreateAPIView
 # from rest_framework.mixins import ListModelMixin, CreateModelMixin
 
+from mysite.query_optimization import QueryOptimizationMixin
+
 from .serializers import GroupSerializer
 
 
@@ -13,7 +15,7 @@ def hello_world_view(request: Request) -> Response:
     return Response({"message": "Hello World"})
 
 
-class GroupsListView(ListCreateAPIView):
+class GroupsListView(QueryOptimizationMixin, ListCreateAPIView):
     queryset = Group.objects.all()
     serializer_class = GroupSerializer
 
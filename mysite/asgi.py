@@ -5,6 +5,13 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+Под ASGI каталог, карточка товара, экспорт и ленты обслуживаются
+асинхронными представлениями (ASYNC_VIEWS). Запуск::
+
+    gunicorn mysite.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+Сравнение с синхронным gunicorn: ``manage.py benchmark_asgi``.
 """
 
 import os
@@ -12,5 +19,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
+# соединения из потоков sync_to_async не переиспользуются между запросами
+os.environ.setdefault('DJANGO_CONN_MAX_AGE', '0')
 
 application = get_asgi_application()
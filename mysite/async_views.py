@@ -0,0 +1,30 @@
+"""
+Общие части асинхронных представлений (режим ASGI, см. mysite/asgi.py).
+"""
+import copy
+
+from asgiref.sync import markcoroutinefunction
+
+
+class AsyncFeedMixin:
+    """
+    Для django.contrib.syndication Feed: ``items()`` читается через
+    async ORM, а сборка ленты идёт уже без запросов к базе.
+
+    Feed — один объект на все запросы, поэтому элементы кладутся
+    в копию ленты, а не в self.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Django должен видеть, что объект-представление асинхронный
+        markcoroutinefunction(self)
+
+    async def __call__(self, request, *args, **kwargs):
+        feed = copy.copy(self)
+        feed.fetched_items = [item async for item in self.items()]
+        feed.items = feed.get_fetched_items
+        return super(AsyncFeedMixin, feed).__call__(request, *args, **kwargs)
+
+    def get_fetched_items(self):
+        return self.fetched_items
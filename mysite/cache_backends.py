@@ -0,0 +1,587 @@
+"""
+Кеш-бэкенды проекта.
+
+ShardedSQLiteCache — локальный дисковый кеш вместо FileBasedCache.
+Ключи раскладываются по нескольким файлам SQLite (шардам) в режиме WAL,
+поэтому кеш безопасно делят воркеры gunicorn, а запись в один шард не
+блокирует остальные. Число записей и суммарный размер каждого шарда
+хранятся в служебной таблице и поддерживаются триггерами, так что проверка
+лимитов не требует обхода директории или COUNT(*). При переполнении
+сначала удаляются просроченные записи, затем давно не читавшиеся (LRU).
+
+TwoTierCache — обёртка с маленьким LRU внутри процесса перед общим кешем,
+см. её описание ниже.
+
+Пример настройки::
+
+    CACHES = {
+        "default": {
+            "BACKEND": "mysite.cache_backends.ShardedSQLiteCache",
+            "LOCATION": "/var/tmp/django_sqlite_cache",
+            "OPTIONS": {
+                "SHARDS": 8,
+                "MAX_ENTRIES": 100_000,
+                "MAX_SIZE": 512 * 1024 * 1024,
+            },
+        },
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache_lookup
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    count INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats (id, count, size) VALUES (1, 0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+    UPDATE stats SET count = count + 1, size = size + new.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+    UPDATE stats SET count = count - 1, size = size - old.size WHERE id = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache BEGIN
+    UPDATE stats SET size = size + new.size - old.size WHERE id = 1;
+END;
+"""
+
+# Время последнего чтения обновляется не чаще раза в ACCESS_RESOLUTION секунд,
+# иначе каждое чтение превращалось бы в запись. Обновление необязательное:
+# если шард занят писателем, чтение его пропускает, а не ждёт.
+ACCESS_RESOLUTION = 10
+
+# сколько просроченных записей удаляет каждая запись в шард
+PURGE_BATCH = 100
+
+MAX_QUERY_PARAMS = 500
+
+
+class ShardedSQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._dir = os.path.abspath(location)
+        self._shards = int(options.get("SHARDS", 8))
+        self._max_size = options.get("MAX_SIZE")
+        self._busy_timeout = float(options.get("BUSY_TIMEOUT", 5))
+        self._local = threading.local()
+
+    # --- соединения ---------------------------------------------------
+
+    def _shard_path(self, index: int) -> str:
+        return os.path.join(self._dir, f"shard-{index:02d}.sqlite3")
+
+    def _connect(self, index: int) -> sqlite3.Connection:
+        os.makedirs(self._dir, exist_ok=True)
+        conn = sqlite3.connect(
+            self._shard_path(index),
+            timeout=self._busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _conn(self, index: int) -> sqlite3.Connection:
+        # после fork() соединения родителя использовать нельзя
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.pid = os.getpid()
+            local.connections = {}
+        conn = local.connections.get(index)
+        if conn is None:
+            conn = local.connections[index] = self._connect(index)
+        return conn
+
+    def _shard_for(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self._shards
+
+    def _group_by_shard(self, keys):
+        groups = defaultdict(list)
+        for key in keys:
+            groups[self._shard_for(key)].append(key)
+        return groups
+
+    # --- сериализация -------------------------------------------------
+
+    @staticmethod
+    def _dumps(value) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads(data: bytes):
+        return pickle.loads(data)
+
+    # --- вытеснение ---------------------------------------------------
+
+    def _shard_limits(self):
+        max_entries = max(1, self._max_entries // self._shards)
+        max_size = self._max_size // self._shards if self._max_size else None
+        return max_entries, max_size
+
+    def _cull(self, conn: sqlite3.Connection, now: float) -> None:
+        max_entries, max_size = self._shard_limits()
+        count, size = conn.execute("SELECT count, size FROM stats").fetchone()
+        if count <= max_entries and (max_size is None or size <= max_size):
+            return
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        if self._cull_frequency == 0:
+            conn.execute("DELETE FROM cache")
+            return
+        count, size = conn.execute("SELECT count, size FROM stats").fetchone()
+        if count > max_entries:
+            target = max_entries - max_entries // self._cull_frequency
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (count - target,),
+            )
+        if max_size is not None:
+            target_size = max_size - max_size // self._cull_frequency
+            while size > target_size:
+                rows = conn.execute(
+                    "SELECT key, size FROM cache ORDER BY accessed LIMIT 100"
+                ).fetchall()
+                if not rows:
+                    break
+                victims = []
+                for key, row_size in rows:
+                    victims.append((key,))
+                    size -= row_size
+                    if size <= target_size:
+                        break
+                conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+
+    # --- запись -------------------------------------------------------
+
+    def _write(self, index: int, rows, mode: str) -> bool:
+        """
+        Пишет ``rows`` (key, value, expires) в шард одной транзакцией.
+
+        ``mode``: "set" перезаписывает, "add" пишет только отсутствующие
+        или просроченные ключи. Возвращает True, если записана хотя бы одна строка.
+        """
+        conn = self._conn(index)
+        now = time.time()
+        written = False
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key, data, expires in rows:
+                if mode == "add":
+                    existing = conn.execute(
+                        "SELECT expires FROM cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if existing is not None and (existing[0] is None or existing[0] > now):
+                        continue
+                cursor = conn.execute(
+                    "UPDATE cache SET value = ?, expires = ?, accessed = ?, size = ? "
+                    "WHERE key = ?",
+                    (data, expires, now, len(data), key),
+                )
+                if cursor.rowcount == 0:
+                    conn.execute(
+                        "INSERT INTO cache (key, value, expires, accessed, size) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, data, expires, now, len(data)),
+                    )
+                written = True
+            if written:
+                # просроченное чтение уже не видит, убираем понемногу здесь
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache WHERE expires <= ? LIMIT ?)",
+                    (now, PURGE_BATCH),
+                )
+                self._cull(conn, now)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return written
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = [(key, self._dumps(value), self.get_backend_timeout(timeout))]
+        return self._write(self._shard_for(key), rows, "add")
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        rows = [(key, self._dumps(value), self.get_backend_timeout(timeout))]
+        self._write(self._shard_for(key), rows, "set")
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        keys = {
+            self.make_and_validate_key(key, version=version): value
+            for key, value in data.items()
+        }
+        expires = self.get_backend_timeout(timeout)
+        for index, shard_keys in self._group_by_shard(keys).items():
+            rows = [(key, self._dumps(keys[key]), expires) for key in shard_keys]
+            self._write(index, rows, "set")
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._conn(self._shard_for(key))
+        now = time.time()
+        cursor = conn.execute(
+            "UPDATE cache SET expires = ?, accessed = ? "
+            "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._conn(self._shard_for(key))
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache "
+                "WHERE key = ? AND (expires IS NULL OR expires > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            new_value = self._loads(row[0]) + delta
+            data = self._dumps(new_value)
+            conn.execute(
+                "UPDATE cache SET value = ?, size = ?, accessed = ? WHERE key = ?",
+                (data, len(data), now, key),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return new_value
+
+    # --- чтение -------------------------------------------------------
+
+    def _fetch(self, index: int, keys):
+        """
+        Только чтение: просроченные записи отсекает условие на expires,
+        удаляет их запись в шард (_write) и вытеснение.
+        """
+        conn = self._conn(index)
+        now = time.time()
+        rows = []
+        for start in range(0, len(keys), MAX_QUERY_PARAMS):
+            chunk = keys[start:start + MAX_QUERY_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows += conn.execute(
+                "SELECT key, value, accessed FROM cache "
+                f"WHERE key IN ({placeholders}) AND (expires IS NULL OR expires > ?)",
+                [*chunk, now],
+            ).fetchall()
+        found = {}
+        stale_access = []
+        for key, data, accessed in rows:
+            found[key] = data
+            if accessed < now - ACCESS_RESOLUTION:
+                stale_access.append((now, key))
+        if stale_access:
+            self._touch_accessed(conn, stale_access)
+        return found
+
+    def _touch_accessed(self, conn: sqlite3.Connection, rows) -> None:
+        # без ожидания блокировки: LRU переживёт неточное время чтения
+        conn.execute("PRAGMA busy_timeout = 0")
+        try:
+            conn.executemany("UPDATE cache SET accessed = ? WHERE key = ?", rows)
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}")
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        data = self._fetch(self._shard_for(key), [key]).get(key)
+        record_cache_lookup("shared", data is not None, data is None)
+        if data is None:
+            return default
+        return self._loads(data)
+
+    def get_many(self, keys, version=None):
+        key_map = {
+            self.make_and_validate_key(key, version=version): key for key in keys
+        }
+        result = {}
+        for index, shard_keys in self._group_by_shard(key_map).items():
+            for key, data in self._fetch(index, shard_keys).items():
+                result[key_map[key]] = self._loads(data)
+        record_cache_lookup("shared", len(result), len(key_map) - len(result))
+        return result
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._conn(self._shard_for(key)).execute(
+            "SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    # --- удаление -----------------------------------------------------
+
+    def _delete(self, key) -> bool:
+        cursor = self._conn(self._shard_for(key)).execute(
+            "DELETE FROM cache WHERE key = ?", (key,)
+        )
+        return cursor.rowcount > 0
+
+    def _delete_many(self, keys) -> None:
+        for index, shard_keys in self._group_by_shard(keys).items():
+            conn = self._conn(index)
+            conn.executemany(
+                "DELETE FROM cache WHERE key = ?", [(key,) for key in shard_keys]
+            )
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._delete(key)
+
+    def delete_many(self, keys, version=None):
+        self._delete_many(
+            [self.make_and_validate_key(key, version=version) for key in keys]
+        )
+
+    def clear(self):
+        for index in range(self._shards):
+            self._conn(index).execute("DELETE FROM cache")
+
+    def close(self, **kwargs):
+        # Соединения держим открытыми между запросами: открытие шарда
+        # и проверка схемы стоят дороже самого чтения.
+        pass
+
+
+class _TwoTierState:
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = None
+        self.checked = None
+
+
+_two_tier_states = {}
+
+
+class TwoTierCache(BaseCache):
+    """
+    Локальный LRU процесса перед общим кешем ``LOCATION`` (алиас из CACHES).
+
+    Локально живут только ключи с префиксами из ``LOCAL_KEY_PREFIXES``:
+    значения отдаются как есть, без pickle и чтения с диска, поэтому
+    кешировать так можно только то, что вызывающий код не изменяет
+    (JSON-выгрузки, версии тегов, но не HttpResponse из cache_page).
+    Размер ограничен ``LOCAL_MAX_ENTRIES``, время жизни — ``LOCAL_TIMEOUT``.
+
+    Запись такого ключа в любом воркере увеличивает счётчик поколений
+    в общем кеше. Остальные воркеры сверяют его не чаще раза в
+    ``GENERATION_CHECK_INTERVAL`` секунд и при расхождении очищают свой LRU,
+    так что устаревшее значение может прожить не дольше этого интервала.
+
+    Блокировки пересчёта (``...:lock`` из shopapp.caching) идут мимо LRU:
+    их удаление не должно сбрасывать LRU всех воркеров.
+    """
+    generation_key = "two-tier:generation"
+    shared_only_suffixes = (":lock",)
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = location
+        self._prefixes = tuple(options.get("LOCAL_KEY_PREFIXES", ()))
+        self._local_max_entries = int(options.get("LOCAL_MAX_ENTRIES", 256))
+        self._local_timeout = float(options.get("LOCAL_TIMEOUT", 30))
+        self._check_interval = float(options.get("GENERATION_CHECK_INTERVAL", 1))
+        # django.core.cache.caches создаёт бэкенд на каждый поток, а LRU и
+        # поколение должны быть общими для процесса — как _caches у LocMemCache
+        self._state = _two_tier_states.setdefault(location, _TwoTierState())
+        self._local = self._state.entries
+        self._lock = self._state.lock
+
+    @property
+    def _shared(self) -> BaseCache:
+        return caches[self._shared_alias]
+
+    def _is_local(self, key) -> bool:
+        return (
+            isinstance(key, str)
+            and key.startswith(self._prefixes)
+            and not key.endswith(self.shared_only_suffixes)
+        )
+
+    # --- поколения ----------------------------------------------------
+
+    def _sync_generation(self) -> None:
+        now = time.monotonic()
+        checked = self._state.checked
+        if checked is not None and now - checked < self._check_interval:
+            return
+        generation = self._shared.get(self.generation_key)
+        with self._lock:
+            self._state.checked = now
+            if generation != self._state.generation:
+                self._local.clear()
+                self._state.generation = generation
+
+    def _bump_generation(self) -> None:
+        shared = self._shared
+        try:
+            generation = shared.incr(self.generation_key)
+        except ValueError:
+            generation = int(time.time() * 1000)
+            if not shared.add(self.generation_key, generation, None):
+                generation = shared.incr(self.generation_key)
+        with self._lock:
+            if self._state.generation is not None and generation == self._state.generation + 1:
+                # между нашими записями никто больше не писал — локальный LRU актуален
+                self._state.generation = generation
+            else:
+                self._state.checked = None
+
+    # --- локальный LRU ------------------------------------------------
+
+    def _local_get(self, local_key):
+        with self._lock:
+            entry = self._local.get(local_key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._local[local_key]
+                return None
+            self._local.move_to_end(local_key)
+            return entry
+
+    def _local_set(self, local_key, value, timeout=DEFAULT_TIMEOUT) -> None:
+        lifetime = self._local_timeout
+        if timeout is not DEFAULT_TIMEOUT and timeout is not None:
+            lifetime = min(lifetime, timeout)
+        if lifetime <= 0:
+            return
+        with self._lock:
+            self._local[local_key] = (value, time.monotonic() + lifetime)
+            self._local.move_to_end(local_key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_discard(self, local_keys) -> None:
+        with self._lock:
+            for local_key in local_keys:
+                self._local.pop(local_key, None)
+
+    def _changed(self, keys, version) -> None:
+        local_keys = [(key, version) for key in keys if self._is_local(key)]
+        if local_keys:
+            self._local_discard(local_keys)
+            self._bump_generation()
+
+    # --- API кеша -----------------------------------------------------
+
+    def get(self, key, default=None, version=None):
+        if not self._is_local(key):
+            return self._shared.get(key, default, version=version)
+        self._sync_generation()
+        entry = self._local_get((key, version))
+        record_cache_lookup("local", entry is not None, entry is None)
+        if entry is not None:
+            return entry[0]
+        sentinel = object()
+        value = self._shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            return default
+        self._local_set((key, version), value)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        result = {}
+        missing = []
+        if any(self._is_local(key) for key in keys):
+            self._sync_generation()
+        local_misses = 0
+        for key in keys:
+            entry = self._local_get((key, version)) if self._is_local(key) else None
+            if entry is None:
+                missing.append(key)
+                local_misses += self._is_local(key)
+            else:
+                result[key] = entry[0]
+        record_cache_lookup("local", len(result), local_misses)
+        if missing:
+            fetched = self._shared.get_many(missing, version=version)
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self._local_set((key, version), value)
+            result.update(fetched)
+        return result
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self._local_get((key, version)) is not None:
+            return True
+        return self._shared.has_key(key, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # add пишет только отсутствующий ключ, локальных копий у него нет
+        return self._shared.add(key, value, timeout, version=version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._shared.set(key, value, timeout, version=version)
+        self._changed([key], version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self._shared.set_many(data, timeout, version=version)
+        self._changed(list(data), version)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self._shared.incr(key, delta, version=version)
+        self._changed([key], version)
+        return value
+
+    def delete(self, key, version=None):
+        deleted = self._shared.delete(key, version=version)
+        self._changed([key], version)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self._shared.delete_many(keys, version=version)
+        self._changed(keys, version)
+
+    def clear(self):
+        self._shared.clear()
+        with self._lock:
+            self._local.clear()
+            self._state.generation = None
+            self._state.checked = None
+
+    def close(self, **kwargs):
+        self._shared.close(**kwargs)
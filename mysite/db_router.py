@@ -0,0 +1,152 @@
+"""
+Чтение с реплик, запись в основную базу.
+
+``PrimaryReplicaRouter`` отправляет запись в ``default``, а чтение —
+в случайную базу из ``DATABASE_REPLICAS``. Реплика отстаёт от основной
+базы, поэтому действует правило «читаю свои записи»:
+
+* после первой записи в запросе (или в команде, задаче) все чтения
+  этого запроса идут в ``default``;
+* ``PrimaryPinMiddleware`` ставит клиенту, который что-то записал,
+  cookie на ``DATABASE_PIN_SECONDS`` секунд, и его следующие запросы тоже
+  читают из ``default``, пока реплика не догонит.
+
+Явно выбрать базу можно как обычно, через ``QuerySet.using()``
+(см. атрибут ``using`` у представлений экспорта), или блоком
+``with use_primary():``. Очередь задач jobsapp целиком работает с
+``default``: задачу захватывают там, и реплика может её ещё не видеть.
+
+Локально реплику изображает копия db.sqlite3, которую обновляет
+``manage.py sync_replica``::
+
+    DJANGO_DB_REPLICAS=replica.sqlite3 python manage.py sync_replica --interval 2 &
+    DJANGO_DB_REPLICAS=replica.sqlite3 python manage.py runserver
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = "db_primary"
+
+
+class _PinState:
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# изменяемый объект, а не флаг: sync_to_async работает в копии контекста,
+# и запись, сделанная в потоке, должна быть видна запросу
+_state: ContextVar = ContextVar("db_pin_state", default=None)
+
+
+def _current_state() -> _PinState:
+    state = _state.get()
+    if state is None:
+        # вне запроса (команды, задачи): своё состояние на поток
+        state = _PinState()
+        _state.set(state)
+    return state
+
+
+def get_replica() -> str:
+    """
+    Алиас базы для чтения без учёта закрепления за основной.
+    """
+    replicas = settings.DATABASE_REPLICAS
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def pin_scope(pinned: bool = False):
+    """
+    Своё состояние закрепления на один запрос, задачу или команду:
+    записи внутри блока не закрепляют то, что выполняется после него.
+    """
+    state = _PinState(pinned=pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+@contextmanager
+def use_primary():
+    state = _current_state()
+    pinned = state.pinned
+    state.pinned = True
+    try:
+        yield
+    finally:
+        state.pinned = pinned
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            # связанные объекты читаем оттуда же, откуда сам объект
+            return instance._state.db
+        state = _state.get()
+        if state is not None and state.pinned:
+            return DEFAULT_DB_ALIAS
+        return get_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _current_state()
+        state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # схема на реплики приезжает вместе с данными
+        return db not in settings.DATABASE_REPLICAS
+
+
+class PrimaryPinMiddleware:
+    """
+    Закрепляет за основной базой клиента, который недавно писал.
+    Должен стоять выше всех middleware, которые читают из базы (сессии).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with pin_scope(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = self.get_response(request)
+        return self.process_response(state, response)
+
+    async def __acall__(self, request):
+        with pin_scope(pinned=PIN_COOKIE in request.COOKIES) as state:
+            response = await self.get_response(request)
+        return self.process_response(state, response)
+
+    @staticmethod
+    def process_response(state: _PinState, response):
+        if state.wrote and settings.DATABASE_REPLICAS:
+            response.set_cookie(
+                PIN_COOKIE, "1",
+                max_age=settings.DATABASE_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
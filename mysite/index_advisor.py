@@ -0,0 +1,367 @@
+"""
+Подбор индексов по реальной нагрузке (SQLite).
+
+``Workload`` — execute-wrapper, который собирает SELECT/UPDATE/DELETE
+с параметрами и числом выполнений. ``IndexAdvisor`` прогоняет каждый
+запрос через ``EXPLAIN QUERY PLAN`` и находит:
+
+* полные сканы таблиц (``SCAN t`` без индекса) и временные B-деревья
+  под ORDER BY/GROUP BY/DISTINCT, а также автоматические индексы,
+  которые SQLite строит на лету;
+* индексы-кандидаты: столбцы из равенств WHERE, затем ORDER BY (или
+  первый диапазон). Булевы фильтры (``archived=False``) становятся
+  условием частичного индекса. Кандидат создаётся в транзакции, запрос
+  объясняется заново, транзакция откатывается — в отчёт попадает только
+  индекс, который планировщик действительно выбрал;
+* избыточные индексы (столбцы — префикс другого индекса) и индексы,
+  которые нагрузка ни разу не использовала.
+
+Запуск: ``manage.py index_advisor`` (см. команду в shopapp).
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+from django.apps import apps
+from django.db import DatabaseError, connections, models, transaction
+from django.db.backends.signals import connection_created
+
+QUERY_PREFIXES = ("SELECT", "UPDATE", "DELETE")
+
+_SCAN = re.compile(r"^SCAN (\S+)(?: AS \S+)?$")
+_TEMP_BTREE = re.compile(r"USE TEMP B-TREE FOR (.+)")
+_AUTOMATIC = re.compile(r"AUTOMATIC (?:PARTIAL )?(?:COVERING )?INDEX")
+_USED_INDEX = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+_CLAUSE_END = re.compile(r" (?:GROUP BY|ORDER BY|LIMIT|HAVING) ")
+
+
+class Workload:
+    """
+    Собирает запросы между ``install()`` и ``uninstall()``, в том числе
+    из соединений других потоков (async-представления, live server).
+    """
+
+    def __init__(self):
+        # sql -> [число выполнений, параметры первого выполнения]
+        self.queries = {}
+        self.active = False
+
+    def install(self) -> None:
+        self.active = True
+        for connection in connections.all():
+            self.attach(connection)
+        connection_created.connect(self.on_connection_created)
+
+    def uninstall(self) -> None:
+        # соединения других потоков отсюда не достать: там обёртка
+        # остаётся, но уже ничего не пишет
+        self.active = False
+        connection_created.disconnect(self.on_connection_created)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+    def attach(self, connection) -> None:
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def on_connection_created(self, sender, connection, **kwargs):
+        self.attach(connection)
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.active and not many and sql.lstrip()[:6].upper() in QUERY_PREFIXES:
+            entry = self.queries.get(sql)
+            if entry is None:
+                self.queries[sql] = [1, tuple(params or ())]
+            else:
+                entry[0] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def executions(self) -> int:
+        return sum(count for count, _ in self.queries.values())
+
+
+@dataclass
+class QueryReport:
+    sql: str
+    count: int
+    plan: list
+    problems: list
+
+
+@dataclass
+class IndexProposal:
+    model: type
+    index: models.Index
+    count: int = 0
+    examples: list = field(default_factory=list)
+
+    @property
+    def code(self) -> str:
+        condition = ""
+        if self.index.condition:
+            lookups = ", ".join(f"{name}={value!r}" for name, value in self.index.condition.children)
+            condition = f", condition=models.Q({lookups})"
+        return f"models.Index(fields={self.index.fields!r}, name={self.index.name!r}{condition})"
+
+
+@dataclass
+class ExistingIndex:
+    model: type
+    name: str
+    columns: list
+    orders: list = field(default_factory=list)
+    # поле с db_index=True или имя из Meta.indexes; None — индекс не из моделей
+    field_name: Optional[str] = None
+    meta_index: Optional[models.Index] = None
+    foreign_key: bool = False
+    used: int = 0
+    redundant_to: Optional[str] = None
+
+
+def _where_part(sql: str) -> str:
+    # последний WHERE: WHERE подзапросов идут раньше
+    start = sql.rfind(" WHERE ")
+    if start < 0:
+        return ""
+    rest = sql[start + 7:]
+    end = _CLAUSE_END.search(rest)
+    return rest[:end.start()] if end else rest
+
+
+def _order_part(sql: str) -> list:
+    start = sql.rfind(" ORDER BY ")
+    if start < 0:
+        return []
+    rest = re.split(r" LIMIT ", sql[start + 10:])[0]
+    return [item.strip() for item in rest.split(",")]
+
+
+def candidate_columns(sql: str, table: str):
+    """
+    Индекс-кандидат для ``table``: ``([(column, descending)], {column: bool})``.
+
+    Булевы фильтры Django пишет как ``"t"."flag"`` и ``NOT "t"."flag"``;
+    по ним SQLite индекс не использует, зато может взять частичный индекс
+    с тем же условием — они возвращаются отдельно.
+    """
+    quoted = re.escape(f'"{table}"') + r'\."(\w+)"'
+    where = _where_part(sql)
+    equal = []
+    flags = {}
+    for match in re.finditer(rf'(NOT )?{quoted}(\s*(?:= |IN \(|IS NULL\b))?', where):
+        column = match.group(2)
+        if match.group(3):
+            if column not in equal:
+                equal.append(column)
+        elif re.match(r'\s*(?:AND\b|\)|$)', where[match.end():]) and " OR " not in where:
+            flags[column] = match.group(1) is None
+    ranges = [
+        match.group(1)
+        for match in re.finditer(rf'{quoted} (?:>=?|<=?|BETWEEN |IS NOT NULL)', where)
+        if match.group(1) not in equal
+    ]
+
+    order = []
+    for item in _order_part(sql):
+        match = re.fullmatch(rf'{quoted}(?: (ASC|DESC))?', item)
+        if match is None:
+            # сортировка по другой таблице или выражению: индекс не поможет
+            order = None
+            break
+        order.append((match.group(1), match.group(2) == "DESC"))
+
+    columns = [(column, False) for column in equal]
+    if order:
+        columns += [(column, desc) for column, desc in order if column not in equal]
+    elif ranges:
+        columns.append((ranges[0], False))
+    return columns, flags
+
+
+class IndexAdvisor:
+    def __init__(self, app_labels, using: str = "default"):
+        self.connection = connections[using]
+        self.models = {}
+        for label in app_labels:
+            for model in apps.get_app_config(label).get_models():
+                if model._meta.managed and not model._meta.proxy:
+                    self.models[model._meta.db_table] = model
+        self.reports = []
+        self.proposals = {}
+        self.indexes = {}
+
+    def explain(self, cursor, sql: str, params) -> Optional[list]:
+        try:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        except DatabaseError:
+            return None
+        return [row[3] for row in cursor.fetchall()]
+
+    @staticmethod
+    def problems(plan: list) -> list:
+        found = []
+        for detail in plan:
+            scan = _SCAN.match(detail)
+            if scan:
+                found.append(("full scan", scan.group(1)))
+            temp = _TEMP_BTREE.search(detail)
+            if temp:
+                found.append(("temp b-tree", temp.group(1)))
+            if _AUTOMATIC.search(detail):
+                found.append(("automatic index", detail.split()[1]))
+        return found
+
+    def analyze(self, workload: Workload) -> None:
+        self.load_indexes()
+        with self.connection.cursor() as cursor:
+            for sql, (count, params) in sorted(workload.queries.items(), key=lambda item: -item[1][0]):
+                plan = self.explain(cursor, sql, params)
+                if plan is None:
+                    continue
+                for detail in plan:
+                    for name in _USED_INDEX.findall(detail):
+                        if name in self.indexes:
+                            self.indexes[name].used += count
+                problems = self.problems(plan)
+                if not problems:
+                    continue
+                self.reports.append(QueryReport(sql, count, plan, problems))
+                for table in {self.problem_table(problem, plan) for problem in problems} - {None}:
+                    self.propose(cursor, sql, params, count, table, problems)
+        self.drop_covered_proposals()
+
+    def problem_table(self, problem, plan) -> Optional[str]:
+        kind, subject = problem
+        if kind != "temp b-tree":
+            return subject if subject in self.models else None
+        # сортировку обычно нужно закрыть индексом первой (внешней) таблицы
+        for detail in plan:
+            match = re.match(r"^(?:SCAN|SEARCH) (\S+)", detail)
+            if match and match.group(1) in self.models:
+                return match.group(1)
+        return None
+
+    def propose(self, cursor, sql: str, params, count: int, table: str, problems: list) -> None:
+        model = self.models[table]
+        by_column = {model_field.column: model_field for model_field in model._meta.concrete_fields}
+        columns, flags = candidate_columns(sql, table)
+        if any(column not in by_column for column, _ in columns) or any(column not in by_column for column in flags):
+            return
+        # длинный текст в индексе раздувает его и почти не сужает поиск
+        columns = [
+            (column, desc) for column, desc in columns
+            if not isinstance(by_column[column], models.TextField)
+        ]
+        if not columns or self.exists(table, columns, flags):
+            return
+        fields = [("-" if desc else "") + by_column[column].name for column, desc in columns]
+        condition = models.Q(**{by_column[column].name: value for column, value in flags.items()})
+        key = (model, tuple(fields), str(condition))
+        proposal = self.proposals.get(key)
+        if proposal is None:
+            index = models.Index(fields=fields, name="index_advisor_tmp", condition=condition or None)
+            index.set_name_with_model(model)
+            if not self.improves(cursor, model, index, sql, params, problems):
+                return
+            proposal = self.proposals[key] = IndexProposal(model, index)
+        proposal.count += count
+        if len(proposal.examples) < 3:
+            proposal.examples.append(sql)
+
+    def exists(self, table: str, columns: list, flags: dict) -> bool:
+        if flags:
+            # частичные индексы не сравниваем: условие не видно в интроспекции
+            return False
+        names = [column for column, _ in columns]
+        directions = [desc for _, desc in columns]
+        for index in self.indexes.values():
+            if index.model._meta.db_table != table or index.columns != names:
+                continue
+            existing = [order == "DESC" for order in index.orders] or [False] * len(names)
+            # индекс читается и в обратную сторону
+            if existing == directions or existing == [not desc for desc in directions]:
+                return True
+        return False
+
+    def improves(self, cursor, model, index: models.Index, sql: str, params, problems: list) -> bool:
+        """
+        Создаёт индекс в транзакции, объясняет запрос и откатывает:
+        планировщик должен выбрать индекс, и проблем должно стать меньше.
+        """
+        # только текст CREATE INDEX: входить в schema_editor внутри
+        # транзакции (тесты) SQLite не даёт
+        editor = self.connection.SchemaEditorClass(self.connection, collect_sql=True, atomic=False)
+        statement = str(index.create_sql(model, editor))
+        with transaction.atomic(using=self.connection.alias):
+            cursor.execute(statement)
+            plan = self.explain(cursor, sql, params) or []
+            transaction.set_rollback(True, using=self.connection.alias)
+        used = any(index.name in _USED_INDEX.findall(detail) for detail in plan)
+        return used and len(self.problems(plan)) < len(problems)
+
+    def drop_covered_proposals(self) -> None:
+        # (a) не нужен, если с тем же условием предлагается (a, b)
+        for key in list(self.proposals):
+            model, fields, condition = key
+            for other in list(self.proposals):
+                other_model, other_fields, other_condition = other
+                if (
+                    other_model is model
+                    and other_condition == condition
+                    and len(other_fields) > len(fields)
+                    and other_fields[:len(fields)] == fields
+                ):
+                    self.proposals[other].count += self.proposals[key].count
+                    del self.proposals[key]
+                    break
+
+    def load_indexes(self) -> None:
+        with self.connection.cursor() as cursor:
+            for table, model in self.models.items():
+                constraints = self.connection.introspection.get_constraints(cursor, table)
+                meta_indexes = {index.name: index for index in model._meta.indexes}
+                by_column = {model_field.column: model_field for model_field in model._meta.concrete_fields}
+                for name, info in constraints.items():
+                    if not info["index"] or info["unique"] or info["primary_key"]:
+                        continue
+                    existing = ExistingIndex(model, name, info["columns"], info.get("orders") or [])
+                    if name in meta_indexes:
+                        existing.meta_index = meta_indexes[name]
+                    elif len(info["columns"]) == 1 and info["columns"][0] in by_column:
+                        model_field = by_column[info["columns"][0]]
+                        existing.field_name = model_field.name
+                        existing.foreign_key = model_field.is_relation
+                    self.indexes[name] = existing
+        for existing in self.indexes.values():
+            # в SQLite любой индекс заканчивается rowid: (a) — это на деле
+            # (a, id), и (a, b, id) не заменит его в ORDER BY a, id
+            key = self.key_columns(existing)
+            for other in self.indexes.values():
+                other_key = self.key_columns(other)
+                if (
+                    other is not existing
+                    and other.model is existing.model
+                    and len(other_key) > len(key)
+                    and other_key[:len(key)] == key
+                ):
+                    existing.redundant_to = other.name
+                    break
+
+    @staticmethod
+    def key_columns(index: "ExistingIndex") -> list:
+        pk = index.model._meta.pk.column
+        return index.columns if pk in index.columns else [*index.columns, pk]
+
+    @property
+    def redundant(self) -> list:
+        return [index for index in self.indexes.values() if index.redundant_to]
+
+    @property
+    def unused(self) -> list:
+        # индексы внешних ключей нужны для JOIN и каскадного удаления
+        return [
+            index for index in self.indexes.values()
+            if not index.used and not index.redundant_to and not index.foreign_key
+        ]
@@ -0,0 +1,312 @@
+"""
+Логирование, которое не тормозит запросы.
+
+``QueuedHandler`` только кладёт запись в очередь. Отдельный поток каждого
+процесса забирает записи пачками и отдаёт их целевым обработчикам, так что
+запрос не ждёт диска и не стоит в очереди за локом обработчика.
+
+``SharedRotatingFileHandler`` пишет пачку одним вызовом write и ротирует
+файл под межпроцессной блокировкой (flock). Поэтому несколько воркеров
+gunicorn могут писать в один log.txt: ротацию делает один из них, а
+остальные замечают новый файл и открывают его заново.
+
+``JsonFormatter`` и ``AccessLogMiddleware`` дают access-лог в JSONL
+(включается настройкой ACCESS_LOG_NAME).
+
+Пример настройки::
+
+    "handlers": {
+        "logfile": {
+            "class": "mysite.log_queue.SharedRotatingFileHandler",
+            "filename": "log.txt",
+            "maxBytes": 1024 * 1024,
+            "backupCount": 3,
+        },
+        "queue": {
+            "class": "mysite.log_queue.QueuedHandler",
+            "handlers": ["logfile"],
+        },
+    },
+    "root": {"handlers": ["queue"]},
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки
+    fcntl = None
+
+# сколько записей поток забирает из очереди за раз
+BATCH_SIZE = 500
+# при переполнении очереди записи отбрасываются, а не блокируют запрос
+QUEUE_SIZE = 10_000
+
+_STOP = object()
+
+
+def _get_handler(name: str) -> logging.Handler:
+    # logging.getHandlerByName появился только в Python 3.12
+    get_handler = getattr(logging, "getHandlerByName", None)
+    handler = get_handler(name) if get_handler else logging._handlers.get(name)
+    if handler is None:
+        raise ValueError(f"Logging handler {name!r} is not configured yet")
+    return handler
+
+
+class QueuedHandler(logging.Handler):
+    """
+    Передаёт записи обработчикам ``handlers`` (имена из конфигурации
+    logging) через очередь и поток-писатель. dictConfig создаёт обработчики
+    по алфавиту, поэтому имя очереди должно идти после имён целей.
+
+    Поток запускается при первой записи в каждом процессе, поэтому
+    конфигурация, загруженная до fork() воркеров, работает и в них.
+    """
+
+    def __init__(self, handlers=(), batch_size: int = BATCH_SIZE, queue_size: int = QUEUE_SIZE, level=logging.NOTSET):
+        super().__init__(level)
+        self.targets = [_get_handler(name) for name in handlers]
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.queue = None
+        self.writer = None
+        self.pid = None
+        self.dropped = 0
+
+    def _start(self) -> None:
+        self.queue = queue.Queue(self.queue_size)
+        self.pid = os.getpid()
+        self.dropped = 0
+        self.writer = threading.Thread(
+            target=self._write_loop, args=(self.queue, self.targets), name="log-writer", daemon=True,
+        )
+        self.writer.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self._start()
+        try:
+            # аргументы могут измениться до того, как писатель дойдёт до записи
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _write_loop(self, records: queue.Queue, targets: list) -> None:
+        while True:
+            batch = [records.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(records.get_nowait())
+                except queue.Empty:
+                    break
+            taken = len(batch)
+            stop = any(record is _STOP for record in batch)
+            batch = [record for record in batch if record is not _STOP]
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                batch.append(logging.makeLogRecord({
+                    "name": __name__,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": f"Log queue is full, {dropped} records dropped",
+                }))
+            for target in targets:
+                self._deliver(target, batch)
+            for _ in range(taken):
+                records.task_done()
+            if stop:
+                return
+
+    @staticmethod
+    def _deliver(target: logging.Handler, batch: list) -> None:
+        accepted = [
+            record for record in batch
+            if record.levelno >= target.level and target.filter(record)
+        ]
+        if not accepted:
+            return
+        if isinstance(target, SharedRotatingFileHandler):
+            target.emit_batch(accepted)
+            return
+        for record in accepted:
+            target.handle(record)
+
+    def flush(self) -> None:
+        # ждём, пока писатель разберёт очередь этого процесса
+        if self.queue is not None and self.pid == os.getpid():
+            self.queue.join()
+
+    def close(self) -> None:
+        if self.queue is not None and self.pid == os.getpid() and self.writer.is_alive():
+            self.queue.put(_STOP)
+            self.writer.join(timeout=5)
+        super().close()
+
+
+class SharedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler, который можно делить между процессами.
+
+    Размер берётся у файла на диске, а не у своего потока, ротация идёт
+    под flock на ``<filename>.lock``, а файл, переименованный другим
+    процессом, переоткрывается перед записью.
+    """
+
+    def __init__(self, filename, maxBytes: int = 0, backupCount: int = 0, encoding=None, errors=None):
+        super().__init__(
+            filename, maxBytes=maxBytes, backupCount=backupCount,
+            encoding=encoding, delay=True, errors=errors,
+        )
+        self.lock_filename = self.baseFilename + ".lock"
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is None:
+            yield
+            return
+        # файл открывается на каждую пачку: дескриптор, унаследованный
+        # через fork(), делил бы одну блокировку между родителем и воркером
+        with open(self.lock_filename, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _file_size(self) -> int:
+        try:
+            return os.stat(self.baseFilename).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _reopen_if_rotated(self) -> None:
+        if self.stream is None:
+            return
+        try:
+            rotated = os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            rotated = True
+        if rotated:
+            self.stream.close()
+            self.stream = None
+
+    def emit_batch(self, records: list) -> None:
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record) + self.terminator)
+            except Exception:
+                self.handleError(record)
+        if not lines:
+            return
+        data = "".join(lines)
+        with self.lock, self._file_lock():
+            try:
+                self._reopen_if_rotated()
+                size = self._file_size()
+                if self.maxBytes and size and size + len(data.encode(self.encoding or "utf-8")) > self.maxBytes:
+                    self.doRollover()
+                if self.stream is None:
+                    self.stream = self._open()
+                self.stream.write(data)
+                self.stream.flush()
+            except Exception:
+                self.handleError(records[0])
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.emit_batch([record])
+
+
+# атрибуты, которые есть у любой записи; остальное пришло через extra
+_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна запись — одна строка JSON: время, уровень, логгер, сообщение
+    и поля из ``extra``.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in record.__dict__.items():
+            if name not in _RECORD_ATTRS:
+                data[name] = value
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+access_log = logging.getLogger("mysite.access")
+
+
+class AccessLogMiddleware:
+    """
+    Пишет в логгер ``mysite.access`` строку на каждый запрос.
+    Если логгер выключен (уровень выше INFO), ничего не делает.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not access_log.isEnabledFor(logging.INFO):
+            return self.get_response(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.log(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not access_log.isEnabledFor(logging.INFO):
+            return await self.get_response(request)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.log(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def log(request, response, duration: float) -> None:
+        # модуль загружается из settings, когда Django ещё не настроен
+        from .metrics import MetricsMiddleware
+
+        access_log.info(
+            "%s %s %s", request.method, request.get_full_path(), response.status_code,
+            extra={
+                "method": request.method,
+                "path": request.get_full_path(),
+                "route": MetricsMiddleware.get_route(request),
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "size": None if response.streaming else len(response.content),
+                "remote_addr": request.META.get("REMOTE_ADDR"),
+                "user_agent": request.META.get("HTTP_USER_AGENT", ""),
+            },
+        )
@@ -0,0 +1,407 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Каждый процесс копит счётчики и гистограммы в памяти (запись — это
+обновление словаря под локом) и не чаще раза в ``METRICS_FLUSH_INTERVAL``
+секунд сбрасывает их в свой файл ``METRICS_DIR/metrics-<pid>.json``.
+``/metrics`` складывает файлы всех воркеров gunicorn, поэтому видны общие
+цифры, а не одного процесса. Файлы завершившихся воркеров при сборе
+переносятся в общий ``metrics-dead.json``: счётчики не убывают, а файлы
+не копятся.
+
+``/metrics`` открыт персоналу, по ``Authorization: Bearer <METRICS_TOKEN>``
+и адресам из ``METRICS_ALLOWED_IPS``. Адрес определяется как в
+:mod:`mysite.ratelimit`; запрос, пришедший через прокси не из
+``RATELIMIT_TRUSTED_PROXIES``, по адресу не пускается — иначе за nginx
+на том же хосте все клиенты выглядят как 127.0.0.1.
+
+Что пишется:
+
+* ``MetricsMiddleware`` — запросы, задержка и размер ответа по маршруту
+  (имя URL), число и время SQL-запросов;
+* кеш-бэкенды из :mod:`mysite.cache_backends` — попадания и промахи.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from contextlib import suppress
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки
+    fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# имя -> (тип, описание, границы корзин для гистограмм)
+METRICS = {
+    "django_http_requests_total": (
+        "counter", "HTTP responses by route, method and status", None,
+    ),
+    "django_http_request_duration_seconds": (
+        "histogram", "Request latency by route", LATENCY_BUCKETS,
+    ),
+    "django_http_response_size_bytes": (
+        "histogram", "Response body size by route", SIZE_BUCKETS,
+    ),
+    "django_http_exceptions_total": (
+        "counter", "Unhandled view exceptions by route and type", None,
+    ),
+    "django_db_queries_total": (
+        "counter", "SQL queries by route and database alias", None,
+    ),
+    "django_db_query_duration_seconds_total": (
+        "counter", "Time spent in SQL queries by route and database alias", None,
+    ),
+    "django_cache_requests_total": (
+        "counter", "Cache lookups by tier and result (hit or miss)", None,
+    ),
+}
+
+UNRESOLVED_ROUTE = "<unresolved>"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.flushed_at = 0.0
+        # (имя, метки) -> число; для гистограмм [корзины..., сумма, количество]
+        self.values = {}
+
+    def _check_fork(self):
+        # после fork() воркер начинает свои счётчики с нуля
+        if self.pid != os.getpid():
+            self.pid = os.getpid()
+            self.values = {}
+            self.flushed_at = 0.0
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            self.values[key] = self.values.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self._check_fork()
+            series = self.values.get(key)
+            if series is None:
+                series = self.values[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    # --- хранение -----------------------------------------------------
+
+    @staticmethod
+    def directory() -> str:
+        return getattr(settings, "METRICS_DIR", os.path.join(tempfile.gettempdir(), "django_metrics"))
+
+    def maybe_flush(self) -> None:
+        interval = getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)
+        if time.monotonic() - self.flushed_at >= interval:
+            self.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._check_fork()
+            self.flushed_at = time.monotonic()
+            data = [
+                [name, list(labels), value]
+                for (name, labels), value in self.values.items()
+            ]
+        directory = self.directory()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"metrics-{self.pid}.json")
+        # запись во временный файл и rename: читатель не увидит половину файла
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+        with os.fdopen(fd, "w") as file:
+            json.dump(data, file)
+        os.replace(tmp_path, path)
+
+    def collect(self) -> dict:
+        """
+        Сумма метрик всех процессов: (имя, метки) -> значение.
+        """
+        self.flush()
+        directory = self.directory()
+        self.merge_dead(directory)
+        total = {}
+        for filename in os.listdir(directory):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                continue
+            data = _read_metrics(os.path.join(directory, filename))
+            if data is not None:
+                _add_metrics(total, data)
+        return total
+
+    @staticmethod
+    def merge_dead(directory: str) -> None:
+        """
+        Переносит файлы завершившихся процессов в ``metrics-dead.json``.
+        """
+        dead = [
+            filename for filename in os.listdir(directory)
+            if (pid := _file_pid(filename)) is not None and not _pid_alive(pid)
+        ]
+        if not dead:
+            return
+        # /metrics могут собирать несколько воркеров сразу
+        with open(os.path.join(directory, ".merge.lock"), "w") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(directory, DEAD_FILENAME)
+            total = {}
+            _add_metrics(total, _read_metrics(archive_path) or [])
+            merged = []
+            for filename in dead:
+                path = os.path.join(directory, filename)
+                data = _read_metrics(path)
+                if data is not None:
+                    _add_metrics(total, data)
+                    merged.append(path)
+            if not merged:
+                return
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".metrics-")
+            with os.fdopen(fd, "w") as file:
+                json.dump([[name, list(labels), value] for (name, labels), value in total.items()], file)
+            os.replace(tmp_path, archive_path)
+            for path in merged:
+                # без flock файл мог забрать соседний воркер
+                with suppress(FileNotFoundError):
+                    os.remove(path)
+
+    def render(self) -> str:
+        """
+        Текстовый формат Prometheus (version 0.0.4).
+        """
+        by_name = defaultdict(list)
+        for (name, labels), value in sorted(self.collect().items()):
+            by_name[name].append((labels, value))
+
+        lines = []
+        for name, (kind, description, buckets) in METRICS.items():
+            if name not in by_name:
+                continue
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in by_name[name]:
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                # корзины хранятся по отдельности, а в Prometheus накопительные
+                cumulative = 0
+                for bound, count in zip(buckets, value[:-2]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', repr(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(labels)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+DEAD_FILENAME = "metrics-dead.json"
+
+
+def _file_pid(filename: str):
+    if not (filename.startswith("metrics-") and filename.endswith(".json")):
+        return None
+    pid = filename[len("metrics-"):-len(".json")]
+    return int(pid) if pid.isdigit() else None
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_metrics(path: str):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _add_metrics(total: dict, data) -> None:
+    for name, labels, value in data:
+        key = (name, tuple(tuple(pair) for pair in labels))
+        if isinstance(value, list):
+            current = total.setdefault(key, [0] * len(value))
+            for index, item in enumerate(value):
+                current[index] += item
+        else:
+            total[key] = total.get(key, 0) + value
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = MetricsRegistry()
+
+
+def record_cache_lookup(tier: str, hits: int, misses: int) -> None:
+    if hits:
+        registry.inc("django_cache_requests_total", hits, tier=tier, result="hit")
+    if misses:
+        registry.inc("django_cache_requests_total", misses, tier=tier, result="miss")
+
+
+# статистика SQL текущего запроса: alias -> [число, время]; None вне запроса
+_query_stats = ContextVar("query_stats", default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        alias_stats = stats[context["connection"].alias]
+        alias_stats[0] += 1
+        alias_stats[1] += time.perf_counter() - started
+
+
+def _install_query_recorder(connection) -> None:
+    # обёртка стоит на соединении постоянно, а статистику берёт из контекста
+    # запроса: так считаются и запросы async ORM, которые идут в другом потоке
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+@receiver(connection_created)
+def _on_connection_created(sender, connection, **kwargs):
+    _install_query_recorder(connection)
+
+
+class MetricsMiddleware:
+    """
+    Замеряет каждый запрос. Ставится первым в MIDDLEWARE,
+    чтобы в задержку попало время остальных middleware.
+    Работает и в синхронном, и в асинхронном стеке.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # соединения, открытые до загрузки модуля, сигнал не застал
+        for alias in connections:
+            _install_query_recorder(connections[alias])
+        stats = defaultdict(lambda: [0, 0.0])
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    async def __acall__(self, request: HttpRequest):
+        stats = defaultdict(lambda: [0, 0.0])
+        token = _query_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _query_stats.reset(token)
+        self.record(request, response, time.perf_counter() - started, stats)
+        return response
+
+    def record(self, request: HttpRequest, response, duration: float, queries: dict) -> None:
+        route = self.get_route(request)
+        registry.inc(
+            "django_http_requests_total",
+            route=route, method=request.method, status=response.status_code,
+        )
+        registry.observe("django_http_request_duration_seconds", duration, route=route)
+        if not response.streaming:
+            registry.observe("django_http_response_size_bytes", len(response.content), route=route)
+        for alias, (count, spent) in queries.items():
+            registry.inc("django_db_queries_total", count, route=route, alias=alias)
+            registry.inc("django_db_query_duration_seconds_total", spent, route=route, alias=alias)
+        registry.maybe_flush()
+
+    def process_exception(self, request: HttpRequest, exception: Exception):
+        registry.inc(
+            "django_http_exceptions_total",
+            route=self.get_route(request), exception=type(exception).__name__,
+        )
+
+    @staticmethod
+    def get_route(request: HttpRequest) -> str:
+        # имя URL, а не путь: у /shop/products/1/ и /shop/products/2/ один маршрут
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return UNRESOLVED_ROUTE
+        return match.view_name or match._func_path
+
+
+def metrics_allowed(request: HttpRequest) -> bool:
+    # cache_backends импортирует этот модуль раньше, чем готов DRF
+    from .ratelimit import get_client_ip
+
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if token and constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return True
+    user = getattr(request, "user", None)
+    if user is not None and user.is_staff:
+        return True
+    allowed = getattr(settings, "METRICS_ALLOWED_IPS", None)
+    if allowed is None:
+        return True
+    trusted = getattr(settings, "RATELIMIT_TRUSTED_PROXIES", [])
+    if "HTTP_X_FORWARDED_FOR" in request.META and request.META.get("REMOTE_ADDR") not in trusted:
+        # пришёл через неизвестный прокси: настоящий адрес не узнать
+        return False
+    return get_client_ip(request) in allowed
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,179 @@
+"""
+Запросы под сериализаторы DRF без N+1.
+
+``optimize_queryset`` смотрит на поля сериализатора и сам добавляет
+к queryset ``select_related`` (FK и вложенные сериализаторы), ``prefetch_related``
+(M2M и обратные связи, в том числе списки pk) и ``only()`` (если все поля
+сериализатора — поля модели). ``QueryOptimizationMixin`` делает это
+в ``get_queryset`` любого GenericAPIView.
+
+Проверка N+1: при ``N_PLUS_ONE_CHECK = True`` (по умолчанию равно DEBUG)
+запрос к API падает с ``NPlusOneError``, если один и тот же SQL
+выполнился ``N_PLUS_ONE_THRESHOLD`` раз и больше.
+"""
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Prefetch, QuerySet
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+N_PLUS_ONE_THRESHOLD = 5
+
+
+class NPlusOneError(AssertionError):
+    pass
+
+
+class _QueryPlan:
+    def __init__(self):
+        self.select = set()
+        self.prefetch = {}
+        # None — нужны все колонки (есть поле не из модели)
+        self.only: Optional[set] = set()
+
+    def use_all_columns(self):
+        self.only = None
+
+    def add_column(self, name: str):
+        if self.only is not None:
+            self.only.add(name)
+
+
+def _plan(serializer: BaseSerializer, model, prefix: str = "") -> _QueryPlan:
+    plan = _QueryPlan()
+    plan.add_column(model._meta.pk.name)
+    for field in serializer.fields.values():
+        if field.write_only:
+            continue
+        if not field.source_attrs:
+            # source="*" и SerializerMethodField: неизвестно, что они читают
+            plan.use_all_columns()
+            continue
+        _plan_field(plan, field, model, prefix)
+    return plan
+
+
+def get_model_field(model, attr: str):
+    """
+    Поле модели по имени атрибута: ``pk``, поле или обратная связь; иначе None.
+    """
+    if attr == "pk":
+        return model._meta.pk
+    try:
+        return model._meta.get_field(attr)
+    except FieldDoesNotExist:
+        pass
+    # обратная связь по имени атрибута: order_set, а не order
+    for relation in model._meta.related_objects:
+        if relation.get_accessor_name() == attr:
+            return relation
+    return None
+
+
+def _plan_field(plan: _QueryPlan, field, model, prefix: str) -> None:
+    current = model
+    path = []
+    for index, attr in enumerate(field.source_attrs):
+        last = index == len(field.source_attrs) - 1
+        model_field = get_model_field(current, attr)
+        if model_field is None:
+            # свойство или метод модели
+            if current is model:
+                plan.use_all_columns()
+            return
+        path.append(attr)
+        if current is model and model_field.concrete and not model_field.many_to_many:
+            plan.add_column(attr)
+        if not model_field.is_relation:
+            return
+
+        lookup = prefix + "__".join(path)
+        related = model_field.related_model
+        if model_field.many_to_many or model_field.one_to_many:
+            plan.prefetch[lookup] = Prefetch(lookup, queryset=_related_queryset(field, model_field, related, last))
+            return
+        if last and isinstance(field, RelatedField) and field.use_pk_only_optimization():
+            # PrimaryKeyRelatedField читает user_id, сам объект не нужен
+            return
+        plan.select.add(lookup)
+        if last and isinstance(field, BaseSerializer):
+            nested = _plan(field, related, prefix=lookup + "__")
+            plan.select.update(nested.select)
+            plan.prefetch.update(nested.prefetch)
+        current = related
+
+
+def _related_queryset(field, model_field, related, last: bool) -> QuerySet:
+    queryset = related._default_manager.all()
+    if last and isinstance(field, ListSerializer):
+        queryset = optimize_queryset(queryset, field.child)
+    elif last and isinstance(field, ManyRelatedField) and field.child_relation.use_pk_only_optimization():
+        queryset = queryset.only(related._meta.pk.name)
+    else:
+        return queryset
+    names, defer = queryset.query.deferred_loading
+    if model_field.one_to_many and names and not defer:
+        # обратному FK нужна колонка связи, чтобы разложить объекты по родителям
+        queryset = queryset.only(*names, model_field.field.name)
+    return queryset
+
+
+def optimize_queryset(queryset: QuerySet, serializer) -> QuerySet:
+    """
+    Добавляет к queryset select_related, prefetch_related и only()
+    по полям ``serializer`` (класса или экземпляра).
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    plan = _plan(serializer, queryset.model)
+    if plan.select:
+        queryset = queryset.select_related(*sorted(plan.select))
+    if plan.prefetch:
+        queryset = queryset.prefetch_related(*plan.prefetch.values())
+    if plan.only is not None:
+        queryset = queryset.only(*sorted(plan.only))
+    return queryset
+
+
+@contextmanager
+def detect_n_plus_one(threshold: int = N_PLUS_ONE_THRESHOLD):
+    """
+    Падает с NPlusOneError, если внутри блока один и тот же SQL
+    (с точностью до параметров) выполнился ``threshold`` раз и больше.
+    """
+    counter = Counter()
+
+    def count(execute, sql, params, many, context):
+        counter[sql] += 1
+        return execute(sql, params, many, context)
+
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(count))
+        yield counter
+
+    repeated = [(sql, times) for sql, times in counter.items() if times >= threshold]
+    if repeated:
+        sql, times = max(repeated, key=lambda item: item[1])
+        raise NPlusOneError(f"Possible N+1: query executed {times} times: {sql}")
+
+
+class QueryOptimizationMixin:
+    """
+    Для GenericAPIView: queryset подгоняется под serializer_class,
+    а при N_PLUS_ONE_CHECK каждый запрос проверяется на N+1.
+    """
+
+    def get_queryset(self):
+        return optimize_queryset(super().get_queryset(), self.get_serializer_class())
+
+    def dispatch(self, request, *args, **kwargs):
+        if not getattr(settings, "N_PLUS_ONE_CHECK", settings.DEBUG):
+            return super().dispatch(request, *args, **kwargs)
+        with detect_n_plus_one(getattr(settings, "N_PLUS_ONE_THRESHOLD", N_PLUS_ONE_THRESHOLD)):
+            return super().dispatch(request, *args, **kwargs)
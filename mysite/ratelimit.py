@@ -0,0 +1,269 @@
+"""
+Ограничение частоты запросов.
+
+Счётчики — скользящее окно (текущее окно плюс доля предыдущего) в общем
+кеше: ``cache.incr`` атомарен, поэтому лимит общий для всех воркеров.
+Клиент, который уже упёрся в лимит, запоминается в небольшом LRU внутри
+процесса до конца блокировки, так что его повторные запросы не ходят в кеш.
+
+Правила задаются в ``RATELIMITS``: ключ — имя URL, ``namespace:*`` или
+``*``, значение — лимиты по типу клиента ``anon``/``user``/``staff``
+(``staff`` по умолчанию берёт лимит ``user``) и, если нужно, ``methods`` —
+какие методы HTTP считать (по умолчанию все)::
+
+    RATELIMITS = {
+        "myauth:login": {"anon": "20/m", "methods": ["POST"]},
+        "shopapp:*": {"anon": "30/m", "methods": ["POST", "PUT", "PATCH", "DELETE"]},
+    }
+
+Каждый учтённый запрос — запись в общий кеш, поэтому правило ``*`` на
+весь сайт лучше не заводить.
+
+Счётчик заводится на правило и клиента: пользователя по pk, анонима по IP.
+``X-Forwarded-For`` учитывается, только если запрос пришёл от прокси
+из ``RATELIMIT_TRUSTED_PROXIES``. Если список пуст, а запросы приходят
+с локального или внутреннего адреса, в лог пишется предупреждение:
+похоже, перед сайтом прокси и все клиенты делят один счётчик.
+
+Обычные представления ограничивает ``RateLimitMiddleware``, представления
+DRF — ``RateLimitThrottle``: там пользователь известен только после
+аутентификации DRF (токен, basic).
+"""
+import ipaddress
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, JsonResponse
+from rest_framework.throttling import BaseThrottle
+
+log = logging.getLogger(__name__)
+
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+LOCAL_MAX_KEYS = 10_000
+
+
+@dataclass(frozen=True)
+class Rate:
+    limit: int
+    period: int
+
+    @classmethod
+    def parse(cls, rate: str) -> "Rate":
+        """
+        "100/m" -> Rate(100, 60); как у DRF, по первой букве периода.
+        """
+        limit, period = rate.split("/")
+        return cls(int(limit), PERIODS[period.strip()[0]])
+
+
+@dataclass
+class RateLimitResult:
+    allowed: bool
+    retry_after: float = 0
+
+
+class RateLimiter:
+    def __init__(self, cache_alias: str = "default", local_max_keys: int = LOCAL_MAX_KEYS):
+        self.cache_alias = cache_alias
+        self.local_max_keys = local_max_keys
+        self.lock = threading.Lock()
+        # ключ -> time.time(), до которого клиент заблокирован
+        self.blocked = OrderedDict()
+
+    def _blocked_until(self, key: str, now: float) -> Optional[float]:
+        with self.lock:
+            until = self.blocked.get(key)
+            if until is None:
+                return None
+            if until <= now:
+                del self.blocked[key]
+                return None
+            self.blocked.move_to_end(key)
+            return until
+
+    def _block(self, key: str, until: float) -> None:
+        with self.lock:
+            self.blocked[key] = until
+            self.blocked.move_to_end(key)
+            while len(self.blocked) > self.local_max_keys:
+                self.blocked.popitem(last=False)
+
+    def _incr(self, cache, key: str, timeout: int) -> int:
+        try:
+            return cache.incr(key)
+        except ValueError:
+            if cache.add(key, 1, timeout):
+                return 1
+            # ключ успел создать другой процесс
+            return cache.incr(key)
+
+    def hit(self, key: str, rate: Rate) -> RateLimitResult:
+        now = time.time()
+        until = self._blocked_until(key, now)
+        if until is not None:
+            return RateLimitResult(False, until - now)
+
+        window, elapsed = divmod(now, rate.period)
+        current_key = f"ratelimit:{key}:{rate.period}:{int(window)}"
+        previous_key = f"ratelimit:{key}:{rate.period}:{int(window) - 1}"
+        cache = caches[self.cache_alias]
+        try:
+            current = self._incr(cache, current_key, rate.period * 2)
+            previous = cache.get(previous_key, 0)
+        except Exception:
+            # без кеша лучше пропустить запрос, чем уронить сайт
+            log.warning("Rate limiter cache is unavailable", exc_info=True)
+            return RateLimitResult(True)
+
+        weight = 1 - elapsed / rate.period
+        if previous * weight + current <= rate.limit:
+            return RateLimitResult(True)
+
+        # когда вклад предыдущего окна упадёт достаточно или начнётся новое окно
+        if previous and current <= rate.limit:
+            retry_after = rate.period * (1 - (rate.limit - current) / previous) - elapsed
+        else:
+            retry_after = rate.period - elapsed
+        retry_after = max(retry_after, 1)
+        self._block(key, now + retry_after)
+        return RateLimitResult(False, retry_after)
+
+
+limiter = RateLimiter()
+
+
+_proxy_warning_logged = False
+
+
+def _warn_if_behind_proxy(remote_addr: str) -> None:
+    global _proxy_warning_logged
+    if _proxy_warning_logged:
+        return
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return
+    if address.is_loopback or address.is_private:
+        _proxy_warning_logged = True
+        log.warning(
+            "Request from %s and RATELIMIT_TRUSTED_PROXIES is empty: behind a proxy "
+            "all clients share its address. Set DJANGO_TRUSTED_PROXIES.",
+            remote_addr,
+        )
+
+
+def get_client_ip(request: HttpRequest) -> str:
+    remote_addr = request.META.get("REMOTE_ADDR", "")
+    trusted = getattr(settings, "RATELIMIT_TRUSTED_PROXIES", [])
+    if not trusted:
+        _warn_if_behind_proxy(remote_addr)
+    if remote_addr not in trusted:
+        return remote_addr
+    # справа налево до первого адреса, который не наш прокси
+    forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+    for address in reversed([part.strip() for part in forwarded.split(",") if part.strip()]):
+        if address not in trusted:
+            return address
+    return remote_addr
+
+
+def get_rule(route: Optional[str]):
+    """
+    Имя правила и его лимиты для маршрута; (None, None), если правила нет.
+    """
+    rules = getattr(settings, "RATELIMITS", {})
+    candidates = []
+    if route:
+        candidates.append(route)
+        if ":" in route:
+            candidates.append(route.rsplit(":", 1)[0] + ":*")
+    candidates.append("*")
+    for name in candidates:
+        if name in rules:
+            return name, rules[name]
+    return None, None
+
+
+def check_request(request, route: Optional[str]) -> RateLimitResult:
+    if not getattr(settings, "RATELIMIT_ENABLED", True):
+        return RateLimitResult(True)
+    name, rates = get_rule(route)
+    if rates is None:
+        return RateLimitResult(True)
+    methods = rates.get("methods")
+    if methods is not None and request.method not in methods:
+        return RateLimitResult(True)
+
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        kind = "staff" if user.is_staff and "staff" in rates else "user"
+        client = f"user:{user.pk}"
+    else:
+        kind = "anon"
+        client = f"ip:{get_client_ip(request)}"
+    rate = rates.get(kind)
+    if rate is None:
+        return RateLimitResult(True)
+    return limiter.hit(f"{name}:{client}", Rate.parse(rate))
+
+
+def _route(request) -> Optional[str]:
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None else None
+
+
+class RateLimitMiddleware:
+    """
+    Ограничивает обычные представления Django; для DRF см. RateLimitThrottle.
+    Проверка идёт в process_view, который Django сам переводит
+    в поток, если стек асинхронный.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request: HttpRequest):
+        return self.get_response(request)
+
+    def process_view(self, request: HttpRequest, view_func, view_args, view_kwargs):
+        # модуль импортируется из настроек DRF, пока rest_framework.views
+        # ещё загружается, поэтому APIView берётся здесь
+        from rest_framework.views import APIView
+
+        view_class = getattr(view_func, "cls", None)
+        if isinstance(view_class, type) and issubclass(view_class, APIView):
+            return None
+        result = check_request(request, _route(request))
+        if result.allowed:
+            return None
+        response = JsonResponse(
+            {"error": "Too many requests. Please wait before trying again."},
+            status=429,
+        )
+        response["Retry-After"] = str(math.ceil(result.retry_after))
+        return response
+
+
+class RateLimitThrottle(BaseThrottle):
+    """
+    Throttle DRF по тем же правилам RATELIMITS.
+    """
+
+    def allow_request(self, request, view) -> bool:
+        self.result = check_request(request, _route(request))
+        return self.result.allowed
+
+    def wait(self) -> Optional[float]:
+        return self.result.retry_after
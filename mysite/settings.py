@@ -83,20 +83,24 @@ INSTALLED_APPS = [
     'myauth.apps.MyauthConfig',
     'myapiapp.apps.MyapiappConfig',
     'blogapp.apps.BlogappConfig',
+    'jobsapp.apps.JobsappConfig',
 ]
 
 MIDDLEWARE = [
+    'mysite.metrics.MetricsMiddleware',
+    'mysite.log_queue.AccessLogMiddleware',
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'mysite.db_router.PrimaryPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mysite.ratelimit.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'requestdataapp.middlewares.set_useragent_on_request_middleware',
-    'requestdataapp.middlewares.CountRequestMiddleware',
     'django.contrib.admindocs.middleware.XViewMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     # 'django.middleware.cache.FetchFromCacheMiddleware',
@@ -122,23 +126,72 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'mysite.wsgi.application'
 
+TEST_RUNNER = 'mysite.test_runner.TestRunner'
+
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# mysite.sqlite_backend: WAL, busy_timeout и BEGIN IMMEDIATE, чтобы воркеры
+# gunicorn не получали "database is locked". Соединение живёт между
+# запросами; под ASGI (mysite/asgi.py) постоянные соединения выключены.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'mysite.sqlite_backend',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': int(getenv("DJANGO_CONN_MAX_AGE", "600")),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# реплики только для чтения (см. mysite.db_router): пути к файлам SQLite
+# через запятую, локально их обновляет manage.py sync_replica
+for _index, _name in enumerate(filter(None, getenv("DJANGO_DB_REPLICAS", "").split(","))):
+    DATABASES[f'replica{_index + 1}'] = {
+        **DATABASES['default'],
+        'NAME': _name,
+        # в тестах реплика — та же база, что и default; TestCase пускает
+        # только в default, поэтому тесты запускаются без DJANGO_DB_REPLICAS
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['mysite.db_router.PrimaryReplicaRouter']
+# сколько секунд после записи клиент читает из default; должно быть
+# больше отставания реплики
+DATABASE_PIN_SECONDS = 10
+
 CACHES = {
     "default": {
         # "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
-        "LOCATION": "/var/tmp/django_cache",
+        # "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        # "LOCATION": "/var/tmp/django_cache",
+        "BACKEND": "mysite.cache_backends.TwoTierCache",
+        "LOCATION": "shared",
+        "OPTIONS": {
+            # горячие ключи, которые держим в памяти процесса
+            "LOCAL_KEY_PREFIXES": [
+                "tag-version:",
+                "products_data_export:",
+                "user_orders_export_",
+            ],
+            "LOCAL_MAX_ENTRIES": 256,
+            "LOCAL_TIMEOUT": 30,
+            "GENERATION_CHECK_INTERVAL": 1,
+        },
+    },
+    "shared": {
+        "BACKEND": "mysite.cache_backends.ShardedSQLiteCache",
+        "LOCATION": getenv("DJANGO_CACHE_DIR", "/var/tmp/django_sqlite_cache"),
         # "LOCATION": "c:/foo/bar", # для запуска на винде
+        "OPTIONS": {
+            "SHARDS": 8,
+            "MAX_ENTRIES": 100_000,
+            "MAX_SIZE": 512 * 1024 * 1024,
+        },
     },
 }
 
@@ -200,6 +253,33 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 # DEFAULT_FILE_STORAGE =
+# одинаковые файлы хранятся один раз (см. mysite.storage, dedup_media)
+STORAGES = {
+    "default": {
+        "BACKEND": "mysite.storage.DedupFileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
+# входные файлы и результаты фоновых задач (jobsapp): вне MEDIA_ROOT,
+# результат отдаёт только jobsapp:job_result с проверкой доступа
+JOB_FILES_ROOT = getenv("DJANGO_JOB_FILES_DIR", str(BASE_DIR / 'job_files'))
+
+# requestdataapp.uploads: загрузка по частям с докачкой; временный каталог
+# лучше держать на том же диске, что и MEDIA_ROOT, — тогда готовый файл
+# переносится переименованием
+CHUNKED_UPLOAD_TEMP_DIR = getenv("DJANGO_CHUNKED_UPLOAD_DIR", "/var/tmp/django_uploads")
+CHUNKED_UPLOAD_MAX_SIZE = 2 * 1024 ** 3
+CHUNKED_UPLOAD_ANON_MAX_SIZE = 100 * 1024 ** 2
+# незавершённые загрузки: (число, суммарный заявленный размер) на
+# пользователя и на всех анонимов вместе
+CHUNKED_UPLOAD_USER_QUOTA = (20, 10 * 1024 ** 3)
+CHUNKED_UPLOAD_ANON_QUOTA = (50, 1024 ** 3)
+CHUNKED_UPLOAD_MAX_CHUNK = 64 * 1024 ** 2
+# через сколько секунд брошенная загрузка удаляется (cleanup_uploads)
+CHUNKED_UPLOAD_EXPIRE = 24 * 60 * 60
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
@@ -210,6 +290,41 @@ LOGIN_REDIRECT_URL = reverse_lazy('myauth:about-me')
 LOGIN_URL = reverse_lazy('myauth:login')
 # LOGOUT_REDIRECT_URL = '/auth/login/'
 
+# асинхронные версии страниц на чтение; mysite/asgi.py включает их сам
+ASYNC_VIEWS = getenv("DJANGO_ASYNC_VIEWS", "0") == "1"
+
+# QueryOptimizationMixin: падать на N+1 в API (см. mysite.query_optimization)
+N_PLUS_ONE_CHECK = DEBUG
+N_PLUS_ONE_THRESHOLD = 5
+
+# MetricsMiddleware и /metrics (см. mysite.metrics): каталог общий для всех воркеров
+METRICS_DIR = getenv("DJANGO_METRICS_DIR", "/var/tmp/django_metrics")
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_ALLOWED_IPS = getenv("DJANGO_METRICS_ALLOWED_IPS", "127.0.0.1").split(",")
+# для Prometheus за прокси: scrape с заголовком Authorization: Bearer <токен>
+METRICS_TOKEN = getenv("DJANGO_METRICS_TOKEN", "")
+
+# mysite.ratelimit: лимиты по имени URL, "namespace:*" или "*" для всех
+# счётчики живут в общем кеше на диске и переживают тесты, поэтому в
+# в manage.py test лимиты выключает mysite.test_runner.TestRunner
+RATELIMIT_ENABLED = getenv("DJANGO_RATELIMIT_ENABLED", "1") == "1"
+# общего правила "*" нет: счётчик — это запись в кеш на каждый запрос,
+# поэтому ограничиваем только то, что дорого или опасно
+_WRITE_METHODS = ["POST", "PUT", "PATCH", "DELETE"]
+RATELIMITS = {
+    "myauth:login": {"anon": "20/m", "methods": ["POST"]},
+    "myauth:register": {"anon": "10/m", "methods": ["POST"]},
+    "file-upload": {"anon": "10/m", "user": "60/m", "methods": ["POST"]},
+    "chunked-upload-create": {"anon": "10/m", "user": "60/m", "methods": ["POST"]},
+    # чанков у одной загрузки много
+    "chunked-upload": {"anon": "600/m", "user": "1200/m", "methods": ["PATCH"]},
+    # формы и API магазина на запись
+    "shopapp:*": {"anon": "30/m", "user": "120/m", "methods": _WRITE_METHODS},
+}
+# адреса своих прокси: только от них принимаем X-Forwarded-For; за nginx
+# без этого все анонимы делят один счётчик с адресом прокси
+RATELIMIT_TRUSTED_PROXIES = [ip for ip in getenv("DJANGO_TRUSTED_PROXIES", "").split(",") if ip]
+
 REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 10,
@@ -217,6 +332,9 @@ REST_FRAMEWORK = {
         "django_filters.rest_framework.DjangoFilterBackend",
     ],
     "DEFAULT_SCHEMA_CLASS": 'drf_spectacular.openapi.AutoSchema',
+    "DEFAULT_THROTTLE_CLASSES": [
+        "mysite.ratelimit.RateLimitThrottle",
+    ],
 }
 
 SPECTACULAR_SETTINGS = {
@@ -233,6 +351,45 @@ LOGFILE_COUNT = 3
 
 
 LOGLEVEL = getenv("DJANGO_LOGLEVEL", "info").upper()
+# access-лог в JSONL (см. mysite.log_queue); пустое имя — выключен
+ACCESS_LOG_NAME = getenv("DJANGO_ACCESS_LOG", "")
+
+LOGGING_HANDLERS = {
+    'console': {
+        'class': 'logging.StreamHandler',
+        'formatter': 'console',
+    },
+    'logfile': {
+        'class': 'mysite.log_queue.SharedRotatingFileHandler',
+        'filename': LOGFILE_NAME,
+        'maxBytes': LOGFILE_SIZE,
+        'backupCount': LOGFILE_COUNT,
+        'formatter': 'verbose',
+    },
+    # запись в консоль и файл идёт из отдельного потока
+    'queue': {
+        'class': 'mysite.log_queue.QueuedHandler',
+        'handlers': ['console', 'logfile'],
+    },
+}
+ACCESS_LOGGER = {
+    'handlers': [],
+    'level': 'WARNING',
+    'propagate': False,
+}
+if ACCESS_LOG_NAME:
+    LOGGING_HANDLERS['accesslog'] = {
+        'class': 'mysite.log_queue.SharedRotatingFileHandler',
+        'filename': ACCESS_LOG_NAME,
+        'maxBytes': 50 * 1024 * 1024,
+        'backupCount': 5,
+        'formatter': 'json',
+    }
+    LOGGING_HANDLERS['accesslog_queue'] = {
+        'class': 'mysite.log_queue.QueuedHandler',
+        'handlers': ['accesslog'],
+    }
+    ACCESS_LOGGER.update(handlers=['accesslog_queue'], level='INFO')
 
 logging.config.dictConfig({
     'version': 1,
@@ -244,25 +401,18 @@ logging.config.dictConfig({
         'console': {
             'format': '%(asctime)s %(levelname)s [%(name)s:%(lineno)s] %(module)s %(message)s',
         },
-    },
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'console',
-        },
-        'logfile': {
-            'class': 'logging.handlers.RotatingFileHandler',
-            'filename': LOGFILE_NAME,
-            'maxBytes': LOGFILE_SIZE,
-            'backupCount': LOGFILE_COUNT,
-            'formatter': 'verbose',
+        'json': {
+            '()': 'mysite.log_queue.JsonFormatter',
         },
     },
+    'handlers': LOGGING_HANDLERS,
+    'loggers': {
+        'mysite.access': ACCESS_LOGGER,
+    },
     'root': {
         'handlers': [
-            'console',
-            'logfile',
+            'queue',
         ],
         'level': LOGLEVEL,
     },
-})
\ No newline at end of file
+})
@@ -0,0 +1,222 @@
+"""
+Хранилище медиафайлов с дедупликацией по содержимому.
+
+Каждое уникальное содержимое лежит один раз — блобом
+``MEDIA_ROOT/.blobs/ab/cd/<sha256>``. Имена, которые выдаёт ``upload_to``
+(``products/product_1/images/photo.png`` и т. п.), остаются как были,
+но это жёсткие ссылки на блоб: MEDIA_URL, веб-сервер и бэкапы видят
+обычные файлы, а место на диске занимает одна копия.
+
+Счётчик ссылок ведёт сама файловая система: ``st_nlink`` блоба — это
+число имён плюс сам блоб. Когда удаляется последнее имя, удаляется и блоб.
+Запись в уже сохранённый файл через ``open(name, "wb")`` сначала отвязывает
+его от блоба, так что остальные имена не меняются.
+
+Если файловая система не поддерживает жёсткие ссылки (или у блоба
+кончился лимит ссылок), файл просто копируется — как в FileSystemStorage.
+
+Уже накопленные дубликаты склеивает команда ``dedup_media``.
+"""
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import time
+import uuid
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIR = '.blobs'
+READ_SIZE = 64 * 1024
+# временные файлы старше этого считаются брошенными после сбоя
+TEMP_MAX_AGE = 60 * 60
+# ошибки os.link, при которых вместо ссылки делаем копию
+LINK_ERRORS = {errno.EMLINK, errno.EXDEV, errno.EPERM, errno.ENOTSUP}
+
+
+def file_sha256(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        while data := file.read(READ_SIZE):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+class DedupFileSystemStorage(FileSystemStorage):
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.location, BLOB_DIR, digest[:2], digest[2:4], digest)
+
+    def references(self, name: str) -> int:
+        """
+        Сколько имён ссылаются на то же содержимое, что и ``name``.
+        """
+        return max(os.stat(self.path(name)).st_nlink - 1, 1)
+
+    def _makedirs(self, directory: str) -> None:
+        try:
+            if self.directory_permissions_mode is not None:
+                old_umask = os.umask(0o777 & ~self.directory_permissions_mode)
+                try:
+                    os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+                finally:
+                    os.umask(old_umask)
+            else:
+                os.makedirs(directory, exist_ok=True)
+        except FileExistsError:
+            raise FileExistsError('%s exists and is not a directory.' % directory)
+
+    def _write_temp(self, content):
+        """
+        Кладёт содержимое во временный файл рядом с блобами, возвращает
+        (путь, sha256).
+        """
+        temp_dir = os.path.join(self.location, BLOB_DIR, 'tmp')
+        self._makedirs(temp_dir)
+        temp_path = os.path.join(temp_dir, uuid.uuid4().hex)
+        if hasattr(content, 'temporary_file_path'):
+            # файл уже на диске: переносим и хешируем одним чтением
+            file_move_safe(content.temporary_file_path(), temp_path)
+            return temp_path, file_sha256(temp_path)
+
+        hasher = hashlib.sha256()
+        with open(temp_path, 'xb') as file:
+            for chunk in content.chunks():
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                file.write(chunk)
+                hasher.update(chunk)
+        return temp_path, hasher.hexdigest()
+
+    def _publish_blob(self, temp_path: str, blob: str) -> None:
+        self._makedirs(os.path.dirname(blob))
+        try:
+            os.link(temp_path, blob)
+        except FileExistsError:
+            # такое содержимое уже есть
+            pass
+        else:
+            if self.file_permissions_mode is not None:
+                os.chmod(blob, self.file_permissions_mode)
+
+    def _link_or_copy(self, source: str, full_path: str) -> None:
+        try:
+            os.link(source, full_path)
+        except OSError as error:
+            if error.errno not in LINK_ERRORS:
+                raise
+            with open(source, 'rb') as src, open(full_path, 'xb') as dst:
+                shutil.copyfileobj(src, dst, READ_SIZE)
+
+    def _save(self, name, content):
+        temp_path, digest = self._write_temp(content)
+        blob = self.blob_path(digest)
+        try:
+            while True:
+                self._publish_blob(temp_path, blob)
+                full_path = self.path(name)
+                self._makedirs(os.path.dirname(full_path))
+                try:
+                    self._link_or_copy(blob, full_path)
+                except FileExistsError:
+                    name = self.get_available_name(name)
+                except FileNotFoundError:
+                    # блоб удалили вместе с последней ссылкой, пока мы его не
+                    # успели взять: опубликуем заново
+                    continue
+                else:
+                    break
+        finally:
+            os.remove(temp_path)
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        name = os.path.relpath(full_path, self.location)
+        self._ensure_location_group_id(full_path)
+        return str(name).replace('\\', '/')
+
+    def _open(self, name, mode='rb'):
+        if any(flag in mode for flag in 'wa+'):
+            self._detach(self.path(name))
+        return super()._open(name, mode)
+
+    def _detach(self, path: str) -> None:
+        # копия при записи: блоб и другие имена не должны измениться
+        try:
+            if os.stat(path).st_nlink < 2:
+                return
+        except FileNotFoundError:
+            return
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        shutil.copy2(path, temp_path)
+        os.replace(temp_path, path)
+
+    def delete(self, name):
+        path = self.path(name)
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return
+        if stat.S_ISREG(st.st_mode) and st.st_nlink == 2:
+            # последнее имя: вместе с ним уходит и блоб; хешируем только тут,
+            # удаление — редкая операция
+            blob = self.blob_path(file_sha256(path))
+            try:
+                if os.stat(blob).st_ino == st.st_ino:
+                    os.remove(blob)
+            except FileNotFoundError:
+                pass
+        super().delete(name)
+
+    def dedupe(self, name: str) -> int:
+        """
+        Заменяет файл ``name`` ссылкой на блоб с тем же содержимым
+        (или делает файл блобом). Возвращает число освобождённых байт.
+        """
+        path = self.path(name)
+        st = os.lstat(path)
+        if not stat.S_ISREG(st.st_mode):
+            return 0
+        blob = self.blob_path(file_sha256(path))
+        self._makedirs(os.path.dirname(blob))
+        try:
+            os.link(path, blob)
+            return 0
+        except FileExistsError:
+            pass
+        except OSError as error:
+            if error.errno not in LINK_ERRORS:
+                raise
+            return 0
+        if os.stat(blob).st_ino == st.st_ino:
+            return 0
+        # ссылка под временным именем и атомарная подмена: файл не пропадает
+        # ни на миг, даже если его сейчас читают
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            os.link(blob, temp_path)
+        except OSError as error:
+            if error.errno not in LINK_ERRORS:
+                raise
+            return 0
+        os.replace(temp_path, path)
+        # место освобождается, только если у старого файла не было других имён
+        return st.st_size if st.st_nlink == 1 else 0
+
+    def collect_garbage(self) -> int:
+        """
+        Удаляет блобы, на которые не осталось имён, и брошенные временные
+        файлы. Возвращает число освобождённых байт.
+        """
+        freed = 0
+        stale = time.time() - TEMP_MAX_AGE
+        for root, dirs, files in os.walk(os.path.join(self.location, BLOB_DIR)):
+            in_temp = os.path.basename(root) == 'tmp'
+            for file_name in files:
+                path = os.path.join(root, file_name)
+                st = os.lstat(path)
+                if st.st_nlink == 1 and (not in_temp or st.st_mtime < stale):
+                    os.remove(path)
+                    freed += st.st_size
+        return freed
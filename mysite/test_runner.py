@@ -0,0 +1,30 @@
+"""
+Раннер ``manage.py test``.
+
+Тесты не трогают рабочий кеш: общий уровень кеша живёт во временном
+каталоге, который удаляется после прогона. Лимиты запросов выключены —
+иначе счётчики одних тестов дают 429 в других; тесты лимитов включают
+RATELIMIT_ENABLED сами.
+"""
+import copy
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.mkdtemp(prefix="django-test-cache-")
+        caches = copy.deepcopy(settings.CACHES)
+        caches["shared"]["LOCATION"] = self._cache_dir
+        self._test_settings = override_settings(CACHES=caches, RATELIMIT_ENABLED=False)
+        self._test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._test_settings.disable()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,629 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import tempfile
+import time
+from contextvars import Context
+from io import StringIO
+from multiprocessing import get_context
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from rest_framework import serializers
+
+from mysite.index_advisor import IndexAdvisor, Workload, candidate_columns
+from mysite.db_router import PIN_COOKIE, PrimaryPinMiddleware, PrimaryReplicaRouter, use_primary
+from mysite.cache_backends import (
+    ShardedSQLiteCache,
+    TwoTierCache,
+    _TwoTierState,
+    _two_tier_states,
+)
+from mysite.log_queue import JsonFormatter, QueuedHandler, SharedRotatingFileHandler
+from mysite.metrics import MetricsRegistry
+from mysite import ratelimit
+from mysite.ratelimit import Rate, RateLimiter, limiter
+from mysite.sqlite_backend.base import DatabaseWrapper as TunedSQLiteWrapper
+from mysite.storage import DedupFileSystemStorage
+from mysite.query_optimization import NPlusOneError, detect_n_plus_one, optimize_queryset
+from shopapp.models import Order, Product
+from shopapp.serializers import OrderSerializer
+
+
+def _incr_in_process(location: str, times: int) -> None:
+    cache = ShardedSQLiteCache(location, {"OPTIONS": {"SHARDS": 2}})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class ShardedSQLiteCacheTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def make_cache(self, **options) -> ShardedSQLiteCache:
+        options.setdefault("SHARDS", 2)
+        return ShardedSQLiteCache(self.tmpdir.name, {"OPTIONS": options})
+
+    def test_set_get_delete(self):
+        cache = self.make_cache()
+        cache.set("a", {"x": 1})
+        self.assertEqual(cache.get("a"), {"x": 1})
+        self.assertTrue(cache.has_key("a"))
+        self.assertTrue(cache.delete("a"))
+        self.assertIsNone(cache.get("a"))
+
+    def test_add_and_expiry(self):
+        cache = self.make_cache()
+        self.assertTrue(cache.add("a", 1, 60))
+        self.assertFalse(cache.add("a", 2, 60))
+        cache.set("b", 1, 0.05)
+        time.sleep(0.1)
+        self.assertIsNone(cache.get("b"))
+        self.assertTrue(cache.add("b", 2))
+        self.assertEqual(cache.get("b"), 2)
+
+    def test_get_does_not_wait_for_writer(self):
+        cache = self.make_cache(SHARDS=1, BUSY_TIMEOUT=5)
+        cache.set("a", 1)
+        cache.set("old", 2, 0.05)
+        time.sleep(0.1)
+        conn = cache._conn(0)
+        conn.execute("UPDATE cache SET accessed = accessed - 100")
+
+        # другой процесс держит блокировку записи шарда
+        writer = sqlite3.connect(cache._shard_path(0), isolation_level=None)
+        self.addCleanup(writer.close)
+        writer.execute("BEGIN IMMEDIATE")
+        started = time.monotonic()
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("old"))
+        self.assertLess(time.monotonic() - started, 1)
+        writer.execute("ROLLBACK")
+
+        # просроченную запись чтение не удаляет, её убирает следующая запись
+        self.assertEqual(conn.execute("SELECT count FROM stats").fetchone()[0], 2)
+        cache.set("b", 3)
+        self.assertEqual(conn.execute("SELECT count FROM stats").fetchone()[0], 2)
+
+    def test_get_many_set_many(self):
+        cache = self.make_cache(SHARDS=4)
+        data = {f"key-{i}": i for i in range(50)}
+        cache.set_many(data)
+        self.assertEqual(cache.get_many(list(data) + ["missing"]), data)
+        cache.delete_many(list(data)[:10])
+        self.assertEqual(len(cache.get_many(list(data))), 40)
+
+    def test_lru_eviction_by_entries(self):
+        cache = self.make_cache(SHARDS=1, MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        for i in range(10):
+            cache.set(f"key-{i}", i)
+        # key-0 читали недавно, остальные — давно
+        conn = cache._conn(0)
+        conn.execute("UPDATE cache SET accessed = accessed - 100")
+        conn.execute("UPDATE cache SET accessed = accessed + 50 WHERE key = ?", (cache.make_key("key-0"),))
+        cache.set("key-10", 10)
+        self.assertEqual(cache.get("key-0"), 0)
+        self.assertEqual(cache.get("key-10"), 10)
+        self.assertIsNone(cache.get("key-1"))
+        self.assertLessEqual(len(cache.get_many([f"key-{i}" for i in range(11)])), 10)
+
+    def test_eviction_by_size(self):
+        cache = self.make_cache(SHARDS=1, MAX_SIZE=10_000)
+        for i in range(20):
+            cache.set(f"key-{i}", b"x" * 1000)
+        count, size = cache._conn(0).execute("SELECT count, size FROM stats").fetchone()
+        self.assertLessEqual(size, 10_000)
+        self.assertEqual(count, len(cache.get_many([f"key-{i}" for i in range(20)])))
+        self.assertIsNotNone(cache.get("key-19"))
+
+    def test_incr_is_atomic_across_processes(self):
+        cache = self.make_cache()
+        cache.set("counter", 0)
+        ctx = get_context("fork")
+        processes = [
+            ctx.Process(target=_incr_in_process, args=(self.tmpdir.name, 50))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(cache.get("counter"), 200)
+        with self.assertRaises(ValueError):
+            cache.incr("missing")
+
+
+class TwoTierCacheTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.shared = ShardedSQLiteCache(self.tmpdir.name, {"OPTIONS": {"SHARDS": 2}})
+        caches_patch = mock.patch(
+            "mysite.cache_backends.caches",
+            {"test-shared": self.shared},
+        )
+        caches_patch.start()
+        self.addCleanup(caches_patch.stop)
+        self.addCleanup(_two_tier_states.pop, "test-shared", None)
+
+    def make_cache(self, **options) -> TwoTierCache:
+        options.setdefault("LOCAL_KEY_PREFIXES", ["hot:"])
+        return TwoTierCache("test-shared", {"OPTIONS": options})
+
+    def test_hot_keys_served_from_memory(self):
+        cache = self.make_cache(GENERATION_CHECK_INTERVAL=60)
+        value = {"rows": [1, 2, 3]}
+        cache.set("hot:a", value)
+        self.assertEqual(cache.get("hot:a"), value)
+        with mock.patch.object(self.shared, "get", side_effect=AssertionError):
+            self.assertIs(cache.get("hot:a"), cache.get("hot:a"))
+
+    def test_other_keys_pass_through(self):
+        cache = self.make_cache()
+        cache.set("cold", [1])
+        self.assertIsNot(cache.get("cold"), cache.get("cold"))
+        self.assertEqual(self.shared.get("cold"), [1])
+
+    def test_lru_bound(self):
+        cache = self.make_cache(LOCAL_MAX_ENTRIES=2)
+        for key in ("hot:a", "hot:b", "hot:c"):
+            cache.set(key, key)
+            cache.get(key)
+        self.assertEqual(list(key for key, version in cache._local), ["hot:b", "hot:c"])
+
+    def test_write_in_other_worker_invalidates(self):
+        cache = self.make_cache(GENERATION_CHECK_INTERVAL=0)
+        cache.set("hot:a", 1)
+        self.assertEqual(cache.get("hot:a"), 1)
+
+        # другой воркер: отдельное состояние процесса, тот же общий кеш
+        other_state = _TwoTierState()
+        with mock.patch.dict(_two_tier_states, {"test-shared": other_state}):
+            other = self.make_cache()
+        other.set("hot:a", 2)
+
+        self.assertEqual(cache.get("hot:a"), 2)
+
+    def test_lock_keys_do_not_invalidate(self):
+        cache = self.make_cache(GENERATION_CHECK_INTERVAL=0)
+        cache.set("hot:a", 1)
+        cache.get("hot:a")
+        generation = self.shared.get(TwoTierCache.generation_key)
+
+        self.assertTrue(cache.add("hot:a:lock", "token", 30))
+        self.assertEqual(cache.get("hot:a:lock"), "token")
+        cache.delete("hot:a:lock")
+
+        self.assertEqual(self.shared.get(TwoTierCache.generation_key), generation)
+        self.assertIn(("hot:a", None), cache._local)
+        self.assertNotIn(("hot:a:lock", None), cache._local)
+
+
+class _ProductNameSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Product
+        fields = "pk", "name"
+
+
+class _NestedOrderSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source="user.username")
+    products = _ProductNameSerializer(many=True)
+
+    class Meta:
+        model = Order
+        fields = "pk", "username", "products"
+
+
+class _UserOrdersSerializer(serializers.ModelSerializer):
+    orders = _NestedOrderSerializer(many=True, source="order_set")
+
+    class Meta:
+        model = User
+        fields = "pk", "orders"
+
+
+class QueryOptimizationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create([User(username=f"buyer{i}") for i in range(3)])
+        products = Product.objects.bulk_create([Product(name=f"Item {i}") for i in range(3)])
+        orders = Order.objects.bulk_create([Order(user=user) for user in users for _ in range(2)])
+        for order in orders:
+            order.products.set(products[:2])
+
+    def serialize(self, queryset, serializer_class):
+        return serializer_class(optimize_queryset(queryset, serializer_class), many=True).data
+
+    def test_pk_list_is_prefetched(self):
+        with self.assertNumQueries(2):
+            data = self.serialize(Order.objects.order_by("pk"), OrderSerializer)
+        self.assertEqual(len(data), 6)
+        self.assertEqual(len(data[0]["products"]), 2)
+
+    def test_nested_serializers(self):
+        # пользователи, их заказы вместе с username, товары заказов
+        with self.assertNumQueries(3):
+            data = self.serialize(User.objects.order_by("pk"), _UserOrdersSerializer)
+        self.assertEqual(data[0]["orders"][0]["username"], "buyer0")
+        self.assertEqual(data[0]["orders"][0]["products"][0]["name"], "Item 0")
+
+    def test_only_serialized_columns_are_loaded(self):
+        order = optimize_queryset(Order.objects.all(), OrderSerializer).first()
+        self.assertEqual(order.get_deferred_fields(), {"receipt"})
+
+    def test_n_plus_one_is_detected(self):
+        with self.assertRaisesMessage(NPlusOneError, "executed 6 times"):
+            with detect_n_plus_one(threshold=5):
+                OrderSerializer(Order.objects.all(), many=True).data
+        with detect_n_plus_one(threshold=5):
+            self.serialize(Order.objects.all(), OrderSerializer)
+
+
+class MetricsTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmpdir = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(METRICS_DIR=self.tmpdir))
+
+    def test_render_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry.inc("django_http_requests_total", route="shop", method="GET", status=200)
+        registry.observe("django_http_request_duration_seconds", 0.02, route="shop")
+        registry.observe("django_http_request_duration_seconds", 30, route="shop")
+        text = registry.render()
+        self.assertIn("# TYPE django_http_requests_total counter", text)
+        self.assertIn('django_http_requests_total{method="GET",route="shop",status="200"} 1', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{route="shop",le="0.01"} 0', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{route="shop",le="0.025"} 1', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{route="shop",le="10.0"} 1', text)
+        self.assertIn('django_http_request_duration_seconds_bucket{route="shop",le="+Inf"} 2', text)
+        self.assertIn('django_http_request_duration_seconds_count{route="shop"} 2', text)
+
+    def test_workers_are_summed(self):
+        # файл другого воркера gunicorn
+        other = [
+            ["django_cache_requests_total", [["result", "hit"], ["tier", "shared"]], 3],
+            ["django_http_response_size_bytes", [["route", "shop"]], [1, 0, 0, 0, 0, 0, 0, 0, 100, 1]],
+        ]
+        with open(os.path.join(self.tmpdir, "metrics-1.json"), "w") as file:
+            json.dump(other, file)
+        registry = MetricsRegistry()
+        registry.inc("django_cache_requests_total", 2, tier="shared", result="hit")
+        registry.observe("django_http_response_size_bytes", 300, route="shop")
+        text = registry.render()
+        self.assertIn('django_cache_requests_total{result="hit",tier="shared"} 5', text)
+        self.assertIn('django_http_response_size_bytes_bucket{route="shop",le="1024"} 2', text)
+        self.assertIn('django_http_response_size_bytes_sum{route="shop"} 400', text)
+
+    def test_middleware_and_endpoint(self):
+        self.client.get("/metrics")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        text = response.content.decode()
+        self.assertIn('django_http_requests_total{method="GET",route="metrics",status="200"}', text)
+        self.assertIn('django_http_request_duration_seconds_count{route="metrics"}', text)
+
+    def test_endpoint_is_restricted(self):
+        with self.settings(METRICS_ALLOWED_IPS=["10.0.0.1"]):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=["127.0.0.1"], METRICS_TOKEN="secret")
+    def test_endpoint_behind_proxy(self):
+        # nginx на том же хосте: REMOTE_ADDR 127.0.0.1 у всех
+        with override_settings(RATELIMIT_TRUSTED_PROXIES=["127.0.0.1"]):
+            self.assertEqual(self.client.get("/metrics", HTTP_X_FORWARDED_FOR="203.0.113.5").status_code, 403)
+        # прокси не объявлен доверенным: по адресу не пускаем
+        with override_settings(RATELIMIT_TRUSTED_PROXIES=[]):
+            self.assertEqual(self.client.get("/metrics", HTTP_X_FORWARDED_FOR="203.0.113.5").status_code, 403)
+        response = self.client.get(
+            "/metrics", HTTP_X_FORWARDED_FOR="203.0.113.5", HTTP_AUTHORIZATION="Bearer secret",
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_dead_workers_are_merged(self):
+        # pid процесса, который уже завершился
+        process = subprocess.Popen(["true"])
+        process.wait()
+        path = os.path.join(self.tmpdir, f"metrics-{process.pid}.json")
+        with open(path, "w") as file:
+            json.dump([["django_cache_requests_total", [["result", "hit"], ["tier", "local"]], 4]], file)
+        registry = MetricsRegistry()
+        self.assertIn('django_cache_requests_total{result="hit",tier="local"} 4', registry.render())
+        self.assertFalse(os.path.exists(path))
+        # счётчик не убывает и при следующем сборе
+        self.assertIn('django_cache_requests_total{result="hit",tier="local"} 4', registry.render())
+
+    @mock.patch("mysite.metrics.fcntl", None)
+    def test_dead_workers_are_merged_without_flock(self):
+        # Windows: fcntl нет, склейка идёт без блокировки
+        self.test_dead_workers_are_merged()
+
+
+class QueuedLoggingTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        self.tmpdir = self.enterContext(tempfile.TemporaryDirectory())
+        self.filename = os.path.join(self.tmpdir, "log.txt")
+
+    def make_file_handler(self, **kwargs) -> SharedRotatingFileHandler:
+        handler = SharedRotatingFileHandler(self.filename, **kwargs)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.addCleanup(handler.close)
+        return handler
+
+    def make_logger(self, name: str, handler: logging.Handler) -> logging.Logger:
+        logger = logging.getLogger(f"mysite.tests.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.DEBUG)
+        logger.addHandler(handler)
+        self.addCleanup(logger.removeHandler, handler)
+        return logger
+
+    def read_log(self, suffix: str = "") -> list:
+        with open(self.filename + suffix) as file:
+            return file.read().splitlines()
+
+    def test_records_are_written_by_writer_thread(self):
+        file_handler = self.make_file_handler()
+        file_handler.set_name("test-logfile")
+        queued = QueuedHandler(handlers=["test-logfile"])
+        self.addCleanup(queued.close)
+        logger = self.make_logger("queued", queued)
+        items = ["a"]
+        logger.info("items %s", items)
+        # запись форматируется в момент вызова, а не в потоке-писателе
+        items.append("b")
+        for index in range(100):
+            logger.debug("line %s", index)
+        queued.flush()
+        lines = self.read_log()
+        self.assertEqual(lines[0], "items ['a']")
+        self.assertEqual(lines[-1], "line 99")
+        self.assertEqual(len(lines), 101)
+
+    def test_rotation_is_shared_between_handlers(self):
+        # два обработчика на один файл — как два воркера gunicorn
+        first = self.make_file_handler(maxBytes=100, backupCount=2)
+        second = self.make_file_handler(maxBytes=100, backupCount=2)
+        first.emit_batch([logging.makeLogRecord({"msg": "x" * 60})])
+        second.emit_batch([logging.makeLogRecord({"msg": "y" * 60})])
+        first.emit_batch([logging.makeLogRecord({"msg": "z" * 10})])
+        self.assertEqual(self.read_log(".1"), ["x" * 60])
+        self.assertEqual(self.read_log(), ["y" * 60, "z" * 10])
+
+    def test_json_formatter(self):
+        record = logging.makeLogRecord({
+            "name": "mysite.access", "levelname": "INFO", "msg": "GET %s",
+            "args": ("/shop/",), "status": 200,
+        })
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "GET /shop/")
+        self.assertEqual(data["status"], 200)
+        self.assertEqual(data["logger"], "mysite.access")
+
+
+LOCMEM_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+@override_settings(RATELIMIT_ENABLED=True)
+class RateLimitTestCase(SimpleTestCase):
+    def setUp(self) -> None:
+        limiter.blocked.clear()
+
+    def test_sliding_window(self):
+        rate = Rate.parse("3/m")
+        self.assertEqual(rate, Rate(3, 60))
+        local = RateLimiter(local_max_keys=2)
+        with mock.patch("mysite.ratelimit.time.time", return_value=6000.0):
+            self.assertTrue(all(local.hit("client", rate).allowed for _ in range(3)))
+            result = local.hit("client", rate)
+            self.assertFalse(result.allowed)
+            self.assertEqual(result.retry_after, 60)
+        # в новом окне предыдущее считается с весом 0.5: 4 * 0.5 + 1 <= 3
+        with mock.patch("mysite.ratelimit.time.time", return_value=6090.0):
+            self.assertTrue(local.hit("client", rate).allowed)
+            self.assertFalse(local.hit("client", rate).allowed)
+        for index in range(5):
+            with mock.patch("mysite.ratelimit.time.time", return_value=6000.0):
+                for _ in range(4):
+                    local.hit(f"other-{index}", rate)
+        self.assertEqual(len(local.blocked), 2)
+
+    @override_settings(
+        RATELIMITS={"metrics": {"anon": "2/m"}}, RATELIMIT_TRUSTED_PROXIES=[], METRICS_ALLOWED_IPS=None,
+    )
+    def test_middleware_ignores_untrusted_forwarded_for(self):
+        ratelimit._proxy_warning_logged = False
+        with self.assertLogs("mysite.ratelimit", "WARNING") as logs:
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+        self.assertIn("DJANGO_TRUSTED_PROXIES", logs.output[0])
+        self.assertEqual(self.client.get("/metrics", HTTP_X_FORWARDED_FOR="10.0.0.1").status_code, 200)
+        response = self.client.get("/metrics", HTTP_X_FORWARDED_FOR="10.0.0.2")
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+    @override_settings(RATELIMITS={"metrics": {"anon": "1/m", "methods": ["POST"]}})
+    def test_rule_counts_only_listed_methods(self):
+        with mock.patch.object(limiter, "hit", side_effect=AssertionError):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    @override_settings(
+        RATELIMITS={"metrics": {"anon": "1/m"}}, RATELIMIT_TRUSTED_PROXIES=["127.0.0.1"], METRICS_ALLOWED_IPS=None,
+    )
+    def test_forwarded_for_from_trusted_proxy(self):
+        self.assertEqual(self.client.get("/metrics", HTTP_X_FORWARDED_FOR="10.0.0.1").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", HTTP_X_FORWARDED_FOR="10.0.0.2").status_code, 200)
+        self.assertEqual(self.client.get("/metrics", HTTP_X_FORWARDED_FOR="10.0.0.1").status_code, 429)
+
+
+class DedupStorageTestCase(SimpleTestCase):
+    def setUp(self):
+        self.location = self.enterContext(tempfile.TemporaryDirectory())
+        self.storage = DedupFileSystemStorage(location=self.location)
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save("products/a.png", ContentFile(b"image"))
+        second = self.storage.save("avatars/b.png", ContentFile(b"image"))
+        other = self.storage.save("avatars/c.png", ContentFile(b"other"))
+        self.assertEqual(os.stat(self.storage.path(first)).st_ino, os.stat(self.storage.path(second)).st_ino)
+        self.assertNotEqual(os.stat(self.storage.path(first)).st_ino, os.stat(self.storage.path(other)).st_ino)
+        self.assertEqual(self.storage.references(first), 2)
+
+        # имя под upload_to сохраняется, повтор получает суффикс как обычно
+        again = self.storage.save("products/a.png", ContentFile(b"image"))
+        self.assertNotEqual(again, first)
+        self.assertEqual(self.storage.references(first), 3)
+
+    def test_blob_removed_with_last_reference(self):
+        first = self.storage.save("a.txt", ContentFile(b"text"))
+        second = self.storage.save("b.txt", ContentFile(b"text"))
+        blob = self.storage.blob_path(hashlib.sha256(b"text").hexdigest())
+        self.storage.delete(first)
+        self.assertTrue(os.path.exists(blob))
+        self.storage.delete(second)
+        self.assertFalse(os.path.exists(blob))
+
+    def test_write_does_not_change_other_names(self):
+        first = self.storage.save("a.txt", ContentFile(b"text"))
+        second = self.storage.save("b.txt", ContentFile(b"text"))
+        with self.storage.open(second, "wb") as file:
+            file.write(b"changed")
+        with self.storage.open(first) as file:
+            self.assertEqual(file.read(), b"text")
+
+    def test_dedup_media_command(self):
+        for name in ("a.txt", "a_X3LE7KY.txt", "sub/b.txt"):
+            os.makedirs(os.path.dirname(os.path.join(self.location, name)), exist_ok=True)
+            with open(os.path.join(self.location, name), "wb") as file:
+                file.write(b"duplicate")
+        with override_settings(MEDIA_ROOT=self.location):
+            call_command("dedup_media", stdout=StringIO())
+            self.assertEqual(default_storage.references("sub/b.txt"), 3)
+            # повторный запуск ничего не ломает
+            call_command("dedup_media", stdout=StringIO())
+        with open(os.path.join(self.location, "a.txt"), "rb") as file:
+            self.assertEqual(file.read(), b"duplicate")
+
+
+class TunedSQLiteBackendTestCase(SimpleTestCase):
+    def setUp(self):
+        self.name = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), "db.sqlite3")
+
+    def make_connection(self, **options) -> TunedSQLiteWrapper:
+        settings_dict = connections.configure_settings({
+            "default": {"ENGINE": "mysite.sqlite_backend", "NAME": self.name, "OPTIONS": options},
+        })["default"]
+        connection = TunedSQLiteWrapper(settings_dict, alias="tuned")
+        self.addCleanup(connection.close)
+        return connection
+
+    def pragma(self, connection, name: str):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        connection = self.make_connection(pragmas={"cache_size": -1000})
+        self.assertEqual(self.pragma(connection, "journal_mode"), "wal")
+        self.assertEqual(self.pragma(connection, "synchronous"), 1)
+        self.assertEqual(self.pragma(connection, "cache_size"), -1000)
+        self.assertEqual(self.pragma(connection, "foreign_keys"), 1)
+
+    def test_transaction_takes_write_lock_at_begin(self):
+        first = self.make_connection()
+        second = self.make_connection(timeout=0)
+        first._start_transaction_under_autocommit()
+        # второй писатель узнаёт о занятости на BEGIN, а не посреди транзакции
+        with self.assertRaisesMessage(OperationalError, "locked"):
+            second._start_transaction_under_autocommit()
+        first.connection.execute("COMMIT")
+        second._start_transaction_under_autocommit()
+        second.connection.execute("COMMIT")
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"], DATABASE_PIN_SECONDS=10)
+class PrimaryReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def test_reads_your_writes(self):
+        def run():
+            self.assertEqual(self.router.db_for_read(Product), "replica1")
+            with use_primary():
+                self.assertEqual(self.router.db_for_read(Product), "default")
+            self.assertEqual(self.router.db_for_read(Product), "replica1")
+            self.assertEqual(self.router.db_for_write(Order), "default")
+            self.assertEqual(self.router.db_for_read(Product), "default")
+
+        # своё состояние, как у отдельного потока или запроса
+        Context().run(run)
+        self.assertFalse(self.router.allow_migrate("replica1", "shopapp"))
+        self.assertTrue(self.router.allow_migrate("default", "shopapp"))
+
+    def test_middleware_pins_client_after_write(self):
+        def write_view(request):
+            self.router.db_for_write(Order)
+            return HttpResponse()
+
+        def read_view(request):
+            return HttpResponse(self.router.db_for_read(Product))
+
+        factory = RequestFactory()
+        response = Context().run(PrimaryPinMiddleware(write_view), factory.post("/"))
+        self.assertEqual(response.cookies[PIN_COOKIE]["max-age"], 10)
+
+        response = Context().run(PrimaryPinMiddleware(read_view), factory.get("/"))
+        self.assertEqual(response.content, b"replica1")
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        request = factory.get("/")
+        request.COOKIES[PIN_COOKIE] = "1"
+        response = Context().run(PrimaryPinMiddleware(read_view), request)
+        self.assertEqual(response.content, b"default")
+
+
+class IndexAdvisorTestCase(TestCase):
+    def test_candidate_columns(self):
+        sql = (
+            'SELECT "t"."id" FROM "t" WHERE ("t"."user_id" = %s AND NOT "t"."archived" '
+            'AND "t"."price" >= %s) ORDER BY "t"."created_at" DESC'
+        )
+        self.assertEqual(
+            candidate_columns(sql, "t"),
+            ([("user_id", False), ("created_at", True)], {"archived": False}),
+        )
+        # сортировка по чужой таблице: только равенства
+        sql = 'SELECT "t"."id" FROM "t" INNER JOIN "u" ON ("t"."u_id" = "u"."id") ORDER BY "u"."name" ASC'
+        self.assertEqual(candidate_columns(sql, "t"), ([], {}))
+
+    def test_proposes_index_the_planner_uses(self):
+        workload = Workload()
+        workload.install()
+        try:
+            list(Product.objects.filter(discount=10).order_by("-created_at"))
+            list(Product.objects.filter(archived=False).order_by("-created_at")[:5])
+        finally:
+            workload.uninstall()
+
+        advisor = IndexAdvisor(["shopapp"])
+        advisor.analyze(workload)
+        self.assertEqual(
+            [proposal.code for proposal in advisor.proposals.values()],
+            ["models.Index(fields=['discount', '-created_at'], name='shopapp_pro_discoun_33c967_idx')"],
+        )
+        # частичный индекс из Meta.indexes уже закрывает второй запрос
+        self.assertGreater(advisor.indexes["product_active_created_idx"].used, 0)
+        # (name) — это (name, id) и не префикс (name, price, id)
+        self.assertEqual(advisor.redundant, [])
+        # индекс-кандидат откатан
+        with connections["default"].cursor() as cursor:
+            indexes = connections["default"].introspection.get_constraints(cursor, "shopapp_product")
+        self.assertNotIn("shopapp_pro_discoun_33c967_idx", indexes)
@@ -21,6 +21,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.sitemaps.views import sitemap
 
+from .metrics import metrics_view
 from .sitemaps import sitemaps
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
@@ -28,6 +29,7 @@ from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, Spec
 urlpatterns = [
     path('req/', include('requestdataapp.urls')),
     path('accounts/', include('django.contrib.auth.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 urlpatterns += i18n_patterns(
@@ -37,6 +39,7 @@ urlpatterns += i18n_patterns(
     path('shop/', include('shopapp.urls')),
     path('blog/', include('blogapp.urls')),
     path('api/', include('myapiapp.urls')),
+    path('jobs/', include('jobsapp.urls')),
 
     path(
         "sitemap.xml",
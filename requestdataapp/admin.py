@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import ChunkedUpload
+
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = 'filename', 'status', 'offset', 'size', 'created_by', 'created_at', 'expires_at'
+    list_filter = 'status',
+    readonly_fields = [field.name for field in ChunkedUpload._meta.fields]
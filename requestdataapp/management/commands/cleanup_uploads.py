@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from requestdataapp.models import ChunkedUpload
+from requestdataapp.uploads import discard_part
+
+
+class Command(BaseCommand):
+    """
+    Удаляет брошенные загрузки по частям вместе с временными файлами.
+    Запускать по cron, например раз в час.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        expired = ChunkedUpload.objects.filter(
+            status__in=[ChunkedUpload.ACTIVE, ChunkedUpload.FAILED],
+            expires_at__lte=timezone.now(),
+        )
+        count = 0
+        for upload in expired.iterator():
+            count += 1
+            if not options["dry_run"]:
+                discard_part(upload)
+                upload.delete()
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(f"{verb} {count} expired uploads")
@@ -1,63 +1,32 @@
-import time
-from django.http import HttpRequest, JsonResponse
-from django.utils.deprecation import MiddlewareMixin
+import logging
 
-THROTTLE_TIME = 5
+from asgiref.sync import iscoroutinefunction
+from django.http import HttpRequest
+from django.utils.decorators import sync_and_async_middleware
 
-request_log = {}
+log = logging.getLogger(__name__)
 
 
+@sync_and_async_middleware
 def set_useragent_on_request_middleware(get_response):
-    print('initial call')
+    log.debug('User agent middleware initialized')
+
+    if iscoroutinefunction(get_response):
+        async def middleware(request: HttpRequest):
+            log.debug('Before get response')
+            request.user_agent = request.META.get('HTTP_USER_AGENT', 'unknown')
+            response = await get_response(request)
+            log.debug('After get response')
+            return response
+
+        return middleware
 
     def middleware(request: HttpRequest):
-        print('before get response')
+        log.debug('Before get response')
         # Безопасное получение заголовка HTTP_USER_AGENT
         request.user_agent = request.META.get('HTTP_USER_AGENT', 'unknown')
         response = get_response(request)
-        print('after get response')
+        log.debug('After get response')
         return response
 
     return middleware
-
-
-class CountRequestMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
-        self.request_count = 0
-        self.responses_count = 0
-        self.exceptions_count = 0
-
-    def __call__(self, request: HttpRequest):
-        self.request_count += 1
-        print('requests count: ', self.request_count)
-        response = self.get_response(request)
-        self.responses_count += 1
-        print('responses count: ', self.responses_count)
-        return response
-
-    def process_exception(self, request: HttpRequest, exception: Exception):
-        self.exceptions_count += 1
-        print('got: ', self.exceptions_count, 'exceptions so far')
-
-
-class ThrottlingMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-        user_ip = self.get_client_ip(request)
-        current_time = time.time()
-
-        if user_ip in request_log:
-            last_request_time = request_log[user_ip]
-            if current_time - last_request_time < THROTTLE_TIME:
-                return JsonResponse({'error': 'Too many requests. Please wait before trying again.'}, status=429)
-
-        request_log[user_ip] = current_time
-
-    def get_client_ip(self, request):
-        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-        if x_forwarded_for:
-            ip = x_forwarded_for.split(',')[0]
-        else:
-            ip = request.META.get('REMOTE_ADDR')
-        return ip
-
@@ -1,3 +1,64 @@
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
 from django.db import models
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+def default_upload_expiry():
+    return timezone.now() + timedelta(seconds=settings.CHUNKED_UPLOAD_EXPIRE)
+
+
+class ChunkedUpload(models.Model):
+    """
+    Загрузка файла по частям (см. :mod:`requestdataapp.uploads`).
+
+    Части дописываются во временный файл, ``offset`` — сколько байт уже
+    принято. Когда принят весь ``size``, файл переносится в ``file``.
+    Идентификатор — UUID: ссылку на загрузку нельзя подобрать.
+    """
+    ACTIVE = 'active'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (ACTIVE, _('Active')),
+        (COMPLETE, _('Complete')),
+        (FAILED, _('Failed')),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    # ожидаемый SHA-256 всего файла от клиента, если он его прислал
+    expected_sha256 = models.CharField(max_length=64, blank=True)
+    sha256 = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=ACTIVE)
+    error = models.TextField(blank=True)
+    file = models.FileField(upload_to='uploads/%Y/%m/', null=True, blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='uploads')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    expires_at = models.DateTimeField(default=default_upload_expiry)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _("Chunked upload")
+        verbose_name_plural = _("Chunked uploads")
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='upload_status_expires_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'ChunkedUpload({self.filename}, {self.offset}/{self.size})'
+
+    def get_absolute_url(self):
+        return reverse('chunked-upload', kwargs={'pk': self.pk})
 
-# Create your models here.
+    @property
+    def is_expired(self) -> bool:
+        return self.status == self.ACTIVE and self.expires_at <= timezone.now()
@@ -1,3 +1,173 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from myauth.models import Profile
+
+from .models import ChunkedUpload
+from .uploads import append_chunk, part_path
+from .views import upload_file
+
+
+class ChunkedUploadTestCase(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(
+            CHUNKED_UPLOAD_TEMP_DIR=self.enterContext(tempfile.TemporaryDirectory()),
+            MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory()),
+        ))
+        self.data = os.urandom(200 * 1024)
+
+    def create(self, **extra) -> dict:
+        response = self.client.post(
+            reverse("chunked-upload-create"),
+            {"filename": "../../etc/report 1.bin", "size": len(self.data), **extra},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def patch(self, url: str, offset: int, chunk: bytes, **headers):
+        return self.client.patch(
+            url, chunk, content_type="application/offset+octet-stream",
+            headers={"Upload-Offset": str(offset), **headers},
+        )
+
+    def test_upload_in_chunks(self):
+        upload = self.create(sha256=hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(upload["filename"], "report_1.bin")
+        for offset in range(0, len(self.data), 70 * 1024):
+            response = self.patch(upload["upload_url"], offset, self.data[offset:offset + 70 * 1024])
+            self.assertEqual(response.status_code, 200)
+
+        result = response.json()
+        self.assertEqual(result["status"], ChunkedUpload.COMPLETE)
+        self.assertEqual(result["sha256"], hashlib.sha256(self.data).hexdigest())
+        stored = ChunkedUpload.objects.get(pk=upload["id"])
+        with stored.file.open("rb") as file:
+            self.assertEqual(file.read(), self.data)
+        self.assertFalse(os.path.exists(part_path(stored)))
+
+    def test_resume_from_server_offset(self):
+        upload = self.create()
+        self.patch(upload["upload_url"], 0, self.data[:1000])
+        # повтор той же части после обрыва: сервер подсказывает, откуда продолжать
+        response = self.patch(upload["upload_url"], 0, self.data[:1000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response["Upload-Offset"], "1000")
+
+        offset = int(self.client.get(upload["upload_url"])["Upload-Offset"])
+        response = self.patch(upload["upload_url"], offset, self.data[offset:])
+        self.assertEqual(response.json()["status"], ChunkedUpload.COMPLETE)
+        self.assertEqual(response.json()["sha256"], hashlib.sha256(self.data).hexdigest())
+
+    def test_chunk_checksum_mismatch_is_rejected(self):
+        upload = self.create()
+        chunk = self.data[:1000]
+        response = self.patch(
+            upload["upload_url"], 0, chunk,
+            **{"Upload-Checksum": "sha256 " + hashlib.sha256(b"other").hexdigest()},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response["Upload-Offset"], "0")
+
+        response = self.patch(
+            upload["upload_url"], 0, chunk,
+            **{"Upload-Checksum": "sha256 " + hashlib.sha256(chunk).hexdigest()},
+        )
+        self.assertEqual(response.json()["offset"], 1000)
+
+    def test_file_checksum_mismatch_fails_upload(self):
+        upload = self.create(sha256="0" * 64)
+        response = self.patch(upload["upload_url"], 0, self.data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ChunkedUpload.objects.get(pk=upload["id"]).status, ChunkedUpload.FAILED)
+
+    def test_disk_error_is_not_counted(self):
+        upload = ChunkedUpload.objects.get(pk=self.create()["id"])
+        real_open = open
+
+        class FullDisk:
+            def __init__(self, file):
+                self.file = file
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.file.close()
+
+            def __getattr__(self, name):
+                return getattr(self.file, name)
+
+            def write(self, data):
+                raise OSError(28, "No space left on device")
+
+        with mock.patch("requestdataapp.uploads.open", create=True,
+                        side_effect=lambda *args: FullDisk(real_open(*args))):
+            with self.assertRaises(OSError):
+                append_chunk(upload, io.BytesIO(self.data[:1000]), 0, 1000)
+
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, 0)
+        self.assertEqual(os.path.getsize(part_path(upload)), 0)
+
+    def test_size_limit(self):
+        with override_settings(CHUNKED_UPLOAD_ANON_MAX_SIZE=100):
+            response = self.client.post(
+                reverse("chunked-upload-create"),
+                {"filename": "big.bin", "size": 101},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 413)
+
+    def test_anonymous_quota(self):
+        with override_settings(CHUNKED_UPLOAD_ANON_QUOTA=(2, len(self.data) * 3)):
+            first = self.create()
+            self.create()
+            response = self.client.post(
+                reverse("chunked-upload-create"),
+                {"filename": "third.bin", "size": 10},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 429)
+
+            # отменённая загрузка место освобождает, но объём тоже ограничен
+            self.client.delete(first["upload_url"])
+            response = self.client.post(
+                reverse("chunked-upload-create"),
+                {"filename": "big.bin", "size": len(self.data) * 2 + 1},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 413)
+            self.create()
+
+        # bulk_create: без сигналов myauth, которые создают профиль дважды
+        user = User.objects.bulk_create([User(username="uploader")])[0]
+        Profile.objects.bulk_create([Profile(user=user)])
+        self.client.force_login(user)
+        with override_settings(CHUNKED_UPLOAD_ANON_MAX_SIZE=10):
+            # у пользователя своя квота и свой предел размера
+            self.create()
+
+    def test_cleanup_removes_expired(self):
+        upload = self.create()
+        ChunkedUpload.objects.filter(pk=upload["id"]).update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command("cleanup_uploads", stdout=io.StringIO())
+        self.assertFalse(ChunkedUpload.objects.filter(pk=upload["id"]).exists())
+
+
+class UploadFileTestCase(TestCase):
+    def test_invalid_content_length(self):
+        # маршрут upload/ занят handle_file_upload, поэтому view вызываем напрямую
+        request = RequestFactory().generic("POST", "/req/upload/", b"", CONTENT_LENGTH="abc")
+        response = upload_file(request)
+        self.assertEqual(response.status_code, 400)
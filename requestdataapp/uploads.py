@@ -0,0 +1,272 @@
+"""
+Загрузка больших файлов частями с докачкой.
+
+Протокол (JSON, по мотивам tus):
+
+* ``POST /req/uploads/`` с ``filename``, ``size`` и необязательным
+  ``sha256`` — создаёт загрузку, в ответе её ``upload_url``;
+* ``PATCH <upload_url>`` с заголовком ``Upload-Offset`` и байтами части
+  в теле — дописывает часть; необязательный ``Upload-Checksum: sha256 <hex>``
+  проверяет саму часть;
+* ``GET``/``HEAD <upload_url>`` — сколько байт уже принято: после обрыва
+  клиент продолжает с этого места;
+* ``DELETE <upload_url>`` — отменяет загрузку.
+
+Незавершённые загрузки занимают диск, поэтому их число и заявленный
+объём ограничены: у каждого пользователя свои квоты
+(``CHUNKED_UPLOAD_USER_QUOTA``), у анонимов — одна на всех
+(``CHUNKED_UPLOAD_ANON_QUOTA``) и меньший размер файла
+(``CHUNKED_UPLOAD_ANON_MAX_SIZE``).
+
+Тело запроса читается потоком кусками по ``READ_SIZE`` и сразу пишется
+во временный файл в ``CHUNKED_UPLOAD_TEMP_DIR``, так что память не
+зависит от размера части. SHA-256 файла считается по ходу записи;
+если часть пришла в другой процесс, состояние хеша восстанавливается
+одним чтением уже принятых байт. Если соединение оборвалось посреди части,
+принятые байты засчитываются. Когда принят весь файл, он переносится
+в хранилище одним переименованием (или копированием, если временный
+каталог на другом диске).
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .models import ChunkedUpload
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки
+    fcntl = None
+
+READ_SIZE = 64 * 1024
+# сколько состояний SHA-256 держим в процессе между частями
+HASHER_CACHE_SIZE = 128
+
+
+class UploadError(Exception):
+    """
+    Часть не принята; ``status`` — HTTP-код ответа.
+    """
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class _PartFile(File):
+    # FileSystemStorage переносит такой файл через file_move_safe, без чтения
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+
+def part_path(upload: ChunkedUpload) -> str:
+    return os.path.join(settings.CHUNKED_UPLOAD_TEMP_DIR, f'{upload.pk}.part')
+
+
+@contextmanager
+def _locked(path: str):
+    # две части одной загрузки не должны писаться одновременно,
+    # даже из разных воркеров
+    with open(path + '.lock', 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _get_hasher(upload: ChunkedUpload, part):
+    with _hashers_lock:
+        cached = _hashers.pop(upload.pk, None)
+    if cached is not None and cached[0] == upload.offset:
+        return cached[1]
+    hasher = hashlib.sha256()
+    part.seek(0)
+    remaining = upload.offset
+    while remaining:
+        data = part.read(min(READ_SIZE, remaining))
+        if not data:
+            break
+        hasher.update(data)
+        remaining -= len(data)
+    return hasher
+
+
+def _put_hasher(upload: ChunkedUpload, hasher) -> None:
+    with _hashers_lock:
+        _hashers[upload.pk] = (upload.offset, hasher)
+        while len(_hashers) > HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _parse_checksum(header: str):
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256' or len(value.strip()) != 64:
+        raise UploadError('Upload-Checksum must be "sha256 <hex digest>"')
+    return value.strip().lower()
+
+
+def _active_totals(user):
+    """
+    Число и заявленный объём активных, не просроченных загрузок
+    пользователя (или всех анонимов) и квоты на них.
+    """
+    if user is not None:
+        active = ChunkedUpload.objects.filter(created_by=user)
+        max_count, max_size = settings.CHUNKED_UPLOAD_USER_QUOTA
+    else:
+        active = ChunkedUpload.objects.filter(created_by__isnull=True)
+        max_count, max_size = settings.CHUNKED_UPLOAD_ANON_QUOTA
+    totals = active.filter(
+        status=ChunkedUpload.ACTIVE,
+        expires_at__gt=timezone.now(),
+    ).aggregate(count=Count('pk'), size=Sum('size'))
+    return totals['count'], totals['size'] or 0, max_count, max_size
+
+
+def create_upload(filename: str, size: int, sha256: str = '', user=None) -> ChunkedUpload:
+    if user is not None and not user.is_authenticated:
+        user = None
+    max_file_size = settings.CHUNKED_UPLOAD_MAX_SIZE if user is not None else settings.CHUNKED_UPLOAD_ANON_MAX_SIZE
+    if size < 0 or size > max_file_size:
+        raise UploadError(f'File size must be at most {max_file_size} bytes.', status=413)
+    # проверка и создание в одной транзакции (BEGIN IMMEDIATE, см.
+    # mysite.sqlite_backend): две загрузки одновременно не проскочат квоту
+    with transaction.atomic():
+        count, reserved, max_count, max_size = _active_totals(user)
+        if count >= max_count:
+            raise UploadError(f'Too many unfinished uploads, at most {max_count}.', status=429)
+        if reserved + size > max_size:
+            raise UploadError(f'Unfinished uploads may take at most {max_size} bytes.', status=413)
+        upload = ChunkedUpload.objects.create(
+            filename=filename,
+            size=size,
+            expected_sha256=sha256.lower(),
+            created_by=user,
+        )
+    os.makedirs(settings.CHUNKED_UPLOAD_TEMP_DIR, exist_ok=True)
+    open(part_path(upload), 'wb').close()
+    if size == 0:
+        with open(part_path(upload), 'rb') as part:
+            _finalize(upload, part, hashlib.sha256())
+    return upload
+
+
+def append_chunk(upload: ChunkedUpload, stream, offset: int, length: int, checksum: str = '') -> ChunkedUpload:
+    """
+    Дописывает часть из ``stream`` (length байт) с позиции ``offset``.
+    """
+    expected_chunk = _parse_checksum(checksum)
+    if length > settings.CHUNKED_UPLOAD_MAX_CHUNK:
+        raise UploadError(f'Chunk must be at most {settings.CHUNKED_UPLOAD_MAX_CHUNK} bytes.', status=413)
+
+    path = part_path(upload)
+    with _locked(path):
+        # offset мог измениться, пока ждали блокировку
+        upload.refresh_from_db()
+        if upload.status != ChunkedUpload.ACTIVE:
+            raise UploadError(f'Upload is {upload.status}.', status=409)
+        if upload.is_expired:
+            raise UploadError('Upload has expired.', status=410)
+        if offset != upload.offset:
+            raise UploadError(f'Expected Upload-Offset {upload.offset}.', status=409)
+        if offset + length > upload.size:
+            raise UploadError('Chunk goes past the declared file size.', status=413)
+
+        with open(path, 'r+b') as part:
+            hasher = _get_hasher(upload, part)
+            chunk_hasher = hashlib.sha256() if expected_chunk else None
+            # хвост от оборванной части, которую не засчитали
+            part.truncate(upload.offset)
+            part.seek(upload.offset)
+            received = 0
+            while received < length:
+                try:
+                    data = stream.read(min(READ_SIZE, length - received))
+                except (OSError, UnreadablePostError):
+                    # клиент отвалился: принятое сохраняем, дальше он докачает
+                    break
+                if not data:
+                    break
+                _write_part(part, data, upload.offset)
+                hasher.update(data)
+                if chunk_hasher is not None:
+                    chunk_hasher.update(data)
+                received += len(data)
+            _write_part(part, b'', upload.offset)
+
+            # часть с контрольной суммой принимается только целиком
+            if chunk_hasher is not None and (received != length or chunk_hasher.hexdigest() != expected_chunk):
+                part.truncate(upload.offset)
+                raise UploadError('Chunk checksum mismatch.')
+
+            upload.offset += received
+            ChunkedUpload.objects.filter(pk=upload.pk).update(offset=upload.offset)
+            if upload.offset == upload.size:
+                _finalize(upload, part, hasher)
+            else:
+                _put_hasher(upload, hasher)
+    return upload
+
+
+def _write_part(part, data: bytes, offset: int) -> None:
+    """
+    Пишет в файл части; пустой ``data`` — только сбросить буфер.
+
+    Ошибка своего диска (ENOSPC, EIO) — не обрыв клиента: часть не
+    засчитывается, ошибка уходит выше и становится ответом 500.
+    """
+    try:
+        if data:
+            part.write(data)
+        else:
+            part.flush()
+    except OSError:
+        # в буфере остались данные: обрезаем мимо него
+        os.truncate(part.name, offset)
+        raise
+
+
+def _finalize(upload: ChunkedUpload, part, hasher) -> None:
+    upload.sha256 = hasher.hexdigest()
+    if upload.expected_sha256 and upload.expected_sha256 != upload.sha256:
+        upload.status = ChunkedUpload.FAILED
+        upload.error = 'File checksum mismatch.'
+        upload.save(update_fields=['sha256', 'status', 'error', 'updated_at'])
+        discard_part(upload)
+        raise UploadError(upload.error)
+    part.flush()
+    os.fsync(part.fileno())
+    with open(part.name, 'rb') as source:
+        upload.file.save(upload.filename, _PartFile(source), save=False)
+    upload.status = ChunkedUpload.COMPLETE
+    upload.save(update_fields=['sha256', 'status', 'file', 'updated_at'])
+    discard_part(upload)
+
+
+def discard_part(upload: ChunkedUpload) -> None:
+    with _hashers_lock:
+        _hashers.pop(upload.pk, None)
+    path = part_path(upload)
+    for name in (path, path + '.lock'):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
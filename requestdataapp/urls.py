@@ -1,6 +1,13 @@
 from django.urls import path
 
-from .views import process_get_view, user_form, handle_file_upload, upload_file
+from .views import (
+    process_get_view,
+    user_form,
+    handle_file_upload,
+    upload_file,
+    ChunkedUploadCreateView,
+    ChunkedUploadView,
+)
 
 appname = 'requestdataapp'
 
@@ -9,4 +16,6 @@ urlpatterns = [
     path('bio/', user_form, name='user-form'),
     path('upload/', handle_file_upload, name='file-upload'),
     path('upload/', upload_file, name='upload_file'),
-]
\ No newline at end of file
+    path('uploads/', ChunkedUploadCreateView.as_view(), name='chunked-upload-create'),
+    path('uploads/<uuid:pk>/', ChunkedUploadView.as_view(), name='chunked-upload'),
+]
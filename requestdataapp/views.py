@@ -1,10 +1,21 @@
+import json
+import logging
+
 from django.core.files.storage import FileSystemStorage
-from django.http import HttpRequest, HttpResponse, JsonResponse
-from django.shortcuts import render
-from django.views.decorators.csrf import csrf_exempt
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.http import Http404, HttpRequest, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.decorators import method_decorator
+from django.utils.text import get_valid_filename
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 import os
 
 from .forms import UserBioForm, UploadFileForm
+from .models import ChunkedUpload
+from .uploads import UploadError, append_chunk, create_upload, discard_part
+
+log = logging.getLogger(__name__)
 
 
 MAX_FILE_SIZE = 5 * 1024 * 1024
@@ -28,15 +39,29 @@ def user_form (request: HttpRequest) -> HttpResponse:
     return render(request, 'requestdataapp/user-bio-form.html', context=context)
 
 
+def safe_filename(name: str) -> str:
+    # имя от клиента: без каталогов и спецсимволов
+    return get_valid_filename(os.path.basename(name.replace('\\', '/')))
+
+
+@csrf_exempt
 def handle_file_upload(request: HttpRequest) -> HttpResponse:
+    # файл пишется на диск по мере чтения, а не собирается в памяти;
+    # обработчики можно менять только до проверки CSRF, которая читает POST
+    request.upload_handlers = [TemporaryFileUploadHandler(request)]
+    return _handle_file_upload(request)
+
+
+@csrf_protect
+def _handle_file_upload(request: HttpRequest) -> HttpResponse:
     if request.method == 'POST':
         form = UploadFileForm(request.POST, request.FILES)
         if form.is_valid():
             # myfile = request.FILES['myfile']
             myfile = form.cleaned_data['file']
             fs = FileSystemStorage()
-            filename = fs.save(myfile.name, myfile)
-            print('saved file', filename)
+            filename = fs.save(safe_filename(myfile.name), myfile)
+            log.debug('Saved file %s', filename)
     else:
         form = UploadFileForm()
 
@@ -49,6 +74,14 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
 @csrf_exempt
 def upload_file(request):
     if request.method == 'POST':
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid Content-Length.'}, status=400)
+        if content_length > MAX_FILE_SIZE + 64 * 1024:
+            # не читаем тело, которое всё равно не примем
+            return JsonResponse({'error': f'File size exceeds {MAX_FILE_SIZE // (1024 * 1024)} MB.'}, status=400)
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
         file = request.FILES.get('file')
 
         if not file:
@@ -58,13 +91,100 @@ def upload_file(request):
             return JsonResponse({'error': f'File size exceeds {MAX_FILE_SIZE // (1024 * 1024)} MB.'}, status=400)
 
         upload_dir = os.path.join(os.path.dirname(__file__), 'uploads')
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, file.name)
-
-        with open(file_path, 'wb') as f:
-            for chunk in file.chunks():
-                f.write(chunk)
+        # storage сам не даст выйти из каталога и не перезапишет чужой файл
+        file_name = FileSystemStorage(location=upload_dir).save(safe_filename(file.name), file)
+
+        return JsonResponse({'message': 'File uploaded successfully.', 'file_name': file_name})
+
+    return JsonResponse({'error': 'Only POST method is allowed.'}, status=405)
+
+
+def upload_to_dict(upload: ChunkedUpload) -> dict:
+    return {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.offset,
+        'status': upload.status,
+        'sha256': upload.sha256 or None,
+        'error': upload.error or None,
+        'upload_url': upload.get_absolute_url(),
+        'file_url': upload.file.url if upload.file else None,
+        'expires_at': upload.expires_at,
+    }
 
-        return JsonResponse({'message': 'File uploaded successfully.', 'file_name': file.name})
 
-    return JsonResponse({'error': 'Only POST method is allowed.'}, status=405)
\ No newline at end of file
+def upload_error_response(error: UploadError, upload: ChunkedUpload = None) -> JsonResponse:
+    response = JsonResponse({'error': str(error)}, status=error.status)
+    if upload is not None:
+        response['Upload-Offset'] = upload.offset
+    return response
+
+
+class UploadAccessMixin:
+    """
+    Загрузку видит её автор или staff. Загрузки анонимных пользователей
+    доступны по ссылке: UUID в URL не подобрать.
+    """
+
+    def get_upload(self, request: HttpRequest, pk) -> ChunkedUpload:
+        upload = get_object_or_404(ChunkedUpload, pk=pk)
+        if upload.created_by_id is not None and not request.user.is_staff:
+            if upload.created_by_id != request.user.pk:
+                raise Http404
+        return upload
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChunkedUploadCreateView(View):
+    def post(self, request: HttpRequest) -> JsonResponse:
+        try:
+            data = json.loads(request.body)
+            filename = safe_filename(str(data['filename']))
+            size = int(data['size'])
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'error': 'Expected JSON with "filename" and "size".'}, status=400)
+        if not filename:
+            return JsonResponse({'error': 'Invalid filename.'}, status=400)
+        try:
+            upload = create_upload(filename, size, str(data.get('sha256') or ''), request.user)
+        except UploadError as error:
+            return upload_error_response(error)
+        response = JsonResponse(upload_to_dict(upload), status=201)
+        response['Location'] = upload.get_absolute_url()
+        response['Upload-Offset'] = upload.offset
+        return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChunkedUploadView(UploadAccessMixin, View):
+    def get(self, request: HttpRequest, pk) -> JsonResponse:
+        upload = self.get_upload(request, pk)
+        response = JsonResponse(upload_to_dict(upload))
+        response['Upload-Offset'] = upload.offset
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def patch(self, request: HttpRequest, pk) -> JsonResponse:
+        upload = self.get_upload(request, pk)
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Upload-Offset and Content-Length are required.'}, status=400)
+        try:
+            # request читается как поток: тело не попадает в память целиком
+            upload = append_chunk(upload, request, offset, length, request.headers.get('Upload-Checksum', ''))
+        except UploadError as error:
+            return upload_error_response(error, upload)
+        response = JsonResponse(upload_to_dict(upload))
+        response['Upload-Offset'] = upload.offset
+        return response
+
+    def delete(self, request: HttpRequest, pk) -> HttpResponse:
+        upload = self.get_upload(request, pk)
+        discard_part(upload)
+        if upload.file:
+            upload.file.delete(save=False)
+        upload.delete()
+        return HttpResponse(status=204)
@@ -7,9 +7,12 @@ from django.contrib.auth.models import User
 from django.db.models import QuerySet
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import render, redirect
-from django.urls import path
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-from .common import save_csv_products, save_csv_orders
+from jobsapp.models import Job
+
+from .caching import PRODUCTS_TAG, bump_tags, product_tag
 from .models import Product, Order, ProductImage
 from .admin_mixins import ExportAsCSVMixin
 from .forms import CSVImportForm
@@ -26,10 +29,21 @@ class ProductInLine(admin.StackedInline):
 @admin.action(description='Archive products')
 def mark_archived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
     queryset.update(archived=True)
+    # update() не шлёт post_save, сбрасываем кеш товаров сами
+    bump_products_cache(queryset)
 
 @admin.action(description='Unarchive products')
 def mark_unarchived(modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet):
     queryset.update(archived=False)
+    bump_products_cache(queryset)
+
+
+def bump_products_cache(queryset: QuerySet) -> None:
+    bump_tags(PRODUCTS_TAG, *(product_tag(pk) for pk in queryset.values_list("pk", flat=True)))
+
+
+def job_admin_url(job: Job) -> str:
+    return reverse("admin:jobsapp_job_change", args=[job.pk])
 
 
 @admin.register(Product)
@@ -87,12 +101,19 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
             }
             return render(request, "admin/csv_form.html", context, status=400)
 
-        save_csv_products(
-            file=form.files["csv_file"].file,
-            encoding=request.encoding,
-            request=request,
+        job = Job.objects.enqueue(
+            "shopapp.import_products",
+            payload={"encoding": request.encoding},
+            input_file=form.files["csv_file"],
+            user=request.user,
+        )
+        self.message_user(
+            request,
+            format_html(
+                'CSV import was queued, see <a href="{}">job status</a>',
+                job_admin_url(job),
+            ),
         )
-        self.message_user(request, "Data from CSV was imported")
         return redirect("..")
 
     def get_urls(self):
@@ -141,12 +162,19 @@ class OrderAdmin(admin.ModelAdmin):
             context = {"form": form}
             return render(request, "admin/csv_form.html", context, status=400)
 
-        orders_created = save_csv_orders(
-            file=form.files["csv_file"].file,
-            encoding=request.encoding
+        job = Job.objects.enqueue(
+            "shopapp.import_orders",
+            payload={"encoding": request.encoding},
+            input_file=form.files["csv_file"],
+            user=request.user,
+        )
+        self.message_user(
+            request,
+            format_html(
+                'Импорт заказов поставлен в очередь, <a href="{}">статус задачи</a>',
+                job_admin_url(job),
+            ),
         )
-
-        self.message_user(request, f"{orders_created} заказов было импортировано из CSV.")
         return redirect("..")
 
     def get_urls(self):
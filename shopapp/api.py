@@ -3,43 +3,61 @@
 
 API view интернет-магазина: по товарам, заказам и т.д.
 """
-from csv import DictWriter
-
-from django.http import HttpResponse  # <-- 1. Импорт на месте
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.http import HttpRequest, QueryDict, StreamingHttpResponse
 
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework import status
 from rest_framework.parsers import MultiPartParser
 
 from django_filters.rest_framework import DjangoFilterBackend
 
 from drf_spectacular.utils import extend_schema, OpenApiResponse
 
-from .common import save_csv_products
+from jobsapp.models import Job
+from jobsapp.views import job_to_dict
+from mysite.query_optimization import QueryOptimizationMixin
+
+from .caching import PRODUCTS_TAG, product_tag
+from .common import stream_csv
+from .pagination import KeysetPagination
+from .read_serializers import CompiledReadMixin
+from .response_cache import ResponseCacheMixin
+from .search import FullTextSearchFilter
 from .serializers import ProductSerializer, OrderSerializer
 
 from .models import Product, Order
 
 
+def job_response(job: Job) -> Response:
+    """
+    202 с описанием поставленной задачи и ссылкой на её статус.
+    """
+    data = job_to_dict(job)
+    data["status_url"] = job.get_absolute_url()
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={"Location": data["status_url"]})
+
+
 @extend_schema(description="Product views CRUD")
-class ProductViewSet(ModelViewSet):
+class ProductViewSet(ResponseCacheMixin, QueryOptimizationMixin, CompiledReadMixin, ModelViewSet):
     """
     Набор представлений для действий над Product
     Полный CRUD для сущностей товара
     """
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = KeysetPagination
     filter_backends = [
-        SearchFilter,
+        FullTextSearchFilter,
         DjangoFilterBackend,
         OrderingFilter,
     ]
     search_fields = ["name", "description"]
+    search_index = "search_index"
     filterset_fields = [
         "name",
         "description",
@@ -53,10 +71,15 @@ class ProductViewSet(ModelViewSet):
         "discount",
     ]
 
-    @method_decorator(cache_page(60 * 2))
-    def list(self, *args, **kwargs):
+    def get_response_cache_tags(self) -> list:
+        # список зависит от всех товаров, карточка — только от своего
+        if self.action == "retrieve":
+            return [product_tag(self.kwargs[self.lookup_url_kwarg or self.lookup_field])]
+        return [PRODUCTS_TAG]
+
+    def list(self, request, *args, **kwargs):
         # print("hello products list")
-        return super().list(*args, **kwargs)
+        return self.cached_response(request, lambda: super(ProductViewSet, self).list(request, *args, **kwargs))
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
@@ -69,31 +92,65 @@ class ProductViewSet(ModelViewSet):
             404: OpenApiResponse(description="Empty response, product by id not found"),
         }
     )
-    def retrieve(self, *args, **kwargs):
-        return super().retrieve(*args, **kwargs)
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(ProductViewSet, self).retrieve(request, *args, **kwargs))
+
+    csv_fields = [
+        "pk",
+        "name",
+        "description",
+        "price",
+        "discount",
+        "created_at",
+        "archived",
+    ]
+    csv_default_fields = [
+        "name",
+        "description",
+        "price",
+        "discount",
+    ]
+    csv_chunk_size = 2000
+
+    def get_csv_fields(self, request: Request) -> list:
+        param = request.query_params.get("fields")
+        if not param:
+            return self.csv_default_fields
+        fields = [field.strip() for field in param.split(",") if field.strip()]
+        unknown = [field for field in fields if field not in self.csv_fields]
+        if unknown or not fields:
+            raise ValidationError({
+                "fields": f"Allowed fields: {', '.join(self.csv_fields)}",
+            })
+        return fields
 
+    @extend_schema(
+        summary="Download filtered products as CSV",
+        description=(
+            "Streams CSV rows; `fields=name,price` selects columns. "
+            "`async=1` queues a background export and returns 202 with the job status URL"
+        ),
+    )
     @action(methods=["get"], detail=False)
     def download_csv(self, request: Request):
-        response = HttpResponse(content_type='text/csv')
+        fields = self.get_csv_fields(request)
+        if request.query_params.get("async") == "1":
+            query = request.query_params.copy()
+            query.pop("async")
+            job = Job.objects.enqueue(
+                "shopapp.export_products_csv",
+                payload={"fields": fields, "query": query.urlencode()},
+                user=request.user,
+            )
+            return job_response(job)
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = queryset.values_list(*fields).iterator(chunk_size=self.csv_chunk_size)
+        response = StreamingHttpResponse(
+            stream_csv(fields, rows),
+            content_type="text/csv",
+        )
         filename = "products-export.csv"
         response['Content-Disposition'] = f'attachment; filename={filename}'
-        queryset = self.filter_queryset(self.get_queryset())
-        fields = [
-            'name',
-            "description",
-            "price",
-            "discount",
-        ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({
-                field: getattr(product, field)
-                for field in fields
-            })
-
         return response
 
     @action(
@@ -102,18 +159,31 @@ class ProductViewSet(ModelViewSet):
         parser_classes=[MultiPartParser],
     )
     def upload_csv(self, request: Request):
-        products = save_csv_products(
-            request.FILES["file"].file,
-            encoding=request.encoding,
-            request=request
+        # импорт идёт в фоне (см. shopapp.tasks), отвечаем сразу ссылкой на статус
+        job = Job.objects.enqueue(
+            "shopapp.import_products",
+            payload={"encoding": request.encoding},
+            input_file=request.FILES["file"],
+            user=request.user,
         )
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+        return job_response(job)
+
+    @classmethod
+    def get_export_queryset(cls, query_string: str):
+        """
+        Товары, отфильтрованные так же, как в list по строке запроса,
+        но без HTTP-запроса — для фоновой выгрузки.
+        """
+        http_request = HttpRequest()
+        http_request.GET = QueryDict(query_string)
+        view = cls(request=Request(http_request), format_kwarg=None, action="download_csv")
+        return view.filter_queryset(view.get_queryset())
 
 
-class OrderViewSet(ModelViewSet):
+class OrderViewSet(QueryOptimizationMixin, CompiledReadMixin, ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['user', 'promocode']
     ordering_fields = ['created_at', 'user']
\ No newline at end of file
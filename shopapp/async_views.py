@@ -0,0 +1,96 @@
+"""
+Асинхронные версии представлений магазина на чтение.
+
+Подключаются вместо синхронных в shopapp/urls.py, когда включён
+ASYNC_VIEWS (режим ASGI, см. mysite/asgi.py). Данные читаются через
+async ORM и async API кеша; TemplateResponse Django рендерит сам
+в отдельном потоке, так что шаблоны могут по-прежнему обращаться к сессии
+и пользователю.
+"""
+from django.contrib.auth.models import User
+from django.http import Http404, HttpRequest, JsonResponse
+
+from mysite.async_views import AsyncFeedMixin
+from mysite.query_optimization import optimize_queryset
+
+from .caching import (
+    EXPORT_CACHE_TIMEOUT,
+    ORDERS_TAG,
+    PRODUCTS_TAG,
+    aget_or_compute,
+    atagged_key,
+    user_orders_tag,
+)
+from .models import Order, Product
+from .serializers import OrderSerializer
+from .views import (
+    LatestProductsFeed,
+    ProductDetailsView,
+    ProductsDataExportView,
+    ProductsListView,
+    UserOrdersExportView,
+)
+
+
+class AsyncProductsListView(ProductsListView):
+    async def get(self, request: HttpRequest, *args, **kwargs):
+        self.object_list = [product async for product in self.get_queryset()]
+        return self.render_to_response(self.get_context_data())
+
+
+class AsyncProductDetailsView(ProductDetailsView):
+    async def get(self, request: HttpRequest, *args, **kwargs):
+        self.object = await self.aget_object()
+        return self.render_to_response(self.get_context_data(object=self.object))
+
+    async def aget_object(self) -> Product:
+        try:
+            return await self.get_queryset().aget(pk=self.kwargs[self.pk_url_kwarg])
+        except Product.DoesNotExist:
+            raise Http404("No product found matching the query")
+
+
+class AsyncProductsDataExportView(ProductsDataExportView):
+    async def get(self, request: HttpRequest) -> JsonResponse:
+        cache_key = await atagged_key("products_data_export", PRODUCTS_TAG)
+        products_data = await aget_or_compute(cache_key, self.aget_products_data, EXPORT_CACHE_TIMEOUT)
+        return JsonResponse({"products": products_data})
+
+    async def aget_products_data(self) -> list:
+        return [
+            product
+            async for product in (
+                Product.objects.using(self.get_using(Product)).order_by("pk").values("pk", "name", "price", "archived")
+            )
+        ]
+
+
+class AsyncUserOrdersExportView(UserOrdersExportView):
+    async def get(self, request: HttpRequest, user_id: int) -> JsonResponse:
+        cache_key = await atagged_key(
+            f"user_orders_export_{user_id}",
+            ORDERS_TAG,
+            user_orders_tag(user_id),
+        )
+        orders_data = await aget_or_compute(
+            cache_key,
+            lambda: self.aget_orders_data(user_id),
+            EXPORT_CACHE_TIMEOUT,
+        )
+        return JsonResponse({"orders": orders_data})
+
+    async def aget_orders_data(self, user_id: int) -> list:
+        using = self.get_using(Order)
+        if not await User.objects.using(using).filter(pk=user_id).aexists():
+            raise Http404("No user found matching the query")
+        queryset = optimize_queryset(
+            Order.objects.using(using).filter(user_id=user_id).order_by('pk'),
+            OrderSerializer,
+        )
+        # товары заказов приходят prefetch'ем, сериализация уже без запросов
+        orders = [order async for order in queryset]
+        return OrderSerializer(orders, many=True).data
+
+
+class AsyncLatestProductsFeed(AsyncFeedMixin, LatestProductsFeed):
+    pass
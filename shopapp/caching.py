@@ -0,0 +1,206 @@
+"""
+Версионированные ключи кеша для магазина.
+
+Каждый тег (``products``, ``orders``, заказы конкретного пользователя)
+хранит в кеше номер версии. Ключ данных собирается из имени и текущих
+версий его тегов, поэтому, чтобы сбросить все зависимые записи,
+достаточно увеличить версию тега — старые записи просто перестают
+читаться и вытесняются по TTL.
+
+У функций чтения есть async-версии с префиксом ``a`` для асинхронных
+представлений (см. shopapp.async_views).
+"""
+import asyncio
+import math
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+from django.core.cache import cache
+
+PRODUCTS_TAG = "products"
+ORDERS_TAG = "orders"
+
+EXPORT_CACHE_TIMEOUT = 60 * 60 * 6
+
+TAG_VERSION_TIMEOUT = None
+TAG_KEY_PREFIX = "tag-version"
+
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+LOCK_POLL_INTERVAL = 0.05
+
+
+def user_orders_tag(user_id: int) -> str:
+    return f"orders:user:{user_id}"
+
+
+def product_tag(product_id: int) -> str:
+    return f"products:{product_id}"
+
+
+def _tag_key(tag: str) -> str:
+    return f"{TAG_KEY_PREFIX}:{tag}"
+
+
+def _initial_version() -> int:
+    # Версия от времени, а не с нуля: если ключ версии вытеснили из кеша,
+    # новая версия не совпадёт со старой и не воскресит устаревшие данные.
+    return int(time.time() * 1000)
+
+
+def get_tag_versions(*tags: str) -> list:
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _initial_version()
+            if not cache.add(key, version, TAG_VERSION_TIMEOUT):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+async def aget_tag_versions(*tags: str) -> list:
+    keys = [_tag_key(tag) for tag in tags]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _initial_version()
+            if not await cache.aadd(key, version, TAG_VERSION_TIMEOUT):
+                version = await cache.aget(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def bump_tags(*tags: str) -> None:
+    for tag in tags:
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), TAG_VERSION_TIMEOUT)
+
+
+def tagged_key(name: str, *tags: str) -> str:
+    """
+    Ключ кеша для ``name``, зависящий от версий ``tags``.
+    """
+    versions = get_tag_versions(*tags)
+    suffix = ".".join(
+        f"{tag}={version}" for tag, version in zip(tags, versions)
+    )
+    return f"{name}:{suffix}"
+
+
+async def atagged_key(name: str, *tags: str) -> str:
+    versions = await aget_tag_versions(*tags)
+    suffix = ".".join(
+        f"{tag}={version}" for tag, version in zip(tags, versions)
+    )
+    return f"{name}:{suffix}"
+
+
+def get_or_compute(
+    key: str,
+    compute: Callable[[], Any],
+    timeout: int,
+    stale_timeout: Optional[int] = None,
+    beta: float = 1.0,
+) -> Any:
+    """
+    Достаёт значение из кеша или считает его, но только в одном воркере.
+
+    Рядом со значением хранится время его расчёта и момент устаревания.
+    Незадолго до устаревания запрос с вероятностью, растущей к концу TTL,
+    берётся за пересчёт заранее (probabilistic early expiration). Пересчитывает
+    только тот, кто взял ключ-блокировку; остальные в это время отдают
+    устаревшее значение, которое живёт в кеше ещё ``stale_timeout`` секунд.
+    При холодном промахе остальные ждут результата до ``LOCK_WAIT`` секунд.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, delta, expires_at = entry
+        # 1 - random() лежит в (0, 1], логарифм не упадёт на нуле
+        if time.time() - delta * beta * math.log(1.0 - random.random()) < expires_at:
+            return value
+        if not cache.add(lock_key, token, LOCK_TIMEOUT):
+            return value
+    elif not cache.add(lock_key, token, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry[0]
+        # владелец блокировки не успел — считаем сами, без блокировки
+        return compute()
+
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        cache.set(key, (value, delta, time.time() + timeout), timeout + stale_timeout)
+        return value
+    finally:
+        release_lock(lock_key, token)
+
+
+def release_lock(lock_key: str, token: str) -> None:
+    # если расчёт шёл дольше LOCK_TIMEOUT, блокировка истекла и могла
+    # достаться другому воркеру — чужую не трогаем
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+async def arelease_lock(lock_key: str, token: str) -> None:
+    if await cache.aget(lock_key) == token:
+        await cache.adelete(lock_key)
+
+
+async def aget_or_compute(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    timeout: int,
+    stale_timeout: Optional[int] = None,
+    beta: float = 1.0,
+) -> Any:
+    """
+    То же, что get_or_compute, но ``compute`` — корутина,
+    а ожидание чужого пересчёта не занимает поток.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = f"{key}:lock"
+    token = uuid.uuid4().hex
+
+    entry = await cache.aget(key)
+    if entry is not None:
+        value, delta, expires_at = entry
+        if time.time() - delta * beta * math.log(1.0 - random.random()) < expires_at:
+            return value
+        if not await cache.aadd(lock_key, token, LOCK_TIMEOUT):
+            return value
+    elif not await cache.aadd(lock_key, token, LOCK_TIMEOUT):
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LOCK_POLL_INTERVAL)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry[0]
+        return await compute()
+
+    try:
+        started = time.time()
+        value = await compute()
+        delta = time.time() - started
+        await cache.aset(key, (value, delta, time.time() + timeout), timeout + stale_timeout)
+        return value
+    finally:
+        await arelease_lock(lock_key, token)
@@ -1,59 +1,322 @@
-from csv import DictReader
-from io import TextIOWrapper
+import zlib
+from csv import DictReader, writer as csv_writer
+from dataclasses import dataclass, field
+from io import StringIO, TextIOWrapper
+from timeit import default_timer
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, transaction
+
+from shopapp.caching import PRODUCTS_TAG, bump_tags, user_orders_tag
 from shopapp.models import Product, Order
 
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ERRORS = 100
 
-def save_csv_products(file, encoding,request):
-    csv_file = TextIOWrapper(
-        file,
-        encoding=encoding,
-    )
-    reader = DictReader(csv_file)
 
-    products_to_create = []
-    for row in reader:
-        created_by_user = None
-        if request.user.is_authenticated:
-            created_by_user = request.user
-
-        product = Product(
-            name=row["name"],
-            description=row["description"],
-            price=float(row["price"]),
-            discount=int(row["discount"]),
-            created_by=created_by_user
-        )
-        products_to_create.append(product)
+@dataclass
+class ImportReport:
+    """
+    Итог импорта CSV: сколько строк создано и отклонено, за сколько секунд.
+
+    ``errors`` хранит не больше ``max_errors`` первых ошибок вида
+    ``(номер строки, сообщение)``, ``rejected`` считает все.
+    """
+    created: int = 0
+    rejected: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+    errors: list = field(default_factory=list)
+    max_errors: int = IMPORT_MAX_ERRORS
+
+    def reject(self, line: int, message: str, rows: int = 1) -> None:
+        self.rejected += rows
+        if len(self.errors) < self.max_errors:
+            self.errors.append((line, message))
 
-    Product.objects.bulk_create(products_to_create)
-    return products_to_create
+    def as_dict(self) -> dict:
+        return {
+            "created": self.created,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "elapsed": round(self.elapsed, 3),
+            "errors": [
+                {"line": line, "error": message}
+                for line, message in self.errors
+            ],
+        }
 
 
-def save_csv_orders(file, encoding):
+def open_csv(file, encoding: Optional[str]) -> DictReader:
     csv_file = TextIOWrapper(
         file,
-        encoding=encoding,
+        encoding=encoding or "utf-8",
+        newline="",
     )
-    reader = DictReader(csv_file)
+    return DictReader(csv_file)
+
+
+def _format_error(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "; ".join(error.messages)
+    if isinstance(error, KeyError):
+        return f"missing column {error.args[0]!r}"
+    return str(error)
+
+
+PRODUCT_CSV_FIELDS = ("name", "description", "price", "discount")
+
+
+def build_product(row: dict, created_by: Optional[User]) -> Product:
+    """
+    Собирает Product из строки CSV, проверяя значения валидаторами полей модели.
+    """
+    values = {}
+    errors = {}
+    for name in PRODUCT_CSV_FIELDS:
+        model_field = Product._meta.get_field(name)
+        raw = row[name]
+        if raw is None:
+            raise KeyError(name)
+        raw = raw.strip()
+        if raw == "" and model_field.has_default():
+            values[name] = model_field.get_default()
+            continue
+        try:
+            values[name] = model_field.clean(raw, None)
+        except ValidationError as error:
+            errors[name] = error.messages
+    if errors:
+        raise ValidationError([
+            f"{name}: {' '.join(messages)}" for name, messages in errors.items()
+        ])
+    return Product(created_by=created_by, **values)
+
+
+def save_csv_products(
+    file,
+    encoding: Optional[str],
+    created_by: Optional[User] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_batch: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    """
+    Потоковый импорт товаров из CSV.
+
+    Файл читается построчно, в памяти держится только текущая пачка
+    из ``batch_size`` товаров; каждая пачка пишется bulk_create в своей
+    транзакции. Некорректные строки не прерывают импорт, а попадают в отчёт.
+    ``on_batch`` вызывается после каждой пачки (например, для прогресса).
+    """
+    started = default_timer()
+    report = ImportReport()
+    reader = open_csv(file, encoding)
+    batch = []
+    batch_line = None
+
+    def flush():
+        if not batch:
+            return
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(batch)
+        except DatabaseError as error:
+            report.reject(batch_line, f"batch failed: {error}", rows=len(batch))
+        else:
+            report.created += len(batch)
+        report.batches += 1
+        batch.clear()
+        if on_batch is not None:
+            on_batch(report)
 
-    orders_created = 0
     for row in reader:
         try:
-            user = User.objects.get(pk=row["user_id"])
-            order = Order.objects.create(
-                user=user,
-                delivery_address=row["delivery_address"],
-                promocode=row["promocode"]
+            product = build_product(row, created_by)
+        except (KeyError, ValidationError) as error:
+            report.reject(reader.line_num, _format_error(error))
+            continue
+        if not batch:
+            batch_line = reader.line_num
+        batch.append(product)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if report.created:
+        # bulk_create не шлёт post_save — сбрасываем кеш товаров сами
+        bump_tags(PRODUCTS_TAG)
+    report.elapsed = default_timer() - started
+    return report
+
+
+def parse_order_row(row: dict) -> dict:
+    """
+    Разбирает строку CSV заказа; пользователей и товары не проверяет —
+    это делается одним запросом на всю пачку.
+    """
+    errors = []
+    values = {}
+    for name in ("delivery_address", "promocode"):
+        raw = row[name]
+        if raw is None:
+            raise KeyError(name)
+        try:
+            values[name] = Order._meta.get_field(name).clean(raw.strip(), None)
+        except ValidationError as error:
+            errors.append(f"{name}: {' '.join(error.messages)}")
+    try:
+        values["user_id"] = int(row["user_id"])
+    except (TypeError, ValueError):
+        if row["user_id"] is None:
+            raise KeyError("user_id")
+        errors.append(f"user_id: {row['user_id']!r} is not a number")
+    raw_products = row["product_ids"]
+    if raw_products is None:
+        raise KeyError("product_ids")
+    try:
+        values["product_ids"] = {
+            int(pk) for pk in raw_products.split(",") if pk.strip()
+        }
+    except ValueError:
+        errors.append(f"product_ids: {raw_products!r} is not a list of numbers")
+    if errors:
+        raise ValidationError(errors)
+    return values
+
+
+def save_csv_orders(
+    file,
+    encoding: Optional[str],
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_batch: Optional[Callable[[ImportReport], None]] = None,
+) -> ImportReport:
+    """
+    Импорт заказов из CSV пачками.
+
+    На пачку уходит по одному запросу ``IN`` за пользователями и товарами,
+    один bulk_create заказов и один bulk_create строк связи
+    Order.products, всё в одной транзакции. Строки с неизвестным
+    пользователем или товаром отклоняются и попадают в отчёт.
+    """
+    started = default_timer()
+    report = ImportReport()
+    reader = open_csv(file, encoding)
+    through = Order.products.through
+    touched_users = set()
+    batch = []
+
+    def flush():
+        if not batch:
+            return
+        write_batch()
+        if on_batch is not None:
+            on_batch(report)
+
+    def write_batch():
+        user_ids = set(
+            User.objects
+            .filter(pk__in={values["user_id"] for line, values in batch})
+            .values_list("pk", flat=True)
+        )
+        product_ids = set(
+            Product.objects
+            .filter(pk__in=set().union(*(values["product_ids"] for line, values in batch)))
+            .values_list("pk", flat=True)
+        )
+        accepted = []
+        for line, values in batch:
+            if values["user_id"] not in user_ids:
+                report.reject(line, f"user {values['user_id']} does not exist")
+                continue
+            missing = values["product_ids"] - product_ids
+            if missing:
+                report.reject(line, f"products {sorted(missing)} do not exist")
+                continue
+            accepted.append((line, values))
+        batch.clear()
+        report.batches += 1
+        if not accepted:
+            return
+
+        orders = [
+            Order(
+                user_id=values["user_id"],
+                delivery_address=values["delivery_address"],
+                promocode=values["promocode"],
             )
+            for line, values in accepted
+        ]
+        try:
+            with transaction.atomic():
+                Order.objects.bulk_create(orders)
+                through.objects.bulk_create([
+                    through(order_id=order.pk, product_id=product_id)
+                    for order, (line, values) in zip(orders, accepted)
+                    for product_id in values["product_ids"]
+                ])
+        except DatabaseError as error:
+            report.reject(accepted[0][0], f"batch failed: {error}", rows=len(accepted))
+            return
+        report.created += len(orders)
+        touched_users.update(values["user_id"] for line, values in accepted)
+
+    for row in reader:
+        try:
+            batch.append((reader.line_num, parse_order_row(row)))
+        except (KeyError, ValidationError) as error:
+            report.reject(reader.line_num, _format_error(error))
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if touched_users:
+        # bulk_create не шлёт post_save и m2m_changed
+        bump_tags(*(user_orders_tag(user_id) for user_id in touched_users))
+    report.elapsed = default_timer() - started
+    return report
+
+
+CSV_STREAM_BUFFER_SIZE = 64 * 1024
+
+
+def stream_csv(
+    header: Sequence[str],
+    rows: Iterable[Sequence],
+    compress: bool = False,
+    buffer_size: int = CSV_STREAM_BUFFER_SIZE,
+) -> Iterator[bytes]:
+    """
+    Отдаёт CSV по кусочкам для StreamingHttpResponse.
+
+    Строки копятся в небольшом буфере и сбрасываются блоками
+    по ``buffer_size`` символов, так что память не зависит от числа строк.
+    При ``compress=True`` блоки сжимаются gzip на лету.
+    """
+    buffer = StringIO()
+    writer = csv_writer(buffer)
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
 
-            product_pks = row["product_ids"].split(',')
-            products = Product.objects.filter(pk__in=product_pks)
-            order.products.set(products)
-            orders_created += 1
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        if compressor is not None:
+            data = compressor.compress(data)
+        return data
 
-        except Exception as e:
-            print(f"Ошибка импорта заказа: {e} для строки: {row}")
-            pass
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= buffer_size:
+            chunk = flush()
+            if chunk:
+                yield chunk
 
-    return orders_created
\ No newline at end of file
+    chunk = flush()
+    if compressor is not None:
+        chunk += compressor.flush()
+    if chunk:
+        yield chunk
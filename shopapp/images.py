@@ -0,0 +1,173 @@
+"""
+Уменьшенные копии (варианты) картинок товаров.
+
+Оригинал из ``Product.preview`` или ``ProductImage.image`` пережимается
+в несколько размеров, каждый в WebP и JPEG. Варианты лежат рядом
+с оригиналом: ``foo.png`` -> ``foo.card.webp``, ``foo.card.jpg``.
+Считает их фоновая задача ``shopapp.image_variants`` (см. :mod:`shopapp.tasks`),
+а в шаблонах их отдаёт тег ``{% picture %}`` из ``product_images``.
+
+Готовы ли варианты, тег узнаёт из кеша: задача отмечает картинку после
+записи всех файлов, так что список товаров не обходит диск.
+"""
+import hashlib
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, transaction
+from PIL import Image, ImageOps
+
+from jobsapp.models import Job
+
+from .models import Product, ProductImage
+
+# имя варианта -> максимальные ширина и высота
+IMAGE_VARIANTS = {
+    "card": (320, 320),
+    "detail": (1024, 1024),
+}
+
+# сколько файлов одновременно пишется в storage при загрузке
+IMAGE_UPLOAD_WORKERS = 8
+
+# расширение -> формат Pillow и параметры сохранения
+IMAGE_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+# сколько помнить, что варианты готовы или ещё нет
+VARIANTS_READY_TIMEOUT = 60 * 60 * 24
+VARIANTS_PENDING_TIMEOUT = 30
+
+
+def variant_name(name: str, variant: str, ext: str) -> str:
+    root, _ = posixpath.splitext(name)
+    return f"{root}.{variant}.{ext}"
+
+
+def last_variant_name(name: str) -> str:
+    """
+    Файл, который ``generate_variants`` пишет последним: есть он — есть все.
+    """
+    return variant_name(name, list(IMAGE_VARIANTS)[-1], "jpg")
+
+
+def _variants_key(name: str, storage) -> str:
+    # у разных storage (и MEDIA_ROOT в тестах) одно имя — разные файлы
+    location = getattr(storage, "location", "")
+    return "image-variants:" + hashlib.md5(f"{location}|{name}".encode()).hexdigest()
+
+
+def variants_ready(name: str, storage=default_storage) -> bool:
+    """
+    Созданы ли варианты картинки ``name``. Диск проверяется, только если
+    в кеше нет ответа; «ещё нет» помнится недолго.
+    """
+    key = _variants_key(name, storage)
+    ready = cache.get(key)
+    if ready is None:
+        ready = storage.exists(last_variant_name(name))
+        cache.set(key, ready, VARIANTS_READY_TIMEOUT if ready else VARIANTS_PENDING_TIMEOUT)
+    return ready
+
+
+def generate_variants(name: str, storage=default_storage) -> list:
+    """
+    Создаёт все варианты картинки ``name`` и возвращает их имена.
+
+    JPEG записывается последним, поэтому его наличие значит,
+    что готовы и остальные форматы этого размера.
+    """
+    largest = max(max(size) for size in IMAGE_VARIANTS.values())
+    with storage.open(name, "rb") as file:
+        original = Image.open(file)
+        # JPEG декодируется сразу в уменьшенном масштабе (DCT scaling)
+        original.draft("RGB", (largest * 2, largest * 2))
+        original = ImageOps.exif_transpose(original)
+
+    created = []
+    for variant, size in IMAGE_VARIANTS.items():
+        image = original.copy()
+        # reducing_gap: сначала быстрое reduce(), затем LANCZOS
+        image.thumbnail(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+        if image.mode not in ("RGB", "L"):
+            image = _flatten(image)
+        for ext, (image_format, params) in IMAGE_FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, image_format, **params)
+            target = variant_name(name, variant, ext)
+            if storage.exists(target):
+                storage.delete(target)
+            created.append(storage.save(target, ContentFile(buffer.getvalue())))
+    cache.set(_variants_key(name, storage), True, VARIANTS_READY_TIMEOUT)
+    return created
+
+
+def _flatten(image: Image.Image) -> Image.Image:
+    # у JPEG нет прозрачности: кладём картинку на белый фон
+    image = image.convert("RGBA")
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def enqueue_image_variants(name: str) -> None:
+    # после коммита: воркер должен увидеть и задачу, и сохранённый файл
+    transaction.on_commit(
+        lambda: Job.objects.enqueue("shopapp.image_variants", {"name": name})
+    )
+
+
+@dataclass
+class ImageUploadReport:
+    images: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+
+
+def attach_product_images(product: Product, files, max_workers: int = IMAGE_UPLOAD_WORKERS) -> ImageUploadReport:
+    """
+    Прикрепляет к товару сразу много картинок.
+
+    Файлы пишутся в storage параллельно на пуле потоков, строки ProductImage
+    вставляются одним bulk_create. Битые файлы не мешают остальным
+    и попадают в ``errors`` как ``(имя файла, ошибка)``.
+    """
+    report = ImageUploadReport()
+    if not files:
+        return report
+    image_field = ProductImage._meta.get_field("image")
+
+    def store(file) -> str:
+        Image.open(file).verify()
+        file.seek(0)
+        name = image_field.generate_filename(ProductImage(product=product), file.name)
+        return image_field.storage.save(name, file, max_length=image_field.max_length)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(files))) as pool:
+        futures = [(file.name, pool.submit(store, file)) for file in files]
+    names = []
+    for filename, future in futures:
+        try:
+            names.append(future.result())
+        except (OSError, SyntaxError, ValueError) as error:
+            # Pillow сообщает о битых картинках через OSError и SyntaxError
+            report.errors.append((filename, str(error) or error.__class__.__name__))
+
+    report.images = [ProductImage(product=product, image=name) for name in names]
+    try:
+        ProductImage.objects.bulk_create(report.images)
+    except DatabaseError:
+        for name in names:
+            image_field.storage.delete(name)
+        raise
+    # bulk_create не шлёт post_save, варианты ставим в очередь сами
+    for name in names:
+        enqueue_image_variants(name)
+    return report
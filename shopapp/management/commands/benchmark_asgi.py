@@ -0,0 +1,152 @@
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import quantiles
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+DEFAULT_PATHS = [
+    "/en/shop/products/",
+    "/en/shop/products/export/",
+    "/en/shop/products/latest/feed/",
+    "/en/blog/articles/latest/feed/",
+]
+
+SERVERS = {
+    # синхронные воркеры gunicorn и обычные представления
+    "wsgi": ["mysite.wsgi:application"],
+    # uvicorn-воркеры под gunicorn и асинхронные представления
+    "asgi": ["mysite.asgi:application", "-k", "uvicorn.workers.UvicornWorker"],
+}
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает пропускную способность WSGI (gunicorn) и ASGI (uvicorn)
+    на одних и тех же страницах и одном числе воркеров.
+
+    Каждый сервер запускается отдельным процессом на свободном порту,
+    затем ``--concurrency`` клиентов с keep-alive ``--duration`` секунд
+    по кругу запрашивают ``--path``. Лимиты запросов на время замера
+    выключаются. Нужны gunicorn и uvicorn из requirements.txt.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--duration", type=float, default=10)
+        parser.add_argument("--path", action="append", dest="paths")
+        parser.add_argument("--mode", choices=sorted(SERVERS), action="append", dest="modes")
+
+    def handle(self, *args, **options):
+        paths = options["paths"] or DEFAULT_PATHS
+        modes = options["modes"] or ["wsgi", "asgi"]
+        self.stdout.write(
+            f"{options['workers']} workers, {options['concurrency']} clients, "
+            f"{options['duration']:g} s per server, {len(paths)} paths"
+        )
+        for mode in modes:
+            port = self.free_port()
+            server = self.start_server(mode, port, options["workers"])
+            try:
+                self.wait_ready(server, port, paths[0])
+                requests, errors, latencies, elapsed = self.load(
+                    port, paths, options["concurrency"], options["duration"],
+                )
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+            self.stdout.write(self.style.SUCCESS(mode))
+            if len(latencies) < 2:
+                self.stdout.write(f"  too few successful requests ({requests}), {errors} errors")
+                continue
+            p50, p95, p99 = (quantiles(latencies, n=100)[i] for i in (49, 94, 98))
+            self.stdout.write(
+                f"  {requests / elapsed:>8.0f} req/s  errors {errors}  "
+                f"p50 {p50 * 1000:.1f} ms  p95 {p95 * 1000:.1f} ms  p99 {p99 * 1000:.1f} ms"
+            )
+
+    @staticmethod
+    def free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def start_server(self, mode: str, port: int, workers: int) -> subprocess.Popen:
+        env = dict(
+            os.environ,
+            DJANGO_SETTINGS_MODULE=os.environ.get("DJANGO_SETTINGS_MODULE", "mysite.settings"),
+            DJANGO_ASYNC_VIEWS="1" if mode == "asgi" else "0",
+            DJANGO_RATELIMIT_ENABLED="0",
+        )
+        command = [
+            sys.executable, "-m", "gunicorn", *SERVERS[mode],
+            "--workers", str(workers),
+            "--bind", f"127.0.0.1:{port}",
+            "--log-level", "warning",
+        ]
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+
+    @staticmethod
+    def wait_ready(server: subprocess.Popen, port: int, path: str, timeout: float = 30) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Server exited with code {server.returncode}")
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+                connection.request("GET", path)
+                connection.getresponse().read()
+                connection.close()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError(f"Server on port {port} did not start in {timeout:g} s")
+
+    @staticmethod
+    def load(port: int, paths: list, concurrency: int, duration: float):
+        lock = threading.Lock()
+        latencies = []
+        counters = {"requests": 0, "errors": 0}
+        started = time.perf_counter()
+        deadline = started + duration
+
+        def client(index: int) -> None:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            own_latencies = []
+            errors = 0
+            position = index
+            while time.perf_counter() < deadline:
+                path = paths[position % len(paths)]
+                position += 1
+                request_started = time.perf_counter()
+                try:
+                    connection.request("GET", path)
+                    response = connection.getresponse()
+                    response.read()
+                except (OSError, http.client.HTTPException):
+                    errors += 1
+                    connection.close()
+                    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+                    continue
+                if response.status >= 400:
+                    errors += 1
+                else:
+                    own_latencies.append(time.perf_counter() - request_started)
+            connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                counters["requests"] += len(own_latencies)
+                counters["errors"] += errors
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(client, range(concurrency)))
+        elapsed = time.perf_counter() - started
+        return counters["requests"], counters["errors"], latencies, elapsed
@@ -0,0 +1,71 @@
+import tempfile
+from timeit import default_timer
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.management import BaseCommand
+
+from mysite.cache_backends import ShardedSQLiteCache
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает FileBasedCache и ShardedSQLiteCache на одинаковой нагрузке.
+
+    Кеш заполняется до предела (``--entries`` при лимите ``--max-entries``),
+    поэтому в замер попадает и вытеснение.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--entries", type=int, default=5000)
+        parser.add_argument("--max-entries", type=int, default=2000)
+        parser.add_argument("--value-size", type=int, default=1024)
+        parser.add_argument("--batch", type=int, default=50)
+
+    def handle(self, *args, **options):
+        entries = options["entries"]
+        max_entries = options["max_entries"]
+        value = b"x" * options["value_size"]
+        batch = options["batch"]
+
+        backends = [
+            ("FileBasedCache", FileBasedCache, {}),
+            ("ShardedSQLiteCache", ShardedSQLiteCache, {"SHARDS": 8}),
+        ]
+        self.stdout.write(
+            f"{entries} keys, MAX_ENTRIES={max_entries}, "
+            f"value {len(value)} bytes, batch {batch}"
+        )
+        for name, backend_class, extra_options in backends:
+            with tempfile.TemporaryDirectory() as location:
+                cache = backend_class(location, {
+                    "OPTIONS": {"MAX_ENTRIES": max_entries, **extra_options},
+                })
+                keys = [f"bench-{i}" for i in range(entries)]
+                hot_keys = keys[-max_entries // 2:]
+                batches = [
+                    hot_keys[i:i + batch] for i in range(0, len(hot_keys), batch)
+                ]
+
+                results = [
+                    ("set", entries, self.measure(lambda: [cache.set(key, value) for key in keys])),
+                    ("get", len(hot_keys), self.measure(lambda: [cache.get(key) for key in hot_keys])),
+                    ("set_many", len(hot_keys), self.measure(
+                        lambda: [cache.set_many(dict.fromkeys(chunk, value)) for chunk in batches]
+                    )),
+                    ("get_many", len(hot_keys), self.measure(
+                        lambda: [cache.get_many(chunk) for chunk in batches]
+                    )),
+                ]
+                cache.close()
+
+            self.stdout.write(self.style.SUCCESS(name))
+            for operation, count, elapsed in results:
+                self.stdout.write(
+                    f"  {operation:<9} {count / elapsed:>10.0f} keys/s  ({elapsed:.3f} s)"
+                )
+
+    @staticmethod
+    def measure(func) -> float:
+        started = default_timer()
+        func()
+        return default_timer() - started
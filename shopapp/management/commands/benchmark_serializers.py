@@ -0,0 +1,79 @@
+from timeit import default_timer
+
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from shopapp.models import Order, Product
+from shopapp.read_serializers import CompiledReadSerializer
+from shopapp.serializers import OrderSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает ModelSerializer и CompiledReadSerializer на страницах товаров и заказов.
+
+    Данные создаются во временной транзакции и откатываются.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        repeat = options["repeat"]
+        request = RequestFactory().get("/", HTTP_HOST="localhost")
+
+        with transaction.atomic():
+            products = Product.objects.bulk_create([
+                Product(name=f"Bench {i}", description="x" * 100, price=i, preview=f"bench/{i}.png")
+                for i in range(rows)
+            ])
+            orders = Order.objects.bulk_create([
+                Order(user_id=self.get_user_id(), delivery_address=f"Street {i}") for i in range(rows)
+            ])
+            through = Order.products.through
+            through.objects.bulk_create([
+                through(order_id=order.pk, product_id=products[(i + k) % rows].pk)
+                for i, order in enumerate(orders)
+                for k in range(3)
+            ])
+
+            cases = [
+                ("products", ProductSerializer, Product.objects.filter(pk__in=[p.pk for p in products])),
+                ("orders", OrderSerializer, Order.objects.filter(pk__in=[o.pk for o in orders])),
+            ]
+            self.stdout.write(f"{rows} rows per page, best of {repeat}")
+            for name, serializer_class, queryset in cases:
+                compiled = CompiledReadSerializer(serializer_class)
+                model_time = self.measure(repeat, lambda: serializer_class(
+                    queryset.prefetch_related("products") if name == "orders" else queryset,
+                    many=True,
+                    context={"request": request},
+                ).data)
+                compiled_time = self.measure(repeat, lambda: compiled.to_representation(
+                    compiled.values(queryset), request,
+                ))
+                self.stdout.write(self.style.SUCCESS(name))
+                self.stdout.write(f"  ModelSerializer          {rows / model_time:>10.0f} rows/s  ({model_time * 1000:.1f} ms)")
+                self.stdout.write(f"  CompiledReadSerializer   {rows / compiled_time:>10.0f} rows/s  ({compiled_time * 1000:.1f} ms)")
+                self.stdout.write(f"  speedup x{model_time / compiled_time:.1f}")
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def get_user_id() -> int:
+        user = User.objects.order_by("pk").first()
+        if user is None:
+            user, = User.objects.bulk_create([User(username="benchmark")])
+        return user.pk
+
+    @staticmethod
+    def measure(repeat: int, func) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            started = default_timer()
+            func()
+            best = min(best, default_timer() - started)
+        return best
@@ -0,0 +1,132 @@
+import os
+import random
+import tempfile
+import time
+from multiprocessing import get_context
+from statistics import quantiles
+
+from django.core.management import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+ALIAS = "benchmark"
+
+PROFILES = {
+    # как было: стандартный бэкенд, новое соединение на каждый запрос
+    "stock": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "CONN_MAX_AGE": 0,
+    },
+    # настройки из settings.DATABASES
+    "tuned": {
+        "ENGINE": "mysite.sqlite_backend",
+        "CONN_MAX_AGE": None,
+        "OPTIONS": {"timeout": 20, "transaction_mode": "IMMEDIATE"},
+    },
+}
+
+
+def _connect(profile: str, name: str):
+    database = connections.configure_settings({"default": {**PROFILES[profile], "NAME": name}})["default"]
+    connections.settings[ALIAS] = database
+    return connections[ALIAS]
+
+
+def _worker(profile: str, name: str, rows: int, duration: float, write_ratio: float, seed: int, results) -> None:
+    connection = _connect(profile, name)
+    rnd = random.Random(seed)
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        kind = "write" if rnd.random() < write_ratio else "read"
+        key = rnd.randrange(rows)
+        started = time.perf_counter()
+        try:
+            if kind == "write":
+                # чтение, затем запись в одной транзакции — как save() после get()
+                with transaction.atomic(using=ALIAS), connection.cursor() as cursor:
+                    cursor.execute("SELECT value FROM bench WHERE id = %s", [key])
+                    value = cursor.fetchone()[0]
+                    cursor.execute("UPDATE bench SET value = %s WHERE id = %s", [value + 1, key])
+            else:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT SUM(value) FROM bench WHERE id BETWEEN %s AND %s", [key, key + 50])
+                    cursor.fetchone()
+        except OperationalError:
+            errors[kind] += 1
+        else:
+            latencies[kind].append(time.perf_counter() - started)
+        # конец «запроса»: закрыть соединение, если так велит CONN_MAX_AGE
+        connection.close_if_unusable_or_obsolete()
+    connection.close()
+    results.put((latencies, errors))
+
+
+class Command(BaseCommand):
+    """
+    Нагрузка на SQLite из нескольких процессов, как от воркеров gunicorn:
+    каждый процесс ``--duration`` секунд читает диапазоны строк и с долей
+    ``--write-ratio`` обновляет строку в транзакции «прочитать и записать».
+
+    Сравниваются стандартный бэкенд без постоянных соединений и
+    mysite.sqlite_backend (WAL, BEGIN IMMEDIATE, CONN_MAX_AGE). Каждый
+    профиль работает со своей временной базой, рабочая база не трогается.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--duration", type=float, default=5)
+        parser.add_argument("--write-ratio", type=float, default=0.2)
+        parser.add_argument("--rows", type=int, default=10000)
+        parser.add_argument("--profile", choices=sorted(PROFILES), action="append", dest="profiles")
+
+    def handle(self, *args, **options):
+        rows = options["rows"]
+        self.stdout.write(
+            f"{options['processes']} processes, {options['duration']:g} s, "
+            f"{options['write_ratio']:.0%} writes, {rows} rows"
+        )
+        ctx = get_context("fork")
+        for profile in options["profiles"] or ["stock", "tuned"]:
+            with tempfile.TemporaryDirectory() as directory:
+                name = os.path.join(directory, "bench.sqlite3")
+                self.create_table(profile, name, rows)
+                # дочерние процессы открывают свои соединения
+                connections.close_all()
+
+                results = ctx.Queue()
+                processes = [
+                    ctx.Process(target=_worker, args=(
+                        profile, name, rows, options["duration"], options["write_ratio"], seed, results,
+                    ))
+                    for seed in range(options["processes"])
+                ]
+                for process in processes:
+                    process.start()
+                collected = [results.get() for _ in processes]
+                for process in processes:
+                    process.join()
+            self.report(profile, collected, options["duration"])
+
+    @staticmethod
+    def create_table(profile: str, name: str, rows: int) -> None:
+        connection = _connect(profile, name)
+        with transaction.atomic(using=ALIAS), connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY, value INTEGER NOT NULL)")
+            cursor.executemany("INSERT INTO bench (id, value) VALUES (%s, 0)", [(i,) for i in range(rows)])
+        connection.close()
+        del connections[ALIAS]
+
+    def report(self, profile: str, collected: list, duration: float) -> None:
+        self.stdout.write(self.style.SUCCESS(profile))
+        for kind in ("read", "write"):
+            latencies = [value for result in collected for value in result[0][kind]]
+            errors = sum(result[1][kind] for result in collected)
+            if len(latencies) < 2:
+                self.stdout.write(f"  {kind:<5} too few successful operations, {errors} locked")
+                continue
+            p50, p99 = (quantiles(latencies, n=100)[i] for i in (49, 98))
+            self.stdout.write(
+                f"  {kind:<5} {len(latencies) / duration:>8.0f} ops/s  locked {errors:<5}  "
+                f"p50 {p50 * 1000:.2f} ms  p99 {p99 * 1000:.2f} ms"
+            )
@@ -0,0 +1,36 @@
+import os
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand, CommandError
+
+from mysite.storage import BLOB_DIR, DedupFileSystemStorage
+
+
+class Command(BaseCommand):
+    """
+    Склеивает одинаковые файлы в MEDIA_ROOT: каждый файл становится
+    жёсткой ссылкой на блоб со своим содержимым, имена не меняются,
+    поэтому базу трогать не нужно. Затем удаляет блобы без ссылок.
+    Команду можно прерывать и запускать повторно.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="", help="only this subdirectory of MEDIA_ROOT")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, DedupFileSystemStorage):
+            raise CommandError("Default storage is not mysite.storage.DedupFileSystemStorage")
+
+        files = freed = 0
+        top = default_storage.path(options["path"])
+        for root, dirs, names in os.walk(top):
+            if root == default_storage.location:
+                dirs[:] = [name for name in dirs if name != BLOB_DIR]
+            for name in names:
+                relative = os.path.relpath(os.path.join(root, name), default_storage.location)
+                freed += default_storage.dedupe(relative)
+                files += 1
+        freed += default_storage.collect_garbage()
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {files} files, freed {freed / 1024 / 1024:.1f} MB"
+        ))
@@ -0,0 +1,34 @@
+from itertools import chain
+
+from django.core.files.storage import default_storage
+from django.core.management import BaseCommand
+
+from jobsapp.models import Job
+from shopapp.images import last_variant_name
+from shopapp.models import Product, ProductImage
+
+
+class Command(BaseCommand):
+    """
+    Ставит в очередь пережатие картинок товаров, у которых ещё нет вариантов
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="regenerate variants that already exist",
+        )
+
+    def handle(self, *args, **options):
+        names = chain(
+            Product.objects.exclude(preview="").exclude(preview=None).values_list("preview", flat=True),
+            ProductImage.objects.values_list("image", flat=True),
+        )
+        queued = 0
+        for name in names:
+            if not options["all"] and default_storage.exists(last_variant_name(name)):
+                continue
+            Job.objects.enqueue("shopapp.image_variants", {"name": name})
+            queued += 1
+        self.stdout.write(self.style.SUCCESS(f"Queued {queued} images, run manage.py runworker"))
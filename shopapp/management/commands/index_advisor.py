@@ -0,0 +1,176 @@
+import json
+import os
+from collections import defaultdict
+
+from django.core.management import BaseCommand, CommandError
+from django.db import migrations
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.test import Client
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from mysite.index_advisor import IndexAdvisor, Workload
+
+DEFAULT_APPS = ["shopapp", "blogapp", "myauth"]
+
+
+class WorkloadRunner(DiscoverRunner):
+    """
+    Обычный прогон тестов, но запросы собираются в ``workload``, а
+    анализ идёт до удаления тестовой базы: в ней уже есть вся схема.
+    """
+
+    def __init__(self, workload: Workload, analyze, **kwargs):
+        super().__init__(**kwargs)
+        self.workload = workload
+        self.analyze = analyze
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        self.workload.install()
+        return old_config
+
+    def teardown_databases(self, old_config, **kwargs):
+        self.workload.uninstall()
+        self.analyze()
+        super().teardown_databases(old_config, **kwargs)
+
+
+class Command(BaseCommand):
+    """
+    Ищет недостающие и лишние индексы по реальной нагрузке.
+
+    Нагрузка — запросы тестов (``index_advisor shopapp blogapp``,
+    без меток — все тесты) или повтор GET-запросов из JSONL access-лога
+    (``--replay access.jsonl``, анонимно, на текущей базе). Каждый запрос
+    проходит через EXPLAIN QUERY PLAN, см. mysite.index_advisor.
+
+    ``--emit`` записывает миграции с найденными изменениями; те же
+    изменения нужно внести в Meta.indexes и db_index моделей, иначе
+    makemigrations откатит их обратно.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("test_labels", nargs="*", help="tests to run as the workload")
+        parser.add_argument("--replay", help="JSONL access log (DJANGO_ACCESS_LOG) to replay")
+        parser.add_argument("--limit", type=int, default=1000, help="requests to replay")
+        parser.add_argument("--app", action="append", dest="apps", help="apps to advise on")
+        parser.add_argument("--emit", action="store_true", help="write migrations")
+        parser.add_argument("--drop-unused", action="store_true", help="also drop indexes the workload never used")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.advisor = IndexAdvisor(options["apps"] or DEFAULT_APPS)
+        workload = Workload()
+
+        def analyze():
+            self.advisor.analyze(workload)
+            self.report(workload)
+            if options["emit"]:
+                self.emit()
+
+        if options["replay"]:
+            self.replay(workload, options["replay"], options["limit"])
+            analyze()
+        else:
+            runner = WorkloadRunner(workload, analyze, verbosity=0, interactive=False)
+            runner.run_tests(options["test_labels"])
+
+    def replay(self, workload: Workload, path: str, limit: int) -> None:
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        setup_test_environment()
+        client = Client(raise_request_exception=False)
+        replayed = 0
+        try:
+            workload.install()
+            with override_settings(RATELIMIT_ENABLED=False):
+                with open(path, encoding="utf-8") as file:
+                    for line in file:
+                        entry = json.loads(line)
+                        if entry.get("method") != "GET" or not entry.get("path"):
+                            continue
+                        client.get(entry["path"])
+                        replayed += 1
+                        if replayed >= limit:
+                            break
+        finally:
+            workload.uninstall()
+            teardown_test_environment()
+        self.stdout.write(f"Replayed {replayed} requests")
+
+    def report(self, workload: Workload) -> None:
+        advisor = self.advisor
+        self.stdout.write(
+            f"Captured {len(workload.queries)} distinct queries, {workload.executions} executions"
+        )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Full scans and temporary B-trees:"))
+        for report in advisor.reports[:20]:
+            problems = ", ".join(f"{kind} ({subject})" for kind, subject in report.problems)
+            self.stdout.write(f"  {report.count:>6}x  {problems}")
+            self.stdout.write(f"           {report.sql[:200]}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Missing indexes:"))
+        for proposal in sorted(advisor.proposals.values(), key=lambda proposal: -proposal.count):
+            self.stdout.write(
+                f"  {proposal.model._meta.label:<20} {proposal.code}  # {proposal.count} executions"
+            )
+            self.stdout.write(f"           ...{proposal.examples[0][-200:]}")
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Redundant indexes:"))
+        for index in advisor.redundant:
+            self.stdout.write(
+                f"  {index.model._meta.label:<20} {index.name} {tuple(index.columns)}: "
+                f"prefix of {index.redundant_to}{self.how_to_drop(index)}"
+            )
+
+        self.stdout.write(self.style.MIGRATE_HEADING("Not used by this workload:"))
+        for index in advisor.unused:
+            self.stdout.write(
+                f"  {index.model._meta.label:<20} {index.name} {tuple(index.columns)}{self.how_to_drop(index)}"
+            )
+
+    @staticmethod
+    def how_to_drop(index) -> str:
+        if index.field_name:
+            return f" -> {index.field_name}: db_index=False"
+        if index.meta_index:
+            return " -> remove from Meta.indexes"
+        return " -> not declared in models"
+
+    def drop_operation(self, index):
+        model_name = index.model._meta.model_name
+        if index.field_name:
+            field = index.model._meta.get_field(index.field_name).clone()
+            field.db_index = False
+            return migrations.AlterField(model_name=model_name, name=index.field_name, field=field)
+        if index.meta_index:
+            return migrations.RemoveIndex(model_name=model_name, name=index.name)
+        return None
+
+    def emit(self) -> None:
+        operations = defaultdict(list)
+        for proposal in self.advisor.proposals.values():
+            operations[proposal.model._meta.app_label].append(
+                migrations.AddIndex(model_name=proposal.model._meta.model_name, index=proposal.index)
+            )
+        dropped = self.advisor.redundant + (self.advisor.unused if self.options["drop_unused"] else [])
+        for index in dropped:
+            operation = self.drop_operation(index)
+            if operation is not None:
+                operations[index.model._meta.app_label].append(operation)
+
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        for app_label, app_operations in operations.items():
+            leaf = max(loader.graph.leaf_nodes(app_label))
+            number = (MigrationAutodetector.parse_number(leaf[1]) or 0) + 1
+            migration = migrations.Migration(f"{number:04d}_index_advisor", app_label)
+            migration.dependencies = [leaf]
+            migration.operations = app_operations
+            writer = MigrationWriter(migration)
+            with open(writer.path, "w", encoding="utf-8") as file:
+                file.write(writer.as_string())
+            self.stdout.write(self.style.SUCCESS(f"Wrote {writer.path}"))
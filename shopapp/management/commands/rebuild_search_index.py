@@ -0,0 +1,32 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from shopapp.models import ProductSearchIndex
+
+
+class Command(BaseCommand):
+    """
+    Пересобирает полнотекстовый индекс товаров (SQLite FTS5)
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--optimize",
+            action="store_true",
+            help="merge index segments after rebuild",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Full-text index is only available on SQLite")
+
+        table = ProductSearchIndex._meta.db_table
+        self.stdout.write(f"Rebuilding {table}")
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            if options["optimize"]:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+            cursor.execute(f"SELECT COUNT(*) FROM {table}")
+            count, = cursor.fetchone()
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} products"))
@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    """
+    Копирует основную базу SQLite в файлы реплик (DATABASE_REPLICAS)
+    через backup API: читатели реплики видят либо старую, либо новую
+    копию целиком. С ``--interval`` повторяет копирование в цикле —
+    так локально изображается реплика с отставанием.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, default=0, help="seconds between copies, 0 — copy once")
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured, set DJANGO_DB_REPLICAS")
+        for alias in [DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS]:
+            if connections[alias].vendor != "sqlite":
+                raise CommandError(f"Database {alias!r} is not SQLite")
+
+        while True:
+            started = time.perf_counter()
+            self.copy()
+            self.stdout.write(f"Replicas updated in {(time.perf_counter() - started) * 1000:.0f} ms")
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
+
+    @staticmethod
+    def copy() -> None:
+        source = sqlite3.connect(connections[DEFAULT_DB_ALIAS].settings_dict["NAME"])
+        try:
+            for alias in settings.DATABASE_REPLICAS:
+                target = sqlite3.connect(connections[alias].settings_dict["NAME"], timeout=20)
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.9 on 2026-10-18 16:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import shopapp.models
+
+
+CREATE_FTS_SQL = [
+    """
+    CREATE VIRTUAL TABLE shopapp_product_fts USING fts5(
+        name,
+        description,
+        content='shopapp_product',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    # совпадение в названии весит больше, чем в описании
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    """
+    CREATE TRIGGER shopapp_product_fts_insert AFTER INSERT ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_delete AFTER DELETE ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER shopapp_product_fts_update AFTER UPDATE OF name, description ON shopapp_product BEGIN
+        INSERT INTO shopapp_product_fts(shopapp_product_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO shopapp_product_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    "INSERT INTO shopapp_product_fts(shopapp_product_fts) VALUES ('rebuild')",
+]
+
+DROP_FTS_SQL = [
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_insert",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_delete",
+    "DROP TRIGGER IF EXISTS shopapp_product_fts_update",
+    "DROP TABLE IF EXISTS shopapp_product_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in CREATE_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in DROP_FTS_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shopapp', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='shopapp.product')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', shopapp.models.FTSDocumentField(db_column='shopapp_product_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'shopapp_product_fts',
+                'managed': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='description',
+            field=models.TextField(blank=True),
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+    ]
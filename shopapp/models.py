@@ -1,5 +1,6 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Lookup
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 
@@ -21,11 +22,23 @@ class Product(models.Model):
         ordering = ['name', 'price']
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
+        # ключи keyset-пагинации API: (поле сортировки, pk)
+        indexes = [
+            models.Index(fields=["name", "price", "id"], name="product_name_price_id_idx"),
+            models.Index(fields=["price", "id"], name="product_price_id_idx"),
+            models.Index(fields=["discount", "id"], name="product_discount_id_idx"),
+            # каталог, RSS и sitemap: новые неархивные товары (index_advisor)
+            models.Index(
+                fields=["-created_at"],
+                name="product_active_created_idx",
+                condition=models.Q(archived=False),
+            ),
+        ]
         # verbose_name = _('Product')
         # db_table = 'tech_products'
 
     name = models.CharField(max_length=100,db_index=True)
-    description = models.TextField(null=False, blank=True,db_index=True)
+    description = models.TextField(null=False, blank=True)
     price = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount = models.SmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -46,6 +59,47 @@ class Product(models.Model):
         return reverse("shopapp:product_details", kwargs={"pk": self.pk})
 
 
+class FTSDocumentField(models.TextField):
+    """
+    Скрытый столбец FTS5 с именем таблицы: по нему делается ``MATCH``.
+    """
+
+
+@FTSDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class ProductSearchIndex(models.Model):
+    """
+    Полнотекстовый индекс SQLite FTS5 по названию и описанию :model:`shopapp.Product`.
+
+    Таблицу создаёт миграция, в актуальном состоянии её держат триггеры
+    на shopapp_product (в том числе при bulk_create и update()).
+    Пересобрать: ``manage.py rebuild_search_index``.
+    """
+    product = models.OneToOneField(
+        Product,
+        primary_key=True,
+        db_column="rowid",
+        on_delete=models.DO_NOTHING,
+        related_name="search_index",
+    )
+    name = models.TextField()
+    description = models.TextField()
+    document = FTSDocumentField(db_column="shopapp_product_fts")
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "shopapp_product_fts"
+
+
 def product_images_directory_path(instance: 'ProductImage', filename: str) -> str:
     return 'products/product_{pk}/images/{filename}'.format(
         pk=instance.product.pk,
@@ -70,6 +124,9 @@ class Order(models.Model):
     class Meta:
         verbose_name = _("Order")
         verbose_name_plural = _("Orders")
+        indexes = [
+            models.Index(fields=["created_at", "id"], name="order_created_at_id_idx"),
+        ]
 
     def __str__(self):
         return f"Order #{self.pk}"
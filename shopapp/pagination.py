@@ -0,0 +1,215 @@
+"""
+Keyset-пагинация (по курсору) для API магазина.
+
+PageNumberPagination считает COUNT(*) и пропускает строки через OFFSET,
+поэтому каждая следующая страница дороже предыдущей. Здесь страница
+выбирается условием ``(поле сортировки, pk) > (значения последней строки)``,
+которое отрабатывает по индексу за одно и то же время на любой глубине.
+Порядок берётся из OrderingFilter представления (``?ordering=-price``),
+pk добавляется в конец для однозначности.
+
+Старый формат с номерами страниц доступен явно: ``?page=N``.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+    page_number_class = PageNumberPagination
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_number_paginator = None
+        if self.page_number_class.page_query_param in request.query_params:
+            self.page_number_paginator = self.page_number_class()
+            return self.page_number_paginator.paginate_queryset(queryset, request, view)
+
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.fields = [
+            self.get_field(queryset, name.lstrip("-"))
+            for name in self.ordering
+        ]
+        position, reverse = self.decode_cursor(request)
+
+        order_by = self.ordering
+        if reverse:
+            order_by = [self.invert(name) for name in order_by]
+        queryset = queryset.order_by(*order_by)
+        if position is not None:
+            queryset = queryset.filter(self.build_filter(order_by, position))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_previous, self.has_next = position is not None, has_more
+        self.page = results
+        return results
+
+    def get_page_size(self, request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_ordering(self, request, queryset, view) -> list:
+        ordering = None
+        for backend in getattr(view, "filter_backends", []):
+            if issubclass(backend, OrderingFilter):
+                ordering = backend().get_ordering(request, queryset, view)
+                break
+        if not ordering:
+            ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        ordering = [name for name in ordering if name.lstrip("-") not in ("pk", "id")]
+        last_desc = bool(ordering) and ordering[-1].startswith("-")
+        return ordering + ["-pk" if last_desc else "pk"]
+
+    def get_field(self, queryset, name):
+        """
+        Поле модели или аннотации (например, ранг полнотекстового поиска),
+        по которому строится курсор.
+        """
+        meta = queryset.model._meta
+        if name == "pk":
+            return meta.pk
+        if name in queryset.query.annotations:
+            field = queryset.query.annotations[name].output_field.clone()
+            field.set_attributes_from_name(name)
+            return field
+        try:
+            return meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def invert(name: str) -> str:
+        return name[1:] if name.startswith("-") else "-" + name
+
+    @staticmethod
+    def build_filter(order_by, position) -> Q:
+        """
+        (a, b, pk) > (x, y, z) в виде OR из префиксных равенств:
+        a > x | (a = x & b > y) | (a = x & b = y & pk > z),
+        где для полей с «-» сравнение идёт в обратную сторону.
+        """
+        condition = Q()
+        equal = Q()
+        for name, value in zip(order_by, position):
+            field = name.lstrip("-")
+            lookup = "lt" if name.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{field}__{lookup}": value})
+            equal &= Q(**{field: value})
+        return condition
+
+    # --- курсор -------------------------------------------------------
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            values, reverse = data["p"], bool(data.get("r"))
+            if len(values) != len(self.fields):
+                raise ValueError
+            position = [field.to_python(value) for field, value in zip(self.fields, values)]
+        except (TypeError, ValueError, KeyError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, item, reverse: bool) -> str:
+        if isinstance(item, dict):
+            # строка из values(): поля читают значения по attname
+            item = SimpleNamespace(**item)
+        values = [field.value_to_string(item) for field in self.fields]
+        data = {"p": values}
+        if reverse:
+            data["r"] = 1
+        encoded = urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode())
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded.decode("ascii"))
+
+    def get_next_link(self):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    # --- ответ --------------------------------------------------------
+
+    def get_paginated_response(self, data):
+        if self.page_number_paginator is not None:
+            return self.page_number_paginator.get_paginated_response(data)
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                "name": self.cursor_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Keyset cursor from the next/previous link",
+                "schema": {"type": "string"},
+            },
+            {
+                "name": self.page_size_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Number of results to return per page",
+                "schema": {"type": "integer"},
+            },
+            {
+                "name": self.page_number_class.page_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Opt-in page number pagination (with COUNT and OFFSET)",
+                "schema": {"type": "integer"},
+            },
+        ]
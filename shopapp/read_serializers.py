@@ -0,0 +1,199 @@
+"""
+Быстрое чтение для списков и карточек API.
+
+ModelSerializer на каждый объект и каждое поле вызывает get_attribute,
+проверки и to_representation — на страницах в сотни товаров это
+основное время запроса. ``CompiledReadSerializer`` один раз разбирает
+ModelSerializer на список колонок и функций-конвертеров, читает строки
+через ``.values()`` и собирает ответ тех же полей и формата. Списки pk
+по M2M приходят одним дополнительным запросом на страницу.
+
+Поддерживаются поля модели, FK и M2M в виде pk и файлы/картинки;
+на остальном компиляция падает с ImproperlyConfigured.
+"""
+from collections import defaultdict
+from types import SimpleNamespace
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.encoding import filepath_to_uri
+from rest_framework import ISO_8601, serializers
+from rest_framework.relations import ManyRelatedField, PrimaryKeyRelatedField
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from mysite.query_optimization import get_model_field
+
+
+def _identity(value):
+    return value
+
+
+class CompiledReadSerializer:
+    def __init__(self, serializer_class):
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.columns = []
+        # (имя в ответе, колонка values() или None для M2M, поле сериализатора)
+        self.fields = []
+        # имя в ответе -> (related_query_name, модель связи)
+        self.many = {}
+        # имя в ответе -> storage файлового поля
+        self.storages = {}
+        for name, field in serializer.fields.items():
+            if not field.write_only:
+                self.compile_field(name, field)
+        self.pk_column = self.model._meta.pk.attname
+        if self.many and self.pk_column not in self.columns:
+            self.columns.append(self.pk_column)
+
+    def compile_field(self, name: str, field) -> None:
+        model_field = None
+        if len(field.source_attrs) == 1:
+            model_field = get_model_field(self.model, field.source_attrs[0])
+        if model_field is None or not model_field.concrete:
+            raise ImproperlyConfigured(f"{name}: only model fields can be compiled")
+
+        if isinstance(field, ManyRelatedField):
+            if not model_field.many_to_many or not isinstance(field.child_relation, PrimaryKeyRelatedField):
+                raise ImproperlyConfigured(f"{name}: only M2M primary keys can be compiled")
+            self.many[name] = (model_field.related_query_name(), model_field.related_model)
+            self.fields.append((name, None, field))
+            return
+
+        if model_field.is_relation and not isinstance(field, PrimaryKeyRelatedField):
+            raise ImproperlyConfigured(f"{name}: only foreign key primary keys can be compiled")
+        if isinstance(field, serializers.FileField):
+            self.storages[name] = model_field.storage
+        self.columns.append(model_field.attname)
+        self.fields.append((name, model_field.attname, field))
+
+    def values(self, queryset):
+        """
+        Строки queryset нужных колонок; аннотации (например, ранг поиска)
+        остаются, чтобы по ним могла идти пагинация.
+        """
+        return queryset.prefetch_related(None).values(*self.columns, *queryset.query.annotations)
+
+    def bind(self, request) -> list:
+        """
+        Конвертеры на одну страницу: URL файлов и таймзона дат
+        зависят от запроса, поэтому считаются один раз здесь, а не на каждую строку.
+        """
+        bound = []
+        for name, column, field in self.fields:
+            if column is None:
+                convert = None
+            elif isinstance(field, PrimaryKeyRelatedField):
+                convert = field.pk_field.to_representation if field.pk_field else _identity
+            elif isinstance(field, serializers.FileField):
+                convert = self.file_url_builder(self.storages[name], request)
+            elif isinstance(field, serializers.DateTimeField):
+                convert = self.datetime_converter(field)
+            else:
+                convert = field.to_representation
+            bound.append((name, column, convert))
+        return bound
+
+    def to_representation(self, rows, request=None) -> list:
+        rows = list(rows)
+        many_values = {
+            name: self.load_many(rows, query_name, related)
+            for name, (query_name, related) in self.many.items()
+        }
+        fields = self.bind(request)
+        pk_column = self.pk_column
+        data = []
+        for row in rows:
+            item = {}
+            for name, column, convert in fields:
+                if column is None:
+                    item[name] = many_values[name].get(row[pk_column], [])
+                    continue
+                value = row[column]
+                item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+
+    def load_many(self, rows, query_name: str, related) -> dict:
+        # порядок как у relation.all(): по Meta.ordering связанной модели
+        ids = [row[self.pk_column] for row in rows]
+        pairs = (
+            related._default_manager
+            .filter(**{f"{query_name}__in": ids})
+            .values_list(query_name, "pk")
+        )
+        result = defaultdict(list)
+        for owner_id, related_id in pairs:
+            result[owner_id].append(related_id)
+        return result
+
+    @staticmethod
+    def file_url_builder(storage, request):
+        """
+        Функция имя файла -> URL, как FileField.to_representation с use_url.
+
+        Для FileSystemStorage абсолютный префикс считается один раз на страницу:
+        urljoin и build_absolute_uri на каждую строку стоят дороже остального.
+        """
+        if isinstance(storage, FileSystemStorage):
+            base_url = storage.base_url
+            if request is not None:
+                base_url = request.build_absolute_uri(base_url)
+            return lambda name: base_url + filepath_to_uri(name).lstrip("/") if name else None
+        if request is not None:
+            return lambda name: request.build_absolute_uri(storage.url(name)) if name else None
+        return lambda name: storage.url(name) if name else None
+
+    @staticmethod
+    def datetime_converter(field):
+        # DateTimeField.to_representation на каждое значение заново
+        # ищет текущую таймзону; здесь она берётся один раз
+        output_format = getattr(field, "format", api_settings.DATETIME_FORMAT)
+        tz = field.timezone if hasattr(field, "timezone") else field.default_timezone()
+        if output_format is None or output_format.lower() != ISO_8601 or tz is None:
+            return field.to_representation
+
+        def convert(value):
+            if timezone.is_aware(value):
+                value = value.astimezone(tz)
+            else:
+                value = timezone.make_aware(value, tz)
+            value = value.isoformat()
+            return value[:-6] + "Z" if value.endswith("+00:00") else value
+        return convert
+
+
+class CompiledReadMixin:
+    """
+    Для ModelViewSet: GET list и retrieve отдают данные через
+    CompiledReadSerializer, собранный из serializer_class.
+    """
+    _compiled_serializers = {}
+
+    def get_read_serializer(self) -> CompiledReadSerializer:
+        serializer_class = self.get_serializer_class()
+        compiled = self._compiled_serializers.get(serializer_class)
+        if compiled is None:
+            compiled = self._compiled_serializers[serializer_class] = CompiledReadSerializer(serializer_class)
+        return compiled
+
+    def list(self, request, *args, **kwargs):
+        read_serializer = self.get_read_serializer()
+        rows = read_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(read_serializer.to_representation(page, request))
+        return Response(read_serializer.to_representation(rows, request))
+
+    def retrieve(self, request, *args, **kwargs):
+        read_serializer = self.get_read_serializer()
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        row = get_object_or_404(
+            read_serializer.values(self.filter_queryset(self.get_queryset())),
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]},
+        )
+        self.check_object_permissions(request, SimpleNamespace(**row))
+        return Response(read_serializer.to_representation([row], request)[0])
@@ -0,0 +1,98 @@
+"""
+Кеш готовых ответов API с ключом по смыслу запроса.
+
+В отличие от cache_page ключ собирается не из полного URL и заголовков,
+а из нормализованных параметров, которые понимает представление
+(поиск, фильтры, сортировка, курсор/страница), формата ответа, языка,
+хоста и пользователя. Запросы с посторонними параметрами не кешируются.
+Каждая запись привязана к тегам (см. :mod:`shopapp.caching`), поэтому
+изменение товара сбрасывает только списки и карточку этого товара.
+В кеше лежит уже отрендеренное тело ответа.
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.translation import get_language
+from rest_framework.settings import api_settings
+
+from .caching import EXPORT_CACHE_TIMEOUT, PRODUCTS_TAG, tagged_key
+
+# параметры пагинации, которые не описаны в фильтрах представления
+PAGINATION_PARAMS = {"cursor", "page", "page_size"}
+
+
+class ResponseCacheMixin:
+    """
+    Для ViewSet: ``cached_response`` отдаёт ответ из кеша или строит
+    его и кладёт в кеш после рендеринга. Теги записи — ``response_cache_tags``
+    или ``get_response_cache_tags``, если они зависят от запроса.
+    """
+    response_cache_timeout = EXPORT_CACHE_TIMEOUT
+    response_cache_tags = [PRODUCTS_TAG]
+
+    def get_response_cache_tags(self) -> list:
+        return list(self.response_cache_tags)
+
+    def get_cache_query_params(self) -> set:
+        params = set(PAGINATION_PARAMS)
+        params.add(api_settings.URL_FORMAT_OVERRIDE)
+        params.add(getattr(self, "search_param", api_settings.SEARCH_PARAM))
+        params.add(getattr(self, "ordering_param", api_settings.ORDERING_PARAM))
+        params.update(getattr(self, "filterset_fields", []))
+        return params
+
+    def get_response_cache_key(self, request):
+        """
+        Ключ ответа или None, если запрос кешировать нельзя.
+        """
+        if request.method != "GET":
+            return None
+        if request.accepted_renderer.format == "api":
+            # в browsable API есть CSRF-токен и формы под пользователя
+            return None
+        allowed = self.get_cache_query_params()
+        if not set(request.query_params) <= allowed:
+            return None
+        query = urlencode(sorted(
+            (name, value)
+            for name, values in request.query_params.lists()
+            for value in values
+        ))
+        user = f"user:{request.user.pk}" if request.user.is_authenticated else "anon"
+        variant = "|".join([
+            request.build_absolute_uri(request.path),
+            query,
+            request.accepted_renderer.format,
+            get_language() or "",
+            user,
+        ])
+        digest = hashlib.md5(variant.encode()).hexdigest()
+        return tagged_key(f"api:{self.basename}:{self.action}:{digest}", *self.get_response_cache_tags())
+
+    def cached_response(self, request, build):
+        key = self.get_response_cache_key(request)
+        if key is None:
+            return build()
+
+        entry = cache.get(key)
+        if entry is not None:
+            content_type, body = entry
+            response = HttpResponse(body, content_type=content_type)
+            response["X-Cache"] = "hit"
+        else:
+            response = build()
+            if response.status_code == 200:
+                response.add_post_render_callback(
+                    lambda rendered: cache.set(
+                        key,
+                        (rendered["Content-Type"], rendered.content),
+                        self.response_cache_timeout,
+                    )
+                )
+            response["X-Cache"] = "miss"
+        # ответ зависит от языка, формата и пользователя
+        patch_vary_headers(response, ["Accept", "Accept-Language", "Cookie", "Authorization"])
+        return response
@@ -0,0 +1,47 @@
+"""
+Полнотекстовый поиск для API магазина.
+
+На SQLite поиск идёт через индекс FTS5 (см. :model:`shopapp.ProductSearchIndex`)
+и возвращает результаты по релевантности (bm25). На других базах, где
+индекса нет, работает обычный SearchFilter с ``icontains``.
+"""
+from django.db import connections
+from django.db.models import F
+from rest_framework.filters import SearchFilter
+
+
+def fts_query(terms) -> str:
+    """
+    Превращает слова пользователя в безопасный запрос FTS5.
+
+    Каждое слово берётся в кавычки (операторы FTS5 из ввода не работают)
+    и ищется по префиксу; слова объединяются через AND.
+    """
+    return " ".join(
+        '"{}"*'.format(term.replace('"', '""'))
+        for term in terms
+    )
+
+
+class FullTextSearchFilter(SearchFilter):
+    """
+    SearchFilter, который ищет по FTS-индексу из ``view.search_index``.
+
+    ``search_index`` — имя обратной связи модели с индексом
+    (например, ``"search_index"`` для Product). Если ``?ordering`` не задан,
+    результаты сортируются по релевантности (аннотация ``search_rank``).
+    """
+    rank_annotation = "search_rank"
+
+    def filter_queryset(self, request, queryset, view):
+        relation = getattr(view, "search_index", None)
+        terms = self.get_search_terms(request)
+        if not terms or relation is None or connections[queryset.db].vendor != "sqlite":
+            return super().filter_queryset(request, queryset, view)
+
+        return (
+            queryset
+            .filter(**{f"{relation}__document__match": fts_query(terms)})
+            .annotate(**{self.rank_annotation: F(f"{relation}__rank")})
+            .order_by(self.rank_annotation)
+        )
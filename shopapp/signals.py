@@ -0,0 +1,65 @@
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+
+from .caching import PRODUCTS_TAG, ORDERS_TAG, bump_tags, product_tag, user_orders_tag
+from .images import enqueue_image_variants
+from .models import Product, Order, ProductImage
+
+
+@receiver(post_save, sender=Product)
+def invalidate_products_cache(sender, instance: Product, **kwargs):
+    bump_tags(PRODUCTS_TAG, product_tag(instance.pk))
+
+
+@receiver(pre_save, sender=Product)
+@receiver(pre_save, sender=ProductImage)
+def remember_new_image(sender, instance, **kwargs):
+    # новый, ещё не записанный в storage файл; запишет его сам save()
+    field_file = instance.preview if sender is Product else instance.image
+    instance._image_uploaded = bool(field_file) and not field_file._committed
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def generate_image_variants(sender, instance, **kwargs):
+    if getattr(instance, "_image_uploaded", False):
+        instance._image_uploaded = False
+        field_file = instance.preview if sender is Product else instance.image
+        enqueue_image_variants(field_file.name)
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_deleted_product_cache(sender, instance: Product, **kwargs):
+    # каскадное удаление строк M2M не шлёт m2m_changed,
+    # поэтому списки товаров в заказах сбрасываем целиком
+    bump_tags(PRODUCTS_TAG, ORDERS_TAG, product_tag(instance.pk))
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_owner(sender, instance: Order, **kwargs):
+    if instance.pk is None:
+        return
+    instance._previous_user_id = (
+        Order.objects
+        .filter(pk=instance.pk)
+        .values_list("user_id", flat=True)
+        .first()
+    )
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_cache(sender, instance: Order, **kwargs):
+    user_ids = {instance.user_id, getattr(instance, "_previous_user_id", None)}
+    bump_tags(*(user_orders_tag(user_id) for user_id in user_ids if user_id is not None))
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_order_products_cache(sender, instance, action: str, reverse: bool, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # product.orders.add(...) — затронуты заказы разных пользователей
+        bump_tags(ORDERS_TAG)
+    else:
+        bump_tags(user_orders_tag(instance.user_id))
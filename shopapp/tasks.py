@@ -0,0 +1,96 @@
+"""
+Фоновые задачи магазина (выполняет ``manage.py runworker``).
+
+Импорт CSV из админки и API и большие выгрузки ставятся в очередь
+:model:`jobsapp.Job`, а запрос сразу отвечает ссылкой на статус задачи.
+"""
+import tempfile
+
+from jobsapp.registry import task
+
+from .api import ProductViewSet
+from .common import save_csv_orders, save_csv_products, stream_csv
+from .images import generate_variants
+from .models import Order
+
+# Прогресс выгрузки обновляется раз в EXPORT_PROGRESS_EVERY строк
+EXPORT_PROGRESS_EVERY = 1000
+
+
+def _import_csv(job, save):
+    with job.input_file.open("rb") as file:
+        total = job.input_file.size
+
+        def on_batch(report):
+            job.set_progress(file.tell(), total)
+
+        report = save(file, encoding=job.payload.get("encoding"), on_batch=on_batch)
+    job.set_progress(total, total, force=True)
+    return report.as_dict()
+
+
+@task("shopapp.import_products")
+def import_products(job):
+    def save(file, **kwargs):
+        return save_csv_products(file, created_by=job.created_by, **kwargs)
+    return _import_csv(job, save)
+
+
+@task("shopapp.import_orders")
+def import_orders(job):
+    return _import_csv(job, save_csv_orders)
+
+
+def _export_csv(job, filename, header, queryset, compress=False, chunk_size=2000):
+    total = queryset.count()
+    job.set_progress(0, total, force=True)
+
+    def rows():
+        for done, row in enumerate(queryset.iterator(chunk_size=chunk_size), 1):
+            if done % EXPORT_PROGRESS_EVERY == 0:
+                job.set_progress(done, total)
+            yield row
+
+    with tempfile.TemporaryFile() as file:
+        for chunk in stream_csv(header, rows(), compress=compress):
+            file.write(chunk)
+        file.seek(0)
+        job.save_result_file(filename, file)
+    job.set_progress(total, total, force=True)
+    return {"rows": total}
+
+
+@task("shopapp.export_orders_csv")
+def export_orders_csv(job):
+    compress = bool(job.payload.get("gzip"))
+    orders = (
+        Order.objects
+        .order_by("pk")
+        .values_list("pk", "user__username", "created_at")
+    )
+    return _export_csv(
+        job,
+        "orders.csv.gz" if compress else "orders.csv",
+        ["ID", "User", "Created At"],
+        orders,
+        compress=compress,
+    )
+
+
+@task("shopapp.export_products_csv")
+def export_products_csv(job):
+    fields = job.payload["fields"]
+    queryset = ProductViewSet.get_export_queryset(job.payload.get("query", ""))
+    return _export_csv(
+        job,
+        "products-export.csv",
+        fields,
+        queryset.values_list(*fields),
+        chunk_size=ProductViewSet.csv_chunk_size,
+    )
+
+
+@task("shopapp.image_variants")
+def image_variants(job):
+    # одна задача на картинку: пул runworker пережимает их параллельно
+    return {"variants": generate_variants(job.payload["name"])}
@@ -0,0 +1,28 @@
+from django import template
+from django.utils.html import format_html
+
+from shopapp.images import IMAGE_VARIANTS, variant_name, variants_ready
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(field_file, variant, alt=""):
+    """
+    Картинка товара в размере ``variant`` (WebP с запасным JPEG).
+
+    Пока фоновая задача не создала варианты, отдаётся оригинал.
+    """
+    if not field_file:
+        return ""
+    if variant not in IMAGE_VARIANTS:
+        raise template.TemplateSyntaxError(f"Unknown image variant {variant!r}")
+    storage = field_file.storage
+    if not variants_ready(field_file.name, storage):
+        return format_html('<img src="{}" alt="{}" loading="lazy">', field_file.url, alt)
+    return format_html(
+        '<picture><source srcset="{}" type="image/webp"><img src="{}" alt="{}" loading="lazy"></picture>',
+        storage.url(variant_name(field_file.name, variant, "webp")),
+        storage.url(variant_name(field_file.name, variant, "jpg")),
+        alt,
+    )
@@ -1,14 +1,46 @@
+import csv
+import gzip
+import json
+import tempfile
+from io import BytesIO, StringIO
 from itertools import product
 from string import ascii_letters
 from random import choices
+from unittest import mock
 
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import Http404
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.template import Context, Template
 from django.urls import reverse
+from django.utils import translation
 from django.contrib.auth.models import User
+from PIL import Image
 
-from shopapp.models import Product
+from jobsapp.models import Job
+from myauth.models import Profile
+from mysite.ratelimit import limiter
+from jobsapp.registry import claim_next_job, run_job
+from shopapp.images import attach_product_images, variant_name
+from shopapp.models import Product, Order, ProductImage
+from shopapp.read_serializers import CompiledReadSerializer
+from shopapp.serializers import OrderSerializer, ProductSerializer
+from shopapp.async_views import (
+    AsyncLatestProductsFeed,
+    AsyncProductDetailsView,
+    AsyncProductsDataExportView,
+    AsyncProductsListView,
+    AsyncUserOrdersExportView,
+)
+from shopapp.caching import aget_or_compute, get_or_compute
+from shopapp.common import save_csv_orders, save_csv_products
 from shopapp.utils import add_two_numbers
+from shopapp.views import ProductsDataExportView, UserOrdersExportView
 
 
 class AddTwoNumbersTestCase(TestCase):
@@ -130,4 +162,660 @@ class ProductsExportViewTestCase(TestCase):
         self.assertEqual(
             products_data["products"],
             expected_data,
-        )
\ No newline at end of file
+        )
+
+
+class OrdersExportViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create: без сигналов myauth, которые создают профиль дважды
+        cls.user, = User.objects.bulk_create([User(username="export_user")])
+        Order.objects.bulk_create([
+            Order(user=cls.user, delivery_address=f"Street {i}")
+            for i in range(5)
+        ])
+
+    def setUp(self) -> None:
+        # LANGUAGE_CODE "en-us" нет в LANGUAGES: до первого запроса
+        # reverse() строит префикс /en-us/, который не резолвится
+        translation.activate("en")
+
+    def test_export_streams_csv_in_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("shopapp:orders-export"))
+            content = b"".join(response.streaming_content).decode()
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = content.splitlines()
+        self.assertEqual(lines[0], "ID,User,Created At")
+        self.assertEqual(len(lines), 6)
+        for order, line in zip(Order.objects.order_by("pk"), lines[1:]):
+            self.assertTrue(line.startswith(f"{order.pk},export_user,"))
+
+    def test_export_gzip(self):
+        plain = self.client.get(reverse("shopapp:orders-export"))
+        compressed = self.client.get(reverse("shopapp:orders-export"), {"gzip": "1"})
+        self.assertEqual(compressed["Content-Type"], "application/gzip")
+        self.assertIn("orders.csv.gz", compressed["Content-Disposition"])
+        self.assertEqual(
+            gzip.decompress(b"".join(compressed.streaming_content)),
+            b"".join(plain.streaming_content),
+        )
+
+    def test_export_in_background(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, JOB_FILES_ROOT=media_root))
+        plain = self.client.get(reverse("shopapp:orders-export"))
+        response = self.client.get(reverse("shopapp:orders-export"), {"async": "1"})
+        self.assertEqual(response.status_code, 202)
+        run_job(claim_next_job("test"))
+
+        data = self.client.get(response["Location"]).json()
+        self.assertEqual(data["result"], {"rows": 5})
+        result = self.client.get(data["result_url"])
+        self.assertEqual(
+            b"".join(result.streaming_content),
+            b"".join(plain.streaming_content),
+        )
+
+
+class ProductsDownloadCSVTestCase(TestCase):
+    fixtures = [
+        'products-fixture.json',
+    ]
+
+    def test_download_csv_default_fields(self):
+        response = self.client.get(reverse("shopapp:product-download-csv"))
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], ["name", "description", "price", "discount"])
+        self.assertEqual(len(rows), Product.objects.count() + 1)
+
+    def test_download_csv_selected_fields_and_filter(self):
+        response = self.client.get(
+            reverse("shopapp:product-download-csv"),
+            {"fields": "pk,price", "archived": "false"},
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        expected = [
+            f"{pk},{price}"
+            for pk, price in Product.objects.filter(archived=False).values_list("pk", "price")
+        ]
+        self.assertEqual(lines[0], "pk,price")
+        self.assertCountEqual(lines[1:], expected)
+
+    def test_download_csv_unknown_field(self):
+        response = self.client.get(
+            reverse("shopapp:product-download-csv"),
+            {"fields": "name,created_by__password"},
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportCacheInvalidationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = User.objects.bulk_create([User(username="cache_user")])
+        cls.product = Product.objects.create(name="Cached product", price=10)
+
+    def setUp(self) -> None:
+        translation.activate("en")
+
+    def test_product_change_refreshes_products_export(self):
+        self.client.get(reverse("shopapp:products-export"))
+        self.product.name = "Renamed product"
+        self.product.save()
+        response = self.client.get(reverse("shopapp:products-export"))
+        names = [item["name"] for item in response.json()["products"]]
+        self.assertIn("Renamed product", names)
+
+    def test_product_change_refreshes_api_list(self):
+        url = reverse("shopapp:product-list")
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        Product.objects.create(name="Fresh product")
+        response = self.client.get(url)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+    def test_order_changes_refresh_user_orders_export(self):
+        url = reverse("shopapp:user_orders_export", kwargs={"user_id": self.user.pk})
+        self.assertEqual(self.client.get(url).json()["orders"], [])
+
+        order = Order.objects.create(user=self.user)
+        self.assertEqual(len(self.client.get(url).json()["orders"]), 1)
+
+        order.products.add(self.product)
+        orders = self.client.get(url).json()["orders"]
+        self.assertEqual(orders[0]["products"], [self.product.pk])
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+
+class GetOrComputeTestCase(TestCase):
+    def setUp(self) -> None:
+        self.key = "test-single-flight-" + "".join(choices(ascii_letters, k=10))
+        self.calls = 0
+
+    def tearDown(self) -> None:
+        cache.delete_many([self.key, f"{self.key}:lock"])
+
+    def compute(self):
+        self.calls += 1
+        return self.calls
+
+    def test_computes_once(self):
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), 1)
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), 1)
+        self.assertEqual(self.calls, 1)
+
+    def test_expired_value_served_while_locked(self):
+        cache.set(self.key, ("stale", 0.1, 0), 60)
+        cache.add(f"{self.key}:lock", 1)
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), "stale")
+        self.assertEqual(self.calls, 0)
+
+    def test_expired_value_recomputed_by_lock_owner(self):
+        cache.set(self.key, ("stale", 0.1, 0), 60)
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), 1)
+        self.assertIsNone(cache.get(f"{self.key}:lock"))
+
+    def test_expired_lock_of_other_worker_is_kept(self):
+        lock_key = f"{self.key}:lock"
+
+        def slow_compute():
+            # наша блокировка истекла, её взял другой воркер
+            cache.set(lock_key, "other")
+            return "value"
+
+        self.assertEqual(get_or_compute(self.key, slow_compute, 60), "value")
+        self.assertEqual(cache.get(lock_key), "other")
+
+    def test_async_expired_lock_of_other_worker_is_kept(self):
+        lock_key = f"{self.key}:lock"
+
+        async def slow_compute():
+            await cache.aset(lock_key, "other")
+            return "value"
+
+        self.assertEqual(async_to_sync(aget_or_compute)(self.key, slow_compute, 60), "value")
+        self.assertEqual(cache.get(lock_key), "other")
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Product.objects.bulk_create([
+            Product(name=f"Product {i % 7}", price=i % 5, discount=i % 3)
+            for i in range(25)
+        ])
+
+    def setUp(self) -> None:
+        translation.activate("en")
+
+    def walk(self, params):
+        url = reverse("shopapp:product-list")
+        pks = []
+        response = self.client.get(url, {"page_size": 4, **params})
+        while True:
+            data = response.json()
+            pks.extend(item["pk"] for item in data["results"])
+            if not data["next"]:
+                return pks, data
+            response = self.client.get(data["next"])
+
+    def test_walk_follows_ordering_without_duplicates(self):
+        for ordering in ("-price", "discount", "name"):
+            with self.subTest(ordering=ordering):
+                pks, last_page = self.walk({"ordering": ordering})
+                expected = list(
+                    Product.objects.order_by(ordering, "-pk" if ordering.startswith("-") else "pk")
+                    .values_list("pk", flat=True)
+                )
+                self.assertEqual(pks, expected)
+                self.assertNotIn("count", last_page)
+
+    def test_default_ordering_and_previous_link(self):
+        pks, _ = self.walk({})
+        expected = list(Product.objects.order_by("name", "price", "pk").values_list("pk", flat=True))
+        self.assertEqual(pks, expected)
+
+        first = self.client.get(reverse("shopapp:product-list"), {"page_size": 4}).json()
+        second = self.client.get(first["next"]).json()
+        back = self.client.get(second["previous"]).json()
+        self.assertEqual(back["results"], first["results"])
+
+    def test_orders_walk_by_datetime(self):
+        user, = User.objects.bulk_create([User(username="keyset_user")])
+        Order.objects.bulk_create([Order(user=user) for _ in range(9)])
+        url = reverse("shopapp:order-list")
+        response = self.client.get(url, {"page_size": 2, "ordering": "-created_at"})
+        pks = []
+        while True:
+            data = response.json()
+            pks.extend(item["pk"] for item in data["results"])
+            if not data["next"]:
+                break
+            response = self.client.get(data["next"])
+        self.assertEqual(
+            pks,
+            list(Order.objects.order_by("-created_at", "-pk").values_list("pk", flat=True)),
+        )
+
+    def test_page_number_is_opt_in(self):
+        response = self.client.get(reverse("shopapp:product-list"), {"page": 2})
+        data = response.json()
+        self.assertEqual(data["count"], 25)
+        self.assertEqual(len(data["results"]), 10)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse("shopapp:product-list"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductFullTextSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.laptop = Product.objects.create(name="Laptop Pro", description="Light and fast")
+        cls.desktop = Product.objects.create(name="Desktop", description="Replaces a laptop")
+        cls.phone = Product.objects.create(name="Смартфон", description="Быстрый телефон")
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        # откат транзакции теста не откатывает закешированные страницы списка
+        cache.clear()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse("shopapp:product-list"), {"search": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [item["pk"] for item in response.json()["results"]]
+
+    def test_ranked_by_relevance(self):
+        # совпадение в названии важнее совпадения в описании
+        self.assertEqual(self.search("laptop"), [self.laptop.pk, self.desktop.pk])
+
+    def test_prefix_and_unicode(self):
+        self.assertEqual(self.search("смарт"), [self.phone.pk])
+        self.assertEqual(self.search("lap fast"), [self.laptop.pk])
+
+    def test_index_follows_updates(self):
+        Product.objects.filter(pk=self.phone.pk).update(name="Laptop stand")
+        self.assertIn(self.phone.pk, self.search("laptop"))
+        self.laptop.delete()
+        self.assertNotIn(self.laptop.pk, self.search("laptop"))
+
+    def test_fts_syntax_is_escaped(self):
+        self.assertEqual(self.search('"laptop OR NEAR('), [])
+
+    def test_rebuild_command(self):
+        out = StringIO()
+        call_command("rebuild_search_index", "--optimize", stdout=out)
+        self.assertIn("Indexed 3 products", out.getvalue())
+        self.assertEqual(self.search("laptop"), [self.laptop.pk, self.desktop.pk])
+
+    def test_paginates_by_rank(self):
+        first = self.client.get(
+            reverse("shopapp:product-list"), {"search": "laptop", "page_size": 1},
+        ).json()
+        second = self.client.get(first["next"]).json()
+        self.assertEqual(
+            [first["results"][0]["pk"], second["results"][0]["pk"]],
+            [self.laptop.pk, self.desktop.pk],
+        )
+
+
+class SaveCSVProductsTestCase(TestCase):
+    csv_content = (
+        "name,description,price,discount\n"
+        "Table,Wooden,100.50,5\n"
+        ",No name,10,0\n"
+        "Chair,Soft,abc,0\n"
+        "Lamp,Bright,20,\n"
+        "Shelf,Tall,30,1\n"
+        "Sofa,Big,999999999,0\n"
+        "Bed\n"
+    )
+
+    def test_import_report(self):
+        report = save_csv_products(
+            BytesIO(self.csv_content.encode()),
+            encoding="utf-8",
+            batch_size=2,
+        )
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.rejected, 4)
+        self.assertEqual(report.batches, 2)
+        self.assertEqual([line for line, error in report.errors], [3, 4, 7, 8])
+        self.assertIn("name", report.errors[0][1])
+        self.assertIn("missing column", report.errors[3][1])
+        self.assertQuerySetEqual(
+            Product.objects.order_by("name"),
+            ["Lamp", "Shelf", "Table"],
+            transform=lambda p: p.name,
+        )
+
+    def test_upload_csv_endpoint(self):
+        translation.activate("en")
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, JOB_FILES_ROOT=media_root))
+        upload = BytesIO(self.csv_content.encode())
+        upload.name = "products.csv"
+        response = self.client.post(
+            reverse("shopapp:product-upload-csv"),
+            {"file": upload},
+        )
+        self.assertEqual(response.status_code, 202)
+        job_id = claim_next_job("test")
+        self.assertEqual(str(job_id), response.json()["id"])
+        run_job(job_id)
+
+        data = self.client.get(response["Location"]).json()
+        self.assertEqual(data["status"], "done")
+        self.assertEqual(data["progress"]["percent"], 100)
+        self.assertEqual(data["result"]["created"], 3)
+        self.assertEqual(data["result"]["rejected"], 4)
+        self.assertEqual(len(data["result"]["errors"]), 4)
+
+
+class SaveCSVOrdersTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = User.objects.bulk_create([User(username="csv_buyer")])
+        cls.products = Product.objects.bulk_create([
+            Product(name=f"Item {i}") for i in range(3)
+        ])
+
+    def test_import_in_constant_queries(self):
+        p1, p2, p3 = (product.pk for product in self.products)
+        rows = [
+            "user_id,delivery_address,promocode,product_ids",
+            f'{self.user.pk},Street 1,SALE,"{p1},{p2}"',
+            f"{self.user.pk},Street 2,,{p3}",
+            f"{self.user.pk + 100},Street 3,,{p1}",
+            f'{self.user.pk},Street 4,,"{p1},999999"',
+            f"{self.user.pk},Street 5,{'X' * 30},{p1}",
+            f"{self.user.pk},Street 6,,",
+        ]
+        content = "\n".join(rows).encode()
+
+        # пачка: пользователи, товары, заказы, связи + SAVEPOINT/RELEASE
+        with self.assertNumQueries(4 + 2):
+            report = save_csv_orders(BytesIO(content), encoding="utf-8")
+
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.rejected, 3)
+        self.assertEqual([line for line, error in report.errors], [6, 4, 5])
+        orders = Order.objects.order_by("delivery_address").prefetch_related("products")
+        self.assertEqual(
+            [(o.delivery_address, sorted(p.pk for p in o.products.all())) for o in orders],
+            [("Street 1", [p1, p2]), ("Street 2", [p3]), ("Street 6", [])],
+        )
+
+
+class ImageVariantsTestCase(TestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        buffer = BytesIO()
+        Image.effect_noise((1600, 1200), 64).convert("RGBA").save(buffer, "PNG")
+        self.upload = SimpleUploadedFile("photo.png", buffer.getvalue())
+
+    def test_variants_are_generated_in_background(self):
+        product = Product.objects.create(name="Camera")
+        with self.captureOnCommitCallbacks(execute=True):
+            image = ProductImage.objects.create(product=product, image=self.upload)
+        template = Template('{% load product_images %}{% picture image.image "card" %}')
+        # до задачи — оригинал; «ещё нет» запоминается в кеше
+        self.assertNotIn("<picture>", template.render(Context({"image": image})))
+        job = Job.objects.get(name="shopapp.image_variants")
+        self.assertEqual(job.payload, {"name": image.image.name})
+        self.assertEqual(run_job(claim_next_job("test")), Job.DONE)
+
+        card = variant_name(image.image.name, "card", "webp")
+        with default_storage.open(card) as file:
+            self.assertLessEqual(max(Image.open(file).size), 320)
+        self.assertLess(default_storage.size(card) * 10, default_storage.size(image.image.name))
+        with default_storage.open(variant_name(image.image.name, "detail", "jpg")) as file:
+            self.assertEqual(Image.open(file).size, (1024, 768))
+
+        # задача сама отметила картинку: тег не обращается к диску
+        with mock.patch.object(default_storage, "exists", side_effect=AssertionError):
+            html = template.render(Context({"image": image}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(default_storage.url(variant_name(image.image.name, "card", "jpg")), html)
+
+    def test_original_is_served_until_variants_exist(self):
+        product = Product.objects.create(name="Camera", preview=self.upload)
+        html = Template('{% load product_images %}{% picture product.preview "card" %}').render(
+            Context({"product": product})
+        )
+        self.assertIn(f'src="{product.preview.url}"', html)
+
+    def test_saving_without_new_file_does_not_enqueue(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name="Camera", preview=self.upload)
+            product.name = "Camera 2"
+            product.save()
+        self.assertEqual(Job.objects.filter(name="shopapp.image_variants").count(), 1)
+
+
+class AttachProductImagesTestCase(TestCase):
+    def setUp(self):
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.product = Product.objects.create(name="Sofa")
+
+    @staticmethod
+    def make_upload(name: str) -> SimpleUploadedFile:
+        buffer = BytesIO()
+        Image.new("RGB", (40, 30), "red").save(buffer, "JPEG")
+        return SimpleUploadedFile(name, buffer.getvalue())
+
+    def test_bulk_attach_reports_broken_files(self):
+        files = [self.make_upload(f"photo-{i}.jpg") for i in range(5)]
+        files.insert(2, SimpleUploadedFile("notes.jpg", b"not an image"))
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                report = attach_product_images(self.product, files, max_workers=4)
+
+        self.assertEqual([filename for filename, error in report.errors], ["notes.jpg"])
+        images = ProductImage.objects.filter(product=self.product).order_by("pk")
+        self.assertEqual(
+            [image.image.name.rsplit("/", 1)[-1] for image in images],
+            [f"photo-{i}.jpg" for i in range(5)],
+        )
+        self.assertTrue(all(default_storage.exists(image.image.name) for image in images))
+        self.assertEqual(Job.objects.filter(name="shopapp.image_variants").count(), 5)
+
+
+@override_settings(N_PLUS_ONE_CHECK=True)
+class OrderAPIQueriesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = User.objects.bulk_create([User(username="api_buyer")])
+        cls.products = Product.objects.bulk_create([Product(name=f"Item {i}") for i in range(3)])
+
+    def setUp(self):
+        translation.activate("en")
+
+    def add_orders(self, count: int):
+        for order in Order.objects.bulk_create([Order(user=self.user) for _ in range(count)]):
+            order.products.set(self.products)
+
+    def test_list_queries_do_not_grow_with_page(self):
+        self.add_orders(2)
+        with self.assertNumQueries(2):
+            self.client.get(reverse("shopapp:order-list"))
+        self.add_orders(8)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("shopapp:order-list"))
+        self.assertEqual(len(response.json()["results"]), 10)
+        self.assertEqual(len(response.json()["results"][0]["products"]), 3)
+
+
+class CompiledReadSerializerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, = User.objects.bulk_create([User(username="reader")])
+        cls.products = Product.objects.bulk_create([
+            Product(name="Lamp", price="19.90", discount=5, created_by=cls.user, preview="products/lamp.png"),
+            Product(name="Desk", price="250", description="Oak"),
+        ])
+        order = Order.objects.create(user=cls.user, delivery_address="Street 1")
+        order.products.set(cls.products)
+        Order.objects.create(user=cls.user, promocode="EMPTY")
+
+    def setUp(self):
+        translation.activate("en")
+
+    def assertSameOutput(self, serializer_class, queryset):
+        request = RequestFactory().get("/")
+        expected = serializer_class(queryset, many=True, context={"request": request}).data
+        compiled = CompiledReadSerializer(serializer_class)
+        self.assertEqual(
+            compiled.to_representation(compiled.values(queryset), request),
+            [dict(item) for item in expected],
+        )
+
+    def test_product_output_matches_model_serializer(self):
+        self.assertSameOutput(ProductSerializer, Product.objects.order_by("pk"))
+
+    def test_order_output_matches_model_serializer(self):
+        self.assertSameOutput(OrderSerializer, Order.objects.order_by("pk"))
+
+    def test_api_retrieve(self):
+        product = self.products[0]
+        response = self.client.get(reverse("shopapp:product-detail", kwargs={"pk": product.pk}))
+        self.assertEqual(response.json()["price"], "19.90")
+        self.assertTrue(response.json()["preview"].endswith("/media/products/lamp.png"))
+        response = self.client.get(reverse("shopapp:product-detail", kwargs={"pk": 0}))
+        self.assertEqual(response.status_code, 404)
+
+
+class ProductResponseCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.lamp, cls.desk = Product.objects.bulk_create([
+            Product(name="Lamp", price=20),
+            Product(name="Desk", price=250),
+        ])
+
+    def setUp(self):
+        translation.activate("en")
+        cache.clear()
+
+    def get(self, url, params=None, **extra):
+        return self.client.get(url, params or {}, **extra)
+
+    def test_equivalent_queries_share_entry(self):
+        url = reverse("shopapp:product-list")
+        self.assertEqual(self.get(f"{url}?ordering=price&search=lamp")["X-Cache"], "miss")
+        response = self.get(f"{url}?search=lamp&ordering=price")
+        self.assertEqual(response["X-Cache"], "hit")
+        self.assertEqual([item["name"] for item in response.json()["results"]], ["Lamp"])
+
+    def test_unknown_params_are_not_cached(self):
+        url = reverse("shopapp:product-list")
+        self.get(url, {"utm_source": "mail"})
+        self.assertNotIn("X-Cache", self.get(url, {"utm_source": "mail"}))
+
+    def test_variants_by_user_and_format(self):
+        url = reverse("shopapp:product-list")
+        self.get(url)
+        self.assertNotIn("X-Cache", self.get(url, HTTP_ACCEPT="text/html"))
+        self.assertEqual(self.get(url, {"format": "json"})["X-Cache"], "miss")
+        self.assertEqual(self.get(url)["X-Cache"], "hit")
+
+        user, = User.objects.bulk_create([User(username="cache_reader")])
+        Profile.objects.create(user=user)
+        self.client.force_login(user)
+        self.assertEqual(self.get(url)["X-Cache"], "miss")
+
+    def test_write_purges_only_affected_entries(self):
+        list_url = reverse("shopapp:product-list")
+        lamp_url = reverse("shopapp:product-detail", kwargs={"pk": self.lamp.pk})
+        desk_url = reverse("shopapp:product-detail", kwargs={"pk": self.desk.pk})
+        for url in (list_url, lamp_url, desk_url):
+            self.get(url)
+
+        self.lamp.price = 25
+        self.lamp.save()
+
+        self.assertEqual(self.get(desk_url)["X-Cache"], "hit")
+        response = self.get(lamp_url)
+        self.assertEqual(response["X-Cache"], "miss")
+        self.assertEqual(response.json()["price"], "25.00")
+        self.assertEqual(self.get(list_url)["X-Cache"], "miss")
+
+
+@override_settings(RATELIMIT_ENABLED=True)
+class ProductAPIRateLimitTestCase(TestCase):
+    def setUp(self):
+        translation.activate("en")
+        cache.clear()
+        limiter.blocked.clear()
+
+    @override_settings(RATELIMITS={"shopapp:*": {"anon": "2/m", "user": "3/m"}})
+    def test_throttled_per_client(self):
+        url = reverse("shopapp:product-list")
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 429)
+        self.assertIn("Retry-After", response)
+
+        # у пользователя свой счётчик и свой лимит
+        user = User.objects.bulk_create([User(username="buyer")])[0]
+        Profile.objects.bulk_create([Profile(user=user)])
+        self.client.force_login(user)
+        statuses = [self.client.get(url).status_code for _ in range(4)]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+
+class AsyncViewsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.bulk_create([User(username="buyer")])[0]
+        cls.lamp, cls.desk = Product.objects.bulk_create([
+            Product(name="Lamp", price=20, description="Desk lamp"),
+            Product(name="Desk", price=250, archived=True),
+        ])
+        order = Order.objects.bulk_create([Order(user=cls.user, delivery_address="Street 1")])[0]
+        order.products.set([cls.lamp, cls.desk])
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    async def test_products_list_and_details(self):
+        response = await AsyncProductsListView.as_view()(self.factory.get("/"))
+        self.assertEqual(response.context_data["products"], [self.lamp])
+
+        view = AsyncProductDetailsView.as_view()
+        response = await view(self.factory.get("/"), pk=self.desk.pk)
+        self.assertEqual(response.context_data["product"], self.desk)
+        with self.assertRaises(Http404):
+            await view(self.factory.get("/"), pk=0)
+
+    async def test_exports_match_sync_views(self):
+        sync_factory = RequestFactory()
+        cases = [
+            (AsyncProductsDataExportView, ProductsDataExportView, {}),
+            (AsyncUserOrdersExportView, UserOrdersExportView, {"user_id": self.user.pk}),
+        ]
+        for async_view, sync_view, kwargs in cases:
+            expected = await sync_to_async(sync_view.as_view())(sync_factory.get("/"), **kwargs)
+            # второй раз — из кеша
+            for _ in range(2):
+                response = await async_view.as_view()(self.factory.get("/"), **kwargs)
+                self.assertEqual(json.loads(response.content), json.loads(expected.content))
+        with self.assertRaises(Http404):
+            await AsyncUserOrdersExportView.as_view()(self.factory.get("/"), user_id=0)
+
+    async def test_feed(self):
+        response = await AsyncLatestProductsFeed()(self.factory.get("/", SERVER_NAME="localhost"))
+        content = response.content.decode()
+        self.assertIn("<title>Lamp</title>", content)
+        self.assertNotIn("Desk</title>", content)
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.urls import path, include
 from django.views.decorators.cache import cache_page
 
@@ -27,6 +28,16 @@ from .api import (
     ProductViewSet,
     OrderViewSet,)
 
+if settings.ASYNC_VIEWS:
+    # под ASGI страницы на чтение обслуживают асинхронные версии
+    from .async_views import (
+        AsyncLatestProductsFeed as LatestProductsFeed,
+        AsyncProductDetailsView as ProductDetailsView,
+        AsyncProductsDataExportView as ProductsDataExportView,
+        AsyncProductsListView as ProductsListView,
+        AsyncUserOrdersExportView as UserOrdersExportView,
+    )
+
 app_name = 'shopapp'
 
 routers = DefaultRouter()
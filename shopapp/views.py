@@ -1,26 +1,40 @@
-import csv
 import logging
 
 from timeit import default_timer
 
+from django.contrib import messages
 from django.contrib.auth.models import Group, User
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.decorators import permission_required
 from django.contrib.syndication.views import Feed
+from django.db import router
 
 from django.utils.decorators import method_decorator
-from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.urls import reverse_lazy, reverse
-from django.core.cache import cache
 
 from django.views import View
 from django.views.decorators.cache import cache_page
 from django.views.generic import TemplateView, ListView, DetailView, CreateView, UpdateView, DeleteView
 
+from jobsapp.models import Job
+from jobsapp.views import job_to_dict
+from mysite.query_optimization import optimize_queryset
+
+from .caching import (
+    EXPORT_CACHE_TIMEOUT,
+    ORDERS_TAG,
+    PRODUCTS_TAG,
+    get_or_compute,
+    tagged_key,
+    user_orders_tag,
+)
+from .common import stream_csv
+from .images import attach_product_images
 from .forms import ProductForm, OrderForm, GroupForm
-from .models import Product, Order, ProductImage
+from .models import Product, Order
 from .serializers import OrderSerializer
 
 
@@ -43,7 +57,7 @@ class ShopIndexView(View):
         }
         log.debug('Products for shop index: %s', products)
         log.info('Rendering shop index')
-        print("shop index context", context)
+        log.debug('Shop index context: %s', context)
         return render(request, 'shopapp/shop-index.html', context=context)
 
 
@@ -83,7 +97,18 @@ class ProductsListView(ListView):
     queryset = Product.objects.filter(archived=False)
 
 
-class ProductCreateView(UserPassesTestMixin, CreateView):
+class ProductImagesUploadMixin:
+    """
+    Прикрепляет к self.object картинки из поля ``images`` одной пачкой
+    """
+
+    def attach_images(self):
+        report = attach_product_images(self.object, self.request.FILES.getlist('images'))
+        for filename, error in report.errors:
+            messages.warning(self.request, f'{filename}: {error}')
+
+
+class ProductCreateView(ProductImagesUploadMixin, UserPassesTestMixin, CreateView):
     model = Product
     form_class = ProductForm
     template_name = 'shopapp/product_form.html'
@@ -100,12 +125,11 @@ class ProductCreateView(UserPassesTestMixin, CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        for image in self.request.FILES.getlist('images'):
-            ProductImage.objects.create(product=self.object, image=image)
+        self.attach_images()
         return response
 
 
-class ProductUpdateView(PermissionRequiredMixin, UserPassesTestMixin, UpdateView):
+class ProductUpdateView(ProductImagesUploadMixin, PermissionRequiredMixin, UserPassesTestMixin, UpdateView):
     model = Product
     # fields = 'name', 'price', 'description', 'discount', 'preview'
     form_class = ProductForm
@@ -120,8 +144,7 @@ class ProductUpdateView(PermissionRequiredMixin, UserPassesTestMixin, UpdateView
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        for image in self.request.FILES.getlist('images'):
-            ProductImage.objects.create(product=self.object, image=image)
+        self.attach_images()
         return response
 
 
@@ -203,41 +226,74 @@ class OrderDeleteView(DeleteView):
     success_url = reverse_lazy('shopapp:orders_list')
 
 
-class OrdersExportView(View):
-    def get(self, request, *args, **kwargs):
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="orders.csv"'
+class ExportDatabaseMixin:
+    """
+    Из какой базы читает выгрузка. ``None`` — как решит роутер (реплика,
+    если клиент только что ничего не записывал), ``as_view(using="default")``
+    — всегда основная база.
+    """
+    using = None
+
+    def get_using(self, model) -> str:
+        # база выбирается сразу: потоковый ответ читает уже после middleware
+        return self.using or router.db_for_read(model)
 
-        writer = csv.writer(response)
-        writer.writerow(['ID', 'User', 'Created At'])
 
-        for order in Order.objects.all():
-            writer.writerow([order.id, order.user.username, order.created_at])
+class OrdersExportView(ExportDatabaseMixin, View):
+    """
+    Потоковый экспорт заказов в CSV.
+
+    Заказы читаются одним запросом (вместе с username) через iterator(),
+    поэтому память не растёт с числом строк. ``?gzip=1`` сжимает ответ на лету,
+    ``?async=1`` ставит выгрузку в фоновую очередь и сразу отдаёт ссылку на задачу.
+    """
+    chunk_size = 2000
 
+    def get(self, request, *args, **kwargs):
+        compress = request.GET.get('gzip') == '1'
+        if request.GET.get('async') == '1':
+            job = Job.objects.enqueue(
+                'shopapp.export_orders_csv',
+                payload={'gzip': compress},
+                user=request.user,
+            )
+            return JsonResponse(job_to_dict(job), status=202, headers={'Location': job.get_absolute_url()})
+        orders = (
+            Order.objects
+            .using(self.get_using(Order))
+            .order_by('pk')
+            .values_list('pk', 'user__username', 'created_at')
+            .iterator(chunk_size=self.chunk_size)
+        )
+        response = StreamingHttpResponse(
+            stream_csv(['ID', 'User', 'Created At'], orders, compress=compress),
+            content_type='application/gzip' if compress else 'text/csv',
+        )
+        filename = 'orders.csv.gz' if compress else 'orders.csv'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
         return response
 
 
-class ProductsDataExportView(View):
+class ProductsDataExportView(ExportDatabaseMixin, View):
     def get(self, request: HttpRequest) -> JsonResponse:
-        cache_key = "products_data_export"
-        products_data = cache.get(cache_key)
-        if products_data is None:
-            products = Product.objects.order_by("pk").all()
-            products_data = [
-                {
-                    "pk": product.pk,
-                    "name": product.name,
-                    "price": product.price,
-                    "archived": product.archived,
-                }
-                for product in products
-            ]
-            elem = products_data[0]
-            name = elem["name"]
-            print("name:", name)
-            cache.set(cache_key, products_data, 300)
+        cache_key = tagged_key("products_data_export", PRODUCTS_TAG)
+        products_data = get_or_compute(cache_key, self.get_products_data, EXPORT_CACHE_TIMEOUT)
         return JsonResponse({"products": products_data})
 
+    def get_products_data(self) -> list:
+        products = Product.objects.using(self.get_using(Product)).order_by("pk").all()
+        products_data = [
+            {
+                "pk": product.pk,
+                "name": product.name,
+                "price": product.price,
+                "archived": product.archived,
+            }
+            for product in products
+        ]
+        log.debug('Exporting %s products', len(products_data))
+        return products_data
+
 
 class LatestProductsFeed(Feed):
     title = "Shop products (latest)"
@@ -286,33 +342,41 @@ class UserOrdersListView(LoginRequiredMixin, ListView):
         return context
 
 
-class UserOrdersExportView(View):
+class UserOrdersExportView(ExportDatabaseMixin, View):
     """
     Представление для экспорта заказов пользователя в JSON
     с низкоуровневым кешированием.
     """
     def get(self, request: HttpRequest, user_id: int) -> JsonResponse:
-        # 1. Генерируем уникальный ключ кеша
-        cache_key = f"user_orders_export_{user_id}"
-
-        # 2. Пытаемся получить данные из кеша
-        orders_data = cache.get(cache_key)
+        # 1. Генерируем уникальный ключ кеша; он меняется при любом
+        # изменении заказов пользователя (см. shopapp.signals)
+        cache_key = tagged_key(
+            f"user_orders_export_{user_id}",
+            ORDERS_TAG,
+            user_orders_tag(user_id),
+        )
 
-        # 3. Если в кеше нет (None), то генерируем данные
-        if orders_data is None:
-            print(f"--- ЗАПРОС К БАЗЕ И ГЕНЕРАЦИЯ КЕША ДЛЯ USER {user_id} ---")
-            # Ищем пользователя, или 404
-            user = get_object_or_404(User, pk=user_id)
+        # 2. Берём данные из кеша; если их нет или они устаревают,
+        # пересчитывает только один воркер, остальные ждут или отдают старое
+        orders_data = get_or_compute(
+            cache_key,
+            lambda: self.get_orders_data(user_id),
+            EXPORT_CACHE_TIMEOUT,
+        )
 
-            # Загружаем заказы, сортируем по PK (как в задании)
-            orders = Order.objects.filter(user=user).order_by('pk')
+        # 3. Возвращаем данные (из кеша или свежесгенерированные)
+        return JsonResponse({"orders": orders_data})
 
-            # Сериализуем данные
-            serializer = OrderSerializer(orders, many=True)
-            orders_data = serializer.data
+    def get_orders_data(self, user_id: int) -> list:
+        log.debug('Building orders export for user %s', user_id)
+        # Ищем пользователя, или 404
+        using = self.get_using(Order)
+        user = get_object_or_404(User.objects.using(using), pk=user_id)
 
-            # 4. Сохраняем данные в кеш на 3 минуты (180 секунд)
-            cache.set(cache_key, orders_data, 180)
+        # Загружаем заказы, сортируем по PK (как в задании)
+        # Поля для OrderSerializer одним запросом плюс один prefetch товаров
+        orders = optimize_queryset(Order.objects.using(using).filter(user=user).order_by('pk'), OrderSerializer)
 
-        # 5. Возвращаем данные (из кеша или свежесгенерированные)
-        return JsonResponse({"orders": orders_data})
+        # Сериализуем данные
+        serializer = OrderSerializer(orders, many=True)
+        return serializer.data